@@ -1,11 +1,4 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta, date
-from io import BytesIO
-from db_manager import (
-    init_db, cargar_horas, guardar_horas, guardar_asignaciones,
-    cargar_asignaciones, descargar_bd_desde_drive, subir_bd_a_drive
-)
 
 st.set_page_config(  # ← Esto es imprescindible
     page_title="Inicio",  # Título en la pestaña del navegador
@@ -18,10 +11,6 @@ st.set_page_config(  # ← Esto es imprescindible
 # === CONFIGURA TU FILE_ID DE GOOGLE DRIVE AQUÍ ===
 FILE_ID = "1zqAyIB1BLfCc2uH1v29r-clARHoh2o_s"
 
-# Sincronizar base de datos
-descargar_bd_desde_drive(FILE_ID)
-init_db()
-
 st.title("🩺 Planificador de Turnos de Enfermería")
 
 st.markdown("""
@@ -33,8 +22,6 @@ Esta herramienta permite planificar automáticamente los turnos de enfermería p
 """)
 
 
-from PIL import Image  # Opcional para procesamiento adicional
-
 # Ruta a tu imagen (puede ser local o URL)
 imagen_path = "images/Imagen_Bienvenida.png"
 
@@ -45,3 +32,12 @@ st.image(
     use_container_width=False,  # Otra opción para ajuste automático
     output_format="auto" 
 )
+
+# Sincronizar base de datos (una vez por sesión; solo descarga si la copia remota cambió).
+# Va al final: la portada se dibuja sin esperar a importar db_manager (y pandas)
+# ni a la comprobación de la copia remota
+if "bd_sincronizada" not in st.session_state:
+    from db_manager import preparar_bd
+    with st.spinner("Sincronizando la base de datos..."):
+        preparar_bd(FILE_ID)
+    st.session_state["bd_sincronizada"] = True
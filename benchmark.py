@@ -0,0 +1,359 @@
+"""
+Banco de pruebas de rendimiento del asignador.
+
+Genera plantillas y demandas sintéticas de tamaño hospitalario, ejecuta el
+flujo completo de la aplicación (parseo, asignación, resumen mensual,
+exportación a Excel y CSV y guardado en SQLite) y mide el tiempo y la
+memoria pico de cada fase; la asignación se desglosa con las fases que mide
+el propio motor (filtrado de candidatas, comprobación de restricciones...). El resultado es una tabla CSV (o JSON) con
+una fila por escenario y fase, pensada para comparar versiones.
+
+Con --arranque mide en cambio el arranque en frío de cada página (un
+intérprete nuevo por medición: importaciones y primera ejecución completa
+del script) y termina con código 1 si alguna supera su presupuesto.
+Lo mismo con la asignación de cada escenario frente a PRESUPUESTO_ASIGNACION
+del modo (o --presupuesto).
+
+Ejemplos:
+    python benchmark.py --enfermeras 1000 5000 --unidades 24 --meses 1 12 --salida bench.csv
+    python benchmark.py --modo flujo --enfermeras 2000 --meses 1
+    python benchmark.py --arranque
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from flujo_asignacion import asignar_turnos_flujo
+from motor_asignacion import (
+    COLUMNAS_ASIGNACION, Diagnostico, asignar_turnos, asignar_turnos_paralelo, calcular_limites,
+    calcular_resumen_mensual
+)
+from utils.demanda import DIAS_SEMANA, TURNOS, construir_demanda
+from utils.excel_utils import a_csv, a_excel
+from utils.fechas import parse_dates_columna
+
+REPARTO_TURNOS = [0.40, 0.35, 0.25]
+MODOS = {"voraz": asignar_turnos, "paralelo": asignar_turnos_paralelo, "flujo": asignar_turnos_flujo}
+# Fases del `Diagnostico` del motor con el nombre que llevan en los resultados;
+# las que no están aquí (procesos, propuesta_flujo...) conservan el suyo
+FASES_MOTOR = {
+    "indice_candidatas": "filtrado_candidatas",
+    "disponibilidad": "filtrado_candidatas",
+    "asignacion": "comprobacion_restricciones",  # bucle día a día: restricciones y selección
+}
+
+# Presupuesto de la llamada al motor por modo (segundos, fase "asignacion").
+# Medido en un contenedor de 1 CPU con 2000 profesionales y 12 unidades:
+# voraz 0.4 s (1 mes), 0.9 s (3 meses) y 3.1 s (12 meses); flujo 2.6 s,
+# 18 s y 7 min. El flujo solo cabe en planes de hasta un mes o poco más: su
+# presupuesto es el de una espera razonable en la página del Asignador.
+PRESUPUESTO_ASIGNACION = {"voraz": 10.0, "paralelo": 10.0, "flujo": 20.0}
+
+RAIZ = Path(__file__).parent
+# Presupuesto de arranque en frío por página (segundos hasta terminar la
+# primera ejecución del script, sin contar el arranque de Streamlit). Peor
+# mediana medida con --arranque en 4 ejecuciones en un contenedor de 1 CPU:
+# app 0.87 s, Asignador 0.77 s, Generador 0.67 s, Informe 0.81 s; el
+# presupuesto deja ~50 % de margen para el ruido de la máquina.
+# Lo comprueba tests/test_arranque.py.
+PRESUPUESTO_ARRANQUE = {
+    "app.py": 1.3,
+    "pages/1_📋Asignador.py": 1.2,
+    "pages/2_🗓️Generador_Demanda.py": 1.0,
+    "pages/3_📊Informe.py": 1.2,
+}
+# Se ejecuta en un intérprete nuevo: argv[1] es la página. Cada ejecución de
+# AppTest arranca un runtime de Streamlit (con su búsqueda de componentes),
+# igual para todas las páginas: se mide con un script vacío y se descuenta
+_PRIMER_RENDER = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+AppTest.from_string("import streamlit as st").run()
+t0 = time.perf_counter()
+AppTest.from_string("import streamlit as st").run()
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+t2 = time.perf_counter()
+print(json.dumps({"arranque_streamlit": t1 - t0, "primer_render": max(0.0, (t2 - t1) - (t1 - t0)),
+                  "excepciones": [str(e.value) for e in at.exception]}))
+"""
+
+
+def generar_plantilla_sintetica(n_enfermeras, n_unidades, inicio, dias, ausencias_por_enfermera=6,
+                                proporcion_parcial=0.3, semilla=0):
+    """
+    Plantilla con el mismo formato que el Excel de entrada. Las fechas de no
+    disponibilidad mezclan días sueltos y rangos `dd/mm/AAAA-dd/mm/AAAA`, y un
+    10 % de las profesionales comparten el mismo cierre de equipo.
+    """
+    rng = np.random.default_rng(semilla)
+    unidades = [f"Unidad {k + 1:02d}" for k in range(n_unidades)]
+    cierre = inicio + timedelta(days=int(rng.integers(0, dias)))
+    cierre_txt = f"{cierre:%d/%m/%Y}-{cierre + timedelta(days=6):%d/%m/%Y}"
+
+    fechas_no_disp = []
+    for _ in range(n_enfermeras):
+        if rng.random() < 0.1:
+            fechas_no_disp.append(cierre_txt)
+            continue
+        partes = []
+        for _ in range(int(rng.poisson(ausencias_por_enfermera))):
+            d = inicio + timedelta(days=int(rng.integers(0, dias)))
+            if rng.random() < 0.3:
+                fin = d + timedelta(days=int(rng.integers(1, 15)))
+                partes.append(f"{d:%d/%m/%Y}-{fin:%d/%m/%Y}")
+            else:
+                partes.append(f"{d:%d/%m/%Y}")
+        fechas_no_disp.append(", ".join(partes) if partes else np.nan)
+
+    return pd.DataFrame({
+        "ID": [f"E{k:05d}" for k in range(n_enfermeras)],
+        "Unidad_Asignada": rng.choice(unidades, size=n_enfermeras),
+        "Jornada": np.where(rng.random(n_enfermeras) < proporcion_parcial, "Parcial", "Completa"),
+        "Turno_Contrato": rng.choice(TURNOS, size=n_enfermeras, p=REPARTO_TURNOS),
+        "Fechas_No_Disponibilidad": fechas_no_disp,
+    })
+
+
+def generar_demanda_sintetica(staff, inicio, dias, ocupacion=0.55, semilla=0):
+    """
+    Demanda diaria por unidad y turno proporcional a la plantilla de cada
+    grupo (`ocupacion` ≈ fracción del año que trabaja cada profesional),
+    con fines de semana al 60 % y ruido de Poisson alrededor de esa media.
+    """
+    rng = np.random.default_rng(semilla)
+    tamanos = staff.groupby(["Unidad_Asignada", "Turno_Contrato"]).size().unstack(fill_value=0)
+    factor = np.array([1.0] * 5 + [0.6] * 2)[:, None]
+    plantillas = {
+        unidad: pd.DataFrame(np.rint(fila.to_numpy() * ocupacion * factor), index=DIAS_SEMANA, columns=fila.index)
+        for unidad, fila in tamanos.iterrows()
+    }
+    demanda = construir_demanda(plantillas, inicio, inicio + timedelta(days=dias - 1), turnos=TURNOS)
+    demanda["Personal_Requerido"] = rng.poisson(demanda["Personal_Requerido"]).astype(np.int32)
+    return demanda
+
+
+class Medidor:
+    """Cronometra fases y, si se pide, registra la memoria pico de cada una."""
+
+    def __init__(self, memoria=True):
+        self.memoria = memoria
+        self.filas = []
+
+    @contextlib.contextmanager
+    def fase(self, nombre):
+        if self.memoria:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - t0
+            pico = None
+            if self.memoria:
+                pico = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+            self.filas.append({"fase": nombre, "segundos": round(segundos, 4),
+                               "memoria_pico_mb": None if pico is None else round(pico, 2)})
+
+    def anotar(self, fases):
+        """Añade tiempos medidos por otro (p. ej. `Diagnostico.fases`), sin memoria pico."""
+        for nombre, segundos in fases.items():
+            self.filas.append({"fase": nombre, "segundos": round(segundos, 4), "memoria_pico_mb": None})
+
+
+def ejecutar_escenario(n_enfermeras, n_unidades, meses, modo="voraz", memoria=True, exportar=True,
+                       guardar=True, semilla=0, presupuesto=None):
+    """
+    Ejecuta todas las fases para un escenario y devuelve sus filas de
+    resultados. Con `presupuesto` (segundos), la fila de la asignación indica
+    si lo cumple.
+    """
+    inicio = date(2025, 1, 1)
+    dias = (pd.Timestamp(inicio) + pd.DateOffset(months=meses) - pd.Timestamp(inicio)).days
+    staff = generar_plantilla_sintetica(n_enfermeras, n_unidades, inicio, dias, semilla=semilla)
+    demand = generar_demanda_sintetica(staff, inicio, dias, semilla=semilla)
+    medidor = Medidor(memoria=memoria)
+
+    with medidor.fase("parseo"):
+        staff["Fechas_No_Disponibilidad"], _ = parse_dates_columna(staff["Fechas_No_Disponibilidad"])
+        staff_max_hours, staff_max_jornadas, _ = calcular_limites(staff)
+
+    # "asignacion" es la llamada completa al motor (tiempo y memoria pico); el
+    # desglose sale de las fases que mide el propio motor. En paralelo, las
+    # fases de cada proceso se suman y pueden superar el tiempo de reloj
+    diagnostico = Diagnostico()
+    with medidor.fase("asignacion"):
+        assignments, uncovered = MODOS[modo](staff, demand, staff_max_hours, staff_max_jornadas,
+                                             diagnostico=diagnostico)
+    fases_motor = {}
+    for nombre, segundos in diagnostico.fases.items():
+        nombre = FASES_MOTOR.get(nombre, nombre)
+        fases_motor[nombre] = fases_motor.get(nombre, 0.0) + segundos
+    if presupuesto is not None:
+        fila = medidor.filas[-1]
+        fila.update(presupuesto=presupuesto, dentro_presupuesto=fila["segundos"] <= presupuesto)
+    medidor.anotar(fases_motor)
+
+    with medidor.fase("resumen_mensual"):
+        df_assign = pd.DataFrame(assignments, columns=COLUMNAS_ASIGNACION)
+        resumen = calcular_resumen_mensual(df_assign)
+
+    if exportar:
+        planilla = df_assign.assign(Fecha=lambda x: pd.to_datetime(x["Fecha"]).dt.strftime("%d/%m/%Y"))
+        with medidor.fase("exportacion_excel"):
+            a_excel(planilla)
+            a_excel(resumen)
+        with medidor.fase("exportacion_csv"):
+            a_csv(planilla)
+            a_csv(resumen)
+
+    if guardar:
+        import db_manager
+        with tempfile.TemporaryDirectory() as tmp:
+            db_manager.DB_PATH = Path(tmp) / "turnos.db"
+            db_manager.init_db()
+            with medidor.fase("guardado_sqlite"), contextlib.redirect_stdout(io.StringIO()):
+                db_manager.guardar_aprobacion(df_assign)
+            db_manager.cerrar_conexiones()
+
+    demandados = int(demand["Personal_Requerido"].sum())
+    comun = {
+        "version": version_codigo(),
+        "modo": modo,
+        "enfermeras": n_enfermeras,
+        "unidades": n_unidades,
+        "meses": meses,
+        "filas_demanda": len(demand),
+        "turnos_demandados": demandados,
+        "turnos_cubiertos": len(assignments),
+    }
+    return [{**comun, **fila} for fila in medidor.filas]
+
+
+def medir_arranque(pagina, directorio, entorno):
+    """Arranque en frío de `pagina` en un proceso nuevo: tiempos y excepciones del primer render."""
+    proceso = subprocess.run([sys.executable, "-c", _PRIMER_RENDER, str(RAIZ / pagina)], cwd=directorio,
+                             env=entorno, capture_output=True, text=True, encoding="utf-8")
+    if proceso.returncode != 0:
+        return {"arranque_streamlit": None, "primer_render": None,
+                "excepciones": [proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else "error"]}
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def comprobar_arranque(repeticiones=3, presupuestos=PRESUPUESTO_ARRANQUE):
+    """
+    Mide cada página `repeticiones` veces en frío y compara la mediana con su
+    presupuesto. Se ejecuta en un directorio temporal con una base de datos
+    ya inicializada y la copia remota apuntando a un directorio local vacío
+    (sin red), como tras reiniciar el contenedor.
+    """
+    filas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "images").symlink_to(RAIZ / "images", target_is_directory=True)
+        (tmp / "remota").mkdir()
+        entorno = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(RAIZ), os.environ.get("PYTHONPATH")])),
+                   "TURNOS_ORIGEN_BD": str(tmp / "remota")}
+        subprocess.run([sys.executable, "-c", "import db_manager; db_manager.init_db()"], cwd=tmp, env=entorno,
+                       check=True, capture_output=True)
+        for pagina, presupuesto in presupuestos.items():
+            medidas = [medir_arranque(pagina, tmp, entorno) for _ in range(repeticiones)]
+            excepciones = sorted({e for m in medidas for e in m["excepciones"]})
+            render = [m["primer_render"] for m in medidas if m["primer_render"] is not None]
+            segundos = statistics.median(render) if render else None
+            filas.append({
+                "version": version_codigo(),
+                "fase": "arranque",
+                "pagina": pagina,
+                "segundos": None if segundos is None else round(segundos, 4),
+                "arranque_streamlit": round(statistics.median(
+                    m["arranque_streamlit"] for m in medidas if m["arranque_streamlit"] is not None), 4)
+                    if render else None,
+                "presupuesto": presupuesto,
+                "dentro_presupuesto": segundos is not None and segundos <= presupuesto and not excepciones,
+                "excepciones": "; ".join(excepciones),
+            })
+    return filas
+
+
+def version_codigo():
+    """Commit actual (si es un repositorio git) para distinguir resultados entre versiones."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except Exception:
+        return "desconocida"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--enfermeras", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--unidades", type=int, nargs="+", default=[12])
+    parser.add_argument("--meses", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--modo", choices=sorted(MODOS), default="voraz")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--presupuesto", type=float,
+                        help="Segundos máximos de la asignación por escenario (por defecto, "
+                             "PRESUPUESTO_ASIGNACION del modo); código de salida 1 si alguno lo supera")
+    parser.add_argument("--sin-memoria", action="store_true",
+                        help="No medir memoria pico (tracemalloc ralentiza las fases)")
+    parser.add_argument("--sin-exportar", action="store_true", help="Omitir la fase de exportación a Excel")
+    parser.add_argument("--sin-guardar", action="store_true", help="Omitir la fase de guardado en SQLite")
+    parser.add_argument("--formato", choices=["csv", "json"], default="csv")
+    parser.add_argument("--salida", type=Path, help="Fichero de resultados (por defecto, salida estándar)")
+    parser.add_argument("--arranque", action="store_true",
+                        help="Medir el arranque en frío de cada página frente a PRESUPUESTO_ARRANQUE "
+                             "(código de salida 1 si alguna lo supera)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Mediciones por página con --arranque")
+    args = parser.parse_args(argv)
+
+    filas = []
+    if args.arranque:
+        filas = comprobar_arranque(args.repeticiones)
+        for fila in filas:
+            marca = "✔" if fila["dentro_presupuesto"] else "✘"
+            print(f"{marca} {fila['pagina']}: {fila['segundos']} s (presupuesto {fila['presupuesto']} s)"
+                  + (f" · {fila['excepciones']}" if fila["excepciones"] else ""), file=sys.stderr)
+    else:
+        for n in args.enfermeras:
+            for u in args.unidades:
+                for m in args.meses:
+                    escenario = ejecutar_escenario(
+                        n, u, m, modo=args.modo, memoria=not args.sin_memoria, exportar=not args.sin_exportar,
+                        guardar=not args.sin_guardar, semilla=args.semilla,
+                        presupuesto=args.presupuesto or PRESUPUESTO_ASIGNACION[args.modo])
+                    asignacion = next(f for f in escenario if f["fase"] == "asignacion")
+                    marca = "✔" if asignacion["dentro_presupuesto"] else "✘"
+                    print(f"{marca} {n} enfermeras, {u} unidades, {m} meses: asignación en {asignacion['segundos']} s "
+                          f"(presupuesto {asignacion['presupuesto']} s)", file=sys.stderr)
+                    filas += escenario
+
+    resultados = pd.DataFrame(filas)
+    if args.formato == "json":
+        texto = "\n".join(json.dumps(f, ensure_ascii=False) for f in filas) + "\n"
+    else:
+        texto = resultados.to_csv(index=False)
+    if args.salida:
+        args.salida.write_text(texto, encoding="utf-8")
+    else:
+        sys.stdout.write(texto)
+    return 0 if all(fila.get("dentro_presupuesto", True) for fila in filas) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Asignación de turnos por línea de comandos, sin la interfaz de Streamlit.
+
+Cada par plantilla de personal + demanda (Excel, CSV o Parquet) se resuelve
+con el motor de asignación y se escriben la planilla asignada, el resumen
+por profesional y los turnos sin cubrir en el directorio de salida. Con
+--guardar, cada planificación parte de lo ya aprobado en la base de datos
+y se aprueba en ella al terminar, igual que el botón «Aprobar» de la
+aplicación. Pensado para replanificaciones nocturnas de todas las unidades.
+
+Ejemplos:
+    python cli.py --plantilla planilla.xlsx --demanda uci.xlsx urgencias.csv --salida planes/
+    python cli.py --par planilla_uci.xlsx uci.parquet --par planilla_urg.xlsx urg.csv --guardar --formato csv
+"""
+import argparse
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from flujo_asignacion import asignar_turnos_flujo
+from motor_asignacion import COLUMNAS_ASIGNACION, asignar_por_meses, asignar_turnos, asignar_turnos_paralelo, \
+    calcular_resumen_mensual
+from utils.excel_utils import FORMATOS, exportar, nombre_archivo
+from utils.plantilla import COLUMNAS_DEMANDA, leer_tabla, preparar_plantilla
+
+MODOS = {"voraz": asignar_turnos, "paralelo": asignar_turnos_paralelo, "flujo": asignar_turnos_flujo}
+# Formato de exportación (clave de FORMATOS) por extensión
+EXTENSIONES = {extension: formato for formato, (extension, _) in FORMATOS.items()}
+
+
+class ErrorEntrada(Exception):
+    """Plantilla o demanda que no se puede planificar."""
+
+
+def _avisar(mensaje):
+    print(mensaje, file=sys.stderr)
+
+
+def cargar_entrada(ruta_plantilla, ruta_demanda):
+    """Plantilla preparada (con sus límites) y demanda validada de un par de archivos."""
+    staff, staff_max_hours, staff_max_jornadas, avisos, avisos_limites = preparar_plantilla(
+        leer_tabla(ruta_plantilla))
+    for tipo, mensaje in avisos:
+        if tipo == "error":
+            raise ErrorEntrada(f"{ruta_plantilla}: {mensaje}")
+        _avisar(f"⚠️ {ruta_plantilla}: {mensaje}")
+    for aviso in avisos_limites:
+        _avisar(f"⚠️ {ruta_plantilla}: {aviso}")
+
+    demand = leer_tabla(ruta_demanda)
+    faltan = [col for col in COLUMNAS_DEMANDA if col not in demand.columns]
+    if faltan:
+        raise ErrorEntrada(f"{ruta_demanda}: faltan columnas requeridas: {', '.join(faltan)}")
+    if demand.empty:
+        raise ErrorEntrada(f"{ruta_demanda}: la demanda está vacía")
+    # Fecha como texto 'YYYY-MM-DD', venga de Excel (fecha) o de CSV (texto)
+    demand["Fecha"] = pd.to_datetime(demand["Fecha"]).dt.strftime("%Y-%m-%d")
+    return staff, staff_max_hours, staff_max_jornadas, demand
+
+
+def planificar(staff, demand, staff_max_hours, staff_max_jornadas, modo="paralelo", por_meses=False,
+               estado_previo=None):
+    """(asignaciones, sin cubrir) como DataFrames; por meses, cada mes parte del estado del anterior."""
+    if por_meses:
+        assignments, uncovered = [], []
+        for _, asignadas, sin_cubrir in asignar_por_meses(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                          asignar=MODOS[modo], estado_previo=estado_previo):
+            assignments += asignadas
+            uncovered += sin_cubrir
+    else:
+        assignments, uncovered = MODOS[modo](staff, demand, staff_max_hours, staff_max_jornadas,
+                                             estado_previo=estado_previo)
+    return pd.DataFrame(assignments, columns=COLUMNAS_ASIGNACION), pd.DataFrame(uncovered)
+
+
+def escribir_resultados(df_assign, df_uncov, salida, base, formatos):
+    """Planilla, resumen y sin cubrir de una planificación en cada formato; devuelve las rutas escritas."""
+    salida.mkdir(parents=True, exist_ok=True)
+    tablas = {
+        "Turnos_Asignados": df_assign.assign(
+            Fecha=pd.to_datetime(df_assign["Fecha"]).dt.strftime("%d/%m/%Y")),
+        "Resumen": calcular_resumen_mensual(df_assign),
+    }
+    if not df_uncov.empty:
+        tablas["Turnos_Descubiertos"] = df_uncov
+    rutas = []
+    for formato in formatos:
+        for prefijo, tabla in tablas.items():
+            ruta = salida / nombre_archivo(f"{prefijo}_{base}", formato)
+            ruta.write_bytes(exportar(tabla, formato))
+            rutas.append(ruta)
+    return rutas
+
+
+def nombres_salida(rutas_demanda):
+    """
+    Base del nombre de los resultados de cada demanda: su nombre sin
+    extensión. Si dos coinciden (la misma demanda en carpetas distintas, o
+    en .csv y .xlsx) se antepone la carpeta y, si aún coinciden, se añade el
+    número de par, para que ningún par sobrescriba los archivos de otro.
+    """
+    bases = [Path(ruta).stem for ruta in rutas_demanda]
+    repetidas = Counter(bases)
+    bases = [f"{Path(ruta).resolve().parent.name}_{base}" if repetidas[base] > 1 else base
+             for ruta, base in zip(rutas_demanda, bases)]
+    repetidas = Counter(bases)
+    return [f"{base}_{k}" if repetidas[base] > 1 else base for k, base in enumerate(bases, start=1)]
+
+
+def procesar_par(ruta_plantilla, ruta_demanda, base, args):
+    """
+    Planifica un par plantilla + demanda, escribe sus resultados con el nombre
+    `base` y, si se pide, lo aprueba en la base de datos.
+    """
+    staff, staff_max_hours, staff_max_jornadas, demand = cargar_entrada(ruta_plantilla, ruta_demanda)
+    fechas = pd.to_datetime(demand["Fecha"])
+    periodo = (fechas.min(), fechas.max())
+    unidades = demand["Unidad"].dropna().astype(str).unique().tolist()
+
+    estado_previo = None
+    if args.guardar:
+        # Solo se carga db_manager (y sus dependencias) si se usa la base de datos
+        import db_manager
+        estado_previo = db_manager.cargar_estado_previo(*periodo, unidades)
+
+    df_assign, df_uncov = planificar(staff, demand, staff_max_hours, staff_max_jornadas, modo=args.modo,
+                                     por_meses=args.por_meses, estado_previo=estado_previo)
+    rutas = escribir_resultados(df_assign, df_uncov, args.salida, base, [EXTENSIONES[f] for f in args.formato])
+    if args.guardar:
+        db_manager.guardar_aprobacion(df_assign[["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]],
+                                      periodo, unidades)
+
+    demandados = int(demand["Personal_Requerido"].sum())
+    cobertura = len(df_assign) / demandados if demandados else 1.0
+    _avisar(f"✔ {ruta_demanda}: {len(df_assign)}/{demandados} turnos cubiertos ({cobertura:.1%}), "
+            f"{len(rutas)} archivos en {args.salida}" + (", aprobado en la base de datos" if args.guardar else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plantilla", type=Path, help="Plantilla de personal para todas las demandas de --demanda")
+    parser.add_argument("--demanda", type=Path, nargs="+", default=[], help="Demandas que usan --plantilla")
+    parser.add_argument("--par", type=Path, nargs=2, action="append", default=[], metavar=("PLANTILLA", "DEMANDA"),
+                        help="Par plantilla + demanda; se puede repetir")
+    parser.add_argument("--modo", choices=sorted(MODOS), default="paralelo",
+                        help="Motor de asignación (paralelo = voraz con un proceso por grupo de unidades; flujo "
+                             "solo para planes pequeños, de hasta un mes: con más meses tarda minutos)")
+    parser.add_argument("--por-meses", action="store_true",
+                        help="Resolver el rango mes a mes arrastrando horas, jornadas y rachas")
+    parser.add_argument("--salida", type=Path, default=Path("."), help="Directorio de resultados")
+    parser.add_argument("--formato", choices=sorted(EXTENSIONES), nargs="+", default=["xlsx"])
+    parser.add_argument("--guardar", action="store_true",
+                        help="Partir de lo aprobado en la base de datos y aprobar cada planificación en ella")
+    parser.add_argument("--bd", type=Path, help="Base de datos SQLite a usar con --guardar (por defecto, turnos.db)")
+    args = parser.parse_args(argv)
+
+    if args.demanda and args.plantilla is None:
+        parser.error("--demanda necesita --plantilla")
+    pares = [(args.plantilla, demanda) for demanda in args.demanda] + [tuple(par) for par in args.par]
+    if not pares:
+        parser.error("indica al menos una demanda (--plantilla y --demanda, o --par)")
+
+    if args.guardar:
+        import db_manager
+        if args.bd is not None:
+            db_manager.DB_PATH = args.bd
+        db_manager.init_db()
+
+    # Los pares se procesan en orden: con --guardar, cada uno ve lo aprobado por los anteriores
+    fallidos = 0
+    for (ruta_plantilla, ruta_demanda), base in zip(pares, nombres_salida([demanda for _, demanda in pares])):
+        try:
+            procesar_par(ruta_plantilla, ruta_demanda, base, args)
+        except ErrorEntrada as e:
+            fallidos += 1
+            _avisar(f"❌ {e}")
+        except (OSError, ValueError) as e:
+            fallidos += 1
+            _avisar(f"❌ {ruta_demanda}: {e}")
+    return 1 if fallidos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
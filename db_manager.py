@@ -1,122 +1,845 @@
+import functools
+import hashlib
+import json
+import os
 import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 import pandas as pd
-import gdown
-import shutil
 from pathlib import Path
 
+from motor_asignacion import BASE_MAX_HOURS, FACTOR_PARCIAL, HORAS_POR_DEFECTO, LIMITE_CONSECUTIVOS
+
 DB_PATH = Path("turnos.db")
 
 # === Sincronización con Google Drive ===
-def descargar_bd_desde_drive(file_id):
-    url = f"https://drive.google.com/uc?id={file_id}"
-    output = str(DB_PATH)
+# La copia remota solo se descarga si ha cambiado respecto al manifiesto de la
+# última sincronización, como mucho una vez cada SYNC_TTL segundos por proceso,
+# y nunca encima de una base local con escrituras posteriores a esa sincronización.
+# Las escrituras locales se detectan con el contador de `metadatos`, no con el
+# tamaño o la fecha del archivo, que cambian también al pasar a WAL o al crear
+# las tablas nuevas con `init_db`.
+SYNC_TTL = 15 * 60
+ENV_ORIGEN_BD = "TURNOS_ORIGEN_BD"
+_ultima_comprobacion = {}
+_sync_lock = threading.Lock()
+
+
+class OrigenDrive:
+    """Copia remota en Google Drive, descargada con gdown."""
+
+    def __init__(self, file_id):
+        self.file_id = file_id
+        self.clave = f"drive:{file_id}"
+        self.url = f"https://drive.google.com/uc?id={file_id}"
+
+    def metadatos(self):
+        # Cabeceras HTTP de la descarga; None si Drive no las da o no hay red
+        try:
+            import requests
+            r = requests.head(self.url, allow_redirects=True, timeout=10)
+            r.raise_for_status()
+        except Exception:
+            return None
+        meta = {k: r.headers.get(h) for k, h in (
+            ("tamano", "Content-Length"), ("etag", "ETag"), ("modificado", "Last-Modified"))}
+        return meta if any(meta.values()) else None
+
+    def descargar(self, destino):
+        import gdown  # solo hace falta (y tarda en importarse) cuando hay que descargar
+        gdown.download(self.url, str(destino), quiet=True)
+
+
+class OrigenDirectorio:
+    """Copia remota en un directorio local o de red (pruebas y trabajo sin conexión)."""
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.clave = f"dir:{self.ruta.resolve()}"
+
+    def metadatos(self):
+        if not self.ruta.exists():
+            return None
+        st_remoto = self.ruta.stat()
+        return {"tamano": st_remoto.st_size, "mtime_ns": st_remoto.st_mtime_ns}
+
+    def descargar(self, destino):
+        import shutil
+        shutil.copy2(self.ruta, destino)
+
+
+def origen_por_defecto(file_id):
+    """Drive, salvo que la variable TURNOS_ORIGEN_BD apunte a un directorio con la copia remota."""
+    directorio = os.environ.get(ENV_ORIGEN_BD)
+    if directorio:
+        return OrigenDirectorio(Path(directorio) / DB_PATH.name)
+    return OrigenDrive(file_id)
+
+
+def _ruta_manifiesto():
+    return DB_PATH.with_name(DB_PATH.name + ".sync.json")
+
+
+def _huella_local(ruta, con_md5=True):
+    st_local = ruta.stat()
+    huella = {"tamano": st_local.st_size, "mtime_ns": st_local.st_mtime_ns}
+    if con_md5:
+        md5 = hashlib.md5()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                md5.update(bloque)
+        huella["md5"] = md5.hexdigest()
+    return huella
+
+
+def _contador_escrituras():
+    """Contador de escrituras de `metadatos` en DB_PATH; 0 en bases anteriores sin esa tabla."""
     try:
-        gdown.download(url, output, quiet=False)
-        print("📥 Base de datos descargada desde Google Drive")
-    except Exception as e:
-        print("❌ No se pudo descargar la base de datos:", e)
+        fila = obtener_conexion().execute("SELECT Valor FROM metadatos WHERE Clave = 'version'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return fila[0] if fila else 0
+
+
+def _local_modificada(guardada):
+    """¿Hay escrituras locales posteriores a la sincronización que dejó `guardada` en el manifiesto?"""
+    if "version" in guardada:
+        return _contador_escrituras() != guardada["version"]
+    # Manifiestos anteriores, sin contador: se compara la huella del archivo.
+    # El WAL se vuelca con la conexión de este hilo; las de otros hilos siguen abiertas
+    obtener_conexion().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    local = _huella_local(DB_PATH, con_md5=False)
+    return local != {k: guardada.get(k) for k in local}
+
+
+def sincronizar_bd(origen, ttl=SYNC_TTL, forzar=False):
+    """
+    Trae la base de datos desde `origen` solo si hace falta. Devuelve el
+    resultado: 'reciente' (comprobada hace menos de `ttl`), 'actualizada',
+    'descargada', 'local_modificada' (hay escrituras locales sin sincronizar
+    y no se sobrescriben), 'ocupada' (hay trabajo en curso sobre la base, ver
+    `uso_bd`; se reintenta en la siguiente llamada) o 'error'.
+    """
+    with _sync_lock:
+        ahora = time.monotonic()
+        if not forzar and ahora - _ultima_comprobacion.get(origen.clave, -ttl) < ttl:
+            return "reciente"
+        _ultima_comprobacion[origen.clave] = ahora
+
+        ruta_manifiesto = _ruta_manifiesto()
+        try:
+            manifiesto = json.loads(ruta_manifiesto.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifiesto = {}
+
+        if DB_PATH.exists() and manifiesto.get("local"):
+            if _local_modificada(manifiesto["local"]):
+                print("⚠️ La base de datos local tiene cambios sin subir; no se descarga la copia remota")
+                return "local_modificada"
+
+        remoto = origen.metadatos()
+        if DB_PATH.exists() and remoto is not None and remoto == manifiesto.get("remoto"):
+            return "actualizada"
+
+        temporal = DB_PATH.with_name(DB_PATH.name + ".descarga")
+        try:
+            origen.descargar(temporal)
+            nueva = _huella_local(temporal)
+            if DB_PATH.exists() and nueva["md5"] == manifiesto.get("local", {}).get("md5"):
+                # Sin metadatos remotos fiables: mismo contenido, se conserva la local
+                temporal.unlink()
+                resultado = "actualizada"
+            else:
+                with _uso_lock:
+                    if _en_uso:
+                        # No se cierra la conexión de una tarea a medias: se reintenta en la siguiente comprobación
+                        print("⏳ Hay escrituras en curso; la copia remota se descargará más tarde")
+                        temporal.unlink()
+                        del _ultima_comprobacion[origen.clave]
+                        return "ocupada"
+                    cerrar_conexiones()
+                    for sufijo in ("-wal", "-shm"):
+                        DB_PATH.with_name(DB_PATH.name + sufijo).unlink(missing_ok=True)
+                    os.replace(temporal, DB_PATH)
+                print("📥 Base de datos descargada desde el origen remoto")
+                resultado = "descargada"
+        except Exception as e:
+            print("❌ No se pudo descargar la base de datos:", e)
+            temporal.unlink(missing_ok=True)
+            return "error"
+
+        # md5 de la copia descargada (para reconocerla sin metadatos remotos) y
+        # contador de escrituras con el que se compara la base local después
+        manifiesto = {"remoto": remoto, "local": {"md5": nueva["md5"], "version": _contador_escrituras()},
+                      "sincronizado": time.time()}
+        ruta_manifiesto.write_text(json.dumps(manifiesto), encoding="utf-8")
+        return resultado
+
+
+def descargar_bd_desde_drive(file_id):
+    return sincronizar_bd(origen_por_defecto(file_id))
+
+_bd_preparada = set()
+
+def preparar_bd(file_id):
+    """
+    Arranque de la base de datos para las páginas: sincroniza con la copia
+    remota y crea las tablas que falten. `init_db` solo se ejecuta la primera
+    vez en el proceso para cada DB_PATH (o si la sincronización trae un
+    archivo nuevo), no en cada rerun ni en cada sesión.
+    """
+    resultado = descargar_bd_desde_drive(file_id)
+    clave = str(DB_PATH.resolve())
+    with _sync_lock:
+        if resultado != "descargada" and clave in _bd_preparada:
+            return resultado
+        init_db()
+        purgar_borradores()
+        _bd_preparada.add(clave)
+    return resultado
 
 def subir_bd_a_drive(file_id):
     print("🔁 Subida automática a Google Drive aún no implementada directamente. Usa el archivo generado y súbelo manualmente.")
     # Implementar subida con PyDrive si se requiere autenticación completa
 
+# === Conexiones ===
+# Una conexión por hilo (Streamlit ejecuta cada sesión en su propio hilo),
+# reutilizada entre llamadas y configurada en modo WAL: las lecturas (p. ej. la
+# pestaña Informe) no se bloquean mientras se guarda una aprobación.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,        # ~20 MB de caché de páginas
+    "mmap_size": 256 * 2**20,
+    "temp_store": "MEMORY",
+}
+_conexiones = {}
+_conexiones_lock = threading.Lock()
+# Trabajo en curso (transacciones y tareas en segundo plano): mientras haya
+# alguno, la sincronización no cierra las conexiones ni sustituye el archivo
+_en_uso = 0
+_uso_lock = threading.Lock()
+
+
+def obtener_conexion():
+    """Conexión reutilizable del hilo actual a DB_PATH."""
+    clave = (threading.get_ident(), str(DB_PATH))
+    conn = _conexiones.get(clave)
+    if conn is not None:
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    for pragma, valor in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={valor}")
+    with _conexiones_lock:
+        # Cerrar las conexiones de hilos que ya no existen
+        vivos = {t.ident for t in threading.enumerate()}
+        for (hilo, ruta), antigua in list(_conexiones.items()):
+            if hilo not in vivos:
+                antigua.close()
+                del _conexiones[(hilo, ruta)]
+        _conexiones[clave] = conn
+    return conn
+
+
+def cerrar_conexiones():
+    """Cierra todas las conexiones (antes de sustituir o borrar el archivo de la base)."""
+    with _conexiones_lock:
+        for conn in _conexiones.values():
+            conn.close()
+        _conexiones.clear()
+
+
+@contextmanager
+def uso_bd():
+    """Marca trabajo en curso sobre la base de datos durante el bloque (ver `sincronizar_bd`)."""
+    global _en_uso
+    with _uso_lock:
+        _en_uso += 1
+    try:
+        yield
+    finally:
+        with _uso_lock:
+            _en_uso -= 1
+
+
+def usa_bd(funcion):
+    """Decorador para funciones de larga duración (p. ej. de una `Tarea`): se ejecutan dentro de `uso_bd`."""
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with uso_bd():
+            return funcion(*args, **kwargs)
+    return envoltura
+
+
+@contextmanager
+def transaccion():
+    """Bloque de escritura atómico: confirma al salir o deshace si hay una excepción."""
+    with uso_bd():
+        conn = obtener_conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def _insertar(conn, tabla, df):
+    columnas = ", ".join(f'"{c}"' for c in df.columns)
+    marcas = ", ".join("?" * len(df.columns))
+    filas = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    conn.executemany(f'INSERT INTO {tabla} ({columnas}) VALUES ({marcas})', filas)
+
+
 # === Funciones de gestión local ===
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS horas (
-            ID TEXT,
-            Turno_Contrato TEXT,
-            Horas REAL,
-            PRIMARY KEY (ID, Turno_Contrato)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS asignaciones (
-            Fecha TEXT,
-            Unidad TEXT,
-            Turno TEXT,
-            ID_Enfermera TEXT,
-            Jornada TEXT,
-            Horas REAL
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS resumen_mensual (
-            ID TEXT,
-            Unidad TEXT,
-            Turno TEXT,
-            Jornada TEXT,
-            Año INTEGER,
-            Mes INTEGER,
-            Jornadas_Asignadas INTEGER,
-            Horas_Asignadas REAL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with transaccion() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS horas (
+                ID TEXT,
+                Turno_Contrato TEXT,
+                Horas REAL,
+                PRIMARY KEY (ID, Turno_Contrato)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS asignaciones (
+                Fecha TEXT,
+                Unidad TEXT,
+                Turno TEXT,
+                ID_Enfermera TEXT,
+                Jornada TEXT,
+                Horas REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS resumen_mensual (
+                ID TEXT,
+                Unidad TEXT,
+                Turno TEXT,
+                Jornada TEXT,
+                Año INTEGER,
+                Mes INTEGER,
+                Jornadas_Asignadas INTEGER,
+                Horas_Asignadas REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS metadatos (
+                Clave TEXT PRIMARY KEY,
+                Valor INTEGER
+            )
+        ''')
+        c.execute("INSERT OR IGNORE INTO metadatos VALUES ('version', 0)")
+        # Planificaciones por meses en curso o sin aprobar: cada mes se guarda
+        # aquí en cuanto se resuelve y pasa al histórico al aprobar
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS asignaciones_borrador (
+                Borrador TEXT,
+                Fecha TEXT,
+                Unidad TEXT,
+                Turno TEXT,
+                ID_Enfermera TEXT,
+                Jornada TEXT,
+                Horas REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS sin_cubrir_borrador (
+                Borrador TEXT,
+                Fecha TEXT,
+                Unidad TEXT,
+                Turno TEXT,
+                Faltan INTEGER
+            )
+        ''')
+        # Borradores vivos y cuándo se crearon: los de sesiones abandonadas caducan
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS borradores (
+                Borrador TEXT PRIMARY KEY,
+                Creado REAL
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS ix_borrador_clave "
+                  "ON asignaciones_borrador (Borrador, Fecha, Unidad, Turno, ID_Enfermera)")
+        c.execute("CREATE INDEX IF NOT EXISTS ix_sin_cubrir_borrador ON sin_cubrir_borrador (Borrador)")
+        _migrar_claves(c)
+        nuevo_acumulado = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'acumulado_anual'").fetchone() is None
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS acumulado_anual (
+                ID TEXT,
+                Año INTEGER,
+                Horas REAL,
+                Jornadas INTEGER,
+                PRIMARY KEY (Año, ID)
+            )
+        ''')
+        if nuevo_acumulado:
+            # Bases anteriores: el acumulado se construye una vez desde el histórico
+            c.execute('''
+                INSERT INTO acumulado_anual (ID, "Año", Horas, Jornadas)
+                SELECT ID_Enfermera, CAST(substr(Fecha, 1, 4) AS INTEGER), SUM(Horas), COUNT(*)
+                FROM asignaciones GROUP BY 1, 2
+            ''')
+        # Agregados del Informe: se actualizan en la misma transacción que los datos de los que salen
+        nuevo_unidad_mes = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'agregado_unidad_mes'").fetchone() is None
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS agregado_unidad_mes (
+                Unidad TEXT,
+                Año INTEGER,
+                Mes INTEGER,
+                Turno TEXT,
+                Jornada TEXT,
+                Profesionales INTEGER,
+                Jornadas INTEGER,
+                Horas REAL,
+                PRIMARY KEY (Año, Mes, Unidad, Turno, Jornada)
+            )
+        ''')
+        if nuevo_unidad_mes:
+            c.execute(f"INSERT INTO agregado_unidad_mes {_SELECT_UNIDAD_MES} GROUP BY 1, 2, 3, 4, 5")
+        nuevo_tope = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tope_anual'").fetchone() is None
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS tope_anual (
+                ID TEXT,
+                Año INTEGER,
+                Unidad TEXT,
+                Turno TEXT,
+                Jornada TEXT,
+                Horas REAL,
+                Jornadas INTEGER,
+                Horas_Maximas REAL,
+                Horas_Restantes REAL,
+                PRIMARY KEY (Año, ID)
+            )
+        ''')
+        if nuevo_tope:
+            c.execute(_insertar_tope_sql("1"))
 
 def cargar_horas():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM horas", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT * FROM horas", obtener_conexion())
 
 def guardar_horas(df):
-    conn = sqlite3.connect(DB_PATH)
-    df.to_sql("horas", conn, if_exists="replace", index=False)
-    conn.close()
+    with transaccion() as conn:
+        conn.execute("DELETE FROM horas")
+        _insertar(conn, "horas", df)
+        _nueva_version(conn)
 
-def guardar_asignaciones(df):
-    required_columns = ["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        # 1. Filtrar solo las columnas necesarias
-        df = df[required_columns].copy()
-        
-        # 2. Forzar conversión de tipos
-        df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.strftime("%Y-%m-%d")
-        df["Horas"] = df["Horas"].astype(float)
-        
-        # 3. Debug final
-        print("Columnas a guardar:", df.columns.tolist())
-        print("Tipos de datos:", df.dtypes)
-        print("Primeras filas:", df.head())
-        
-        # 4. Usar if_exists='replace' temporalmente para forzar esquema correcto
-        df.to_sql("asignaciones", conn, if_exists='replace', index=False, dtype={
-            "Fecha": "TEXT",
-            "Unidad": "TEXT",
-            "Turno": "TEXT",
-            "ID_Enfermera": "TEXT",
-            "Jornada": "TEXT",
-            "Horas": "REAL"
-        })
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+def _nueva_version(conn):
+    # Cada escritura incrementa la versión: las cachés de lectura la usan como clave
+    conn.execute("UPDATE metadatos SET Valor = Valor + 1 WHERE Clave = 'version'")
+
+def version_bd():
+    """
+    Versión de los datos: (inodo del archivo, contador de escrituras). El inodo
+    cambia cuando la sincronización sustituye el archivo por la copia remota.
+    """
+    fila = obtener_conexion().execute("SELECT Valor FROM metadatos WHERE Clave = 'version'").fetchone()
+    return os.stat(DB_PATH).st_ino, fila[0] if fila else 0
+
+CLAVE_ASIGNACION = ["Fecha", "Unidad", "Turno", "ID_Enfermera"]
+CLAVE_RESUMEN = ["ID", "Unidad", "Turno", "Jornada", "Año", "Mes"]
+
+
+def _migrar_claves(c):
+    """
+    Índices de las tablas de histórico. Las bases anteriores podían tener filas
+    repetidas (el resumen se añadía en cada aprobación): antes de crear las
+    claves únicas se conserva la última versión de cada fila.
+    """
+    existentes = {fila[0] for fila in c.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    for tabla, indice, clave in (("asignaciones", "ux_asignaciones_clave", CLAVE_ASIGNACION),
+                                 ("resumen_mensual", "ux_resumen_clave", CLAVE_RESUMEN)):
+        if indice in existentes:
+            continue
+        columnas = ", ".join(f'"{col}"' for col in clave)
+        c.execute(f"DELETE FROM {tabla} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {tabla} GROUP BY {columnas})")
+        c.execute(f"CREATE UNIQUE INDEX {indice} ON {tabla} ({columnas})")
+    # Fecha ya encabeza la clave única; consultas por unidad o por profesional
+    c.execute("CREATE INDEX IF NOT EXISTS ix_asignaciones_unidad ON asignaciones (Unidad, Fecha)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_asignaciones_enfermera ON asignaciones (ID_Enfermera, Fecha)")
+    c.execute('CREATE INDEX IF NOT EXISTS ix_resumen_periodo ON resumen_mensual ("Año", Mes, Unidad)')
+
+
+def _upsert(conn, tabla, df, clave):
+    """INSERT ... ON CONFLICT DO UPDATE por lotes: solo se reescriben las filas de `df`."""
+    columnas = ", ".join(f'"{c}"' for c in df.columns)
+    marcas = ", ".join("?" * len(df.columns))
+    conflicto = ", ".join(f'"{c}"' for c in clave)
+    actualizar = ", ".join(f'"{c}" = excluded."{c}"' for c in df.columns if c not in clave)
+    filas = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    conn.executemany(f"INSERT INTO {tabla} ({columnas}) VALUES ({marcas}) "
+                     f"ON CONFLICT ({conflicto}) DO UPDATE SET {actualizar}", filas)
+
+
+COLUMNAS_ASIGNACIONES = ["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]
+
+def _preparar_asignaciones(df):
+    # 1. Filtrar solo las columnas necesarias
+    df = df[COLUMNAS_ASIGNACIONES].copy()
+    # 2. Forzar conversión de tipos
+    df["Fecha"] = pd.to_datetime(df["Fecha"]).dt.strftime("%Y-%m-%d")
+    df["Horas"] = df["Horas"].astype(float)
+    return df
+
+def _periodo_afectado(conn, origen, parametros, periodo, unidades):
+    """(inicio, fin, unidades) que cubre una aprobación; por defecto, lo que abarca `origen`."""
+    if periodo is None:
+        periodo = conn.execute(f"SELECT MIN(Fecha), MAX(Fecha) FROM {origen}", parametros).fetchone()
+        if periodo[0] is None:
+            return None
+    inicio, fin = (pd.Timestamp(f).strftime("%Y-%m-%d") for f in periodo)
+    if unidades is None:
+        unidades = [fila[0] for fila in conn.execute(f"SELECT DISTINCT Unidad FROM {origen}", parametros)]
+    return inicio, fin, sorted({str(u) for u in unidades})
+
+def _cargar_aprobacion(conn, df):
+    """Copia `df` a una tabla temporal: es el origen de `_escribir_asignaciones` para un DataFrame."""
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS aprobacion (
+            Fecha TEXT, Unidad TEXT, Turno TEXT, ID_Enfermera TEXT, Jornada TEXT, Horas REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.ix_aprobacion_clave "
+                 "ON aprobacion (Fecha, Unidad, Turno, ID_Enfermera)")
+    conn.execute("DELETE FROM temp.aprobacion")
+    _insertar(conn, "temp.aprobacion", df)
+    return "temp.aprobacion", []
+
+def _escribir_asignaciones(conn, origen, parametros, periodo=None, unidades=None):
+    """
+    Actualiza solo el periodo y las unidades aprobados con las filas de
+    `origen` (una tabla o subconsulta con las columnas de `asignaciones` y sus
+    `parametros`): las filas nuevas o modificadas se insertan con upsert y se
+    borran las del periodo que ya no forman parte de la planificación. El
+    resto del histórico no se toca. Devuelve el periodo afectado (o None si
+    no hay nada que escribir).
+    """
+    afectado = _periodo_afectado(conn, origen, parametros, periodo, unidades)
+    if afectado is None:
+        return None
+    inicio, fin, unidades = afectado
+    # Profesionales cuyo acumulado anual puede cambiar: las de la nueva
+    # planificación y las que tenían turnos en el periodo sustituido
+    marcas = ", ".join("?" * len(unidades))
+    afectadas = {fila[0] for fila in conn.execute(f"SELECT DISTINCT ID_Enfermera FROM {origen}", parametros)}
+    afectadas.update(fila[0] for fila in conn.execute(
+        f"SELECT DISTINCT ID_Enfermera FROM asignaciones WHERE Fecha BETWEEN ? AND ? AND Unidad IN ({marcas})",
+        [inicio, fin, *unidades]))
+
+    columnas = ", ".join(COLUMNAS_ASIGNACIONES)
+    # `WHERE 1` evita que SQLite lea ON CONFLICT como parte del SELECT
+    conn.execute(f"""
+        INSERT INTO asignaciones ({columnas}) SELECT {columnas} FROM {origen} WHERE 1
+        ON CONFLICT (Fecha, Unidad, Turno, ID_Enfermera)
+        DO UPDATE SET Jornada = excluded.Jornada, Horas = excluded.Horas
+    """, parametros)
+    conn.executemany(f"""
+        DELETE FROM asignaciones
+        WHERE Unidad = ? AND Fecha BETWEEN ? AND ?
+          AND NOT EXISTS (
+              SELECT 1 FROM {origen} k
+              WHERE k.Fecha = asignaciones.Fecha AND k.Unidad = asignaciones.Unidad
+                AND k.Turno = asignaciones.Turno AND k.ID_Enfermera = asignaciones.ID_Enfermera
+          )
+    """, [(u, inicio, fin, *parametros) for u in unidades])
+    _recalcular_acumulado(conn, afectadas, range(int(inicio[:4]), int(fin[:4]) + 1))
+    return afectado
+
+def _recalcular_acumulado(conn, ids, años):
+    """Recalcula desde `asignaciones` el acumulado anual de las profesionales y años indicados."""
+    grupos = [(i, año) for i in sorted(ids) for año in años]
+    conn.executemany('DELETE FROM acumulado_anual WHERE ID = ? AND "Año" = ?', grupos)
+    conn.executemany("""
+        INSERT INTO acumulado_anual (ID, "Año", Horas, Jornadas)
+        SELECT ID_Enfermera, ?, SUM(Horas), COUNT(*)
+        FROM asignaciones
+        WHERE ID_Enfermera = ? AND Fecha >= ? AND Fecha < ?
+        GROUP BY ID_Enfermera
+    """, [(año, i, f"{año}-01-01", f"{año + 1}-01-01") for i, año in grupos])
+    conn.executemany('DELETE FROM tope_anual WHERE ID = ? AND "Año" = ?', grupos)
+    conn.executemany(_insertar_tope_sql("ID_Enfermera = ? AND Fecha >= ? AND Fecha < ?"),
+                     [(i, f"{año}-01-01", f"{año + 1}-01-01") for i, año in grupos])
+
+# Tope anual de horas según el turno y la jornada, como `calcular_limites`
+_SQL_HORAS_MAXIMAS = (
+    "(CASE u.Turno " + " ".join(f"WHEN '{turno}' THEN {horas}" for turno, horas in BASE_MAX_HOURS.items())
+    + f" ELSE {HORAS_POR_DEFECTO} END * CASE WHEN u.Jornada = 'Parcial' THEN {FACTOR_PARCIAL} ELSE 1 END)"
+)
+
+def _insertar_tope_sql(condicion):
+    """
+    INSERT de `tope_anual` desde `acumulado_anual` para las asignaciones que
+    cumplen `condicion`. Unidad, turno y jornada son los de la última
+    asignación del año de cada profesional.
+    """
+    return f"""
+        WITH ultima AS (
+            SELECT ID_Enfermera AS ID, CAST(substr(Fecha, 1, 4) AS INTEGER) AS "Año", Unidad, Turno, Jornada,
+                   ROW_NUMBER() OVER (PARTITION BY ID_Enfermera, substr(Fecha, 1, 4)
+                                      ORDER BY Fecha DESC, Unidad, Turno) AS n
+            FROM asignaciones WHERE {condicion}
+        )
+        INSERT INTO tope_anual (ID, "Año", Unidad, Turno, Jornada, Horas, Jornadas, Horas_Maximas, Horas_Restantes)
+        SELECT a.ID, a."Año", u.Unidad, u.Turno, u.Jornada, a.Horas, a.Jornadas,
+               {_SQL_HORAS_MAXIMAS}, {_SQL_HORAS_MAXIMAS} - a.Horas
+        FROM acumulado_anual a JOIN ultima u ON u.ID = a.ID AND u."Año" = a."Año" AND u.n = 1
+    """
+
+def cargar_estado_previo(inicio, fin, unidades):
+    """
+    Estado de partida de una planificación de `unidades` entre `inicio` y
+    `fin`: horas y jornadas ya aprobadas en cada año del rango (sin contar lo
+    que esta planificación va a sustituir) y la última fecha trabajada y la
+    racha de días seguidos que acaba en ella, mirando solo los
+    LIMITE_CONSECUTIVOS días anteriores a `inicio`.
+    Devuelve un DataFrame indexado por ID con una fila por año (Año, Horas,
+    Jornadas) y la Ultima_Fecha y Racha del ID repetidas en cada fila.
+    """
+    inicio, fin = pd.Timestamp(inicio), pd.Timestamp(fin)
+    unidades = sorted({str(u) for u in unidades})
+    marcas = ", ".join("?" * len(unidades))
+    conn = obtener_conexion()
+
+    # Los topes son anuales: un plan que cruza el 1 de enero necesita el acumulado de cada año
+    acumulado = pd.read_sql_query('SELECT ID, "Año", Horas, Jornadas FROM acumulado_anual WHERE "Año" BETWEEN ? AND ?',
+                                  conn, params=[inicio.year, fin.year], index_col=["ID", "Año"])
+    sustituido = pd.read_sql_query(
+        f"""SELECT ID_Enfermera AS ID, CAST(substr(Fecha, 1, 4) AS INTEGER) AS "Año", SUM(Horas) AS Horas,
+                   COUNT(*) AS Jornadas
+            FROM asignaciones
+            WHERE Fecha BETWEEN ? AND ? AND Unidad IN ({marcas}) GROUP BY 1, 2""",
+        conn, params=[inicio.strftime("%Y-%m-%d"), fin.strftime("%Y-%m-%d"), *unidades], index_col=["ID", "Año"])
+    acumulado = acumulado.sub(sustituido, fill_value=0).reset_index("Año")
+
+    recientes = pd.read_sql_query(
+        "SELECT DISTINCT ID_Enfermera AS ID, Fecha FROM asignaciones WHERE Fecha >= ? AND Fecha < ?",
+        conn, params=[(inicio - pd.Timedelta(days=LIMITE_CONSECUTIVOS)).strftime("%Y-%m-%d"),
+                      inicio.strftime("%Y-%m-%d")])
+    dias = (pd.to_datetime(recientes["Fecha"]) - pd.Timestamp(0)).dt.days
+    recientes = recientes.assign(_dia=dias).sort_values(["ID", "_dia"])
+    # Racha: días seguidos hasta el último trabajado (tramos sin huecos por ID)
+    corte = (recientes["ID"] != recientes["ID"].shift()) | (recientes["_dia"].diff() != 1)
+    tramo = corte.cumsum()
+    ultimos = recientes.assign(Racha=recientes.groupby(tramo).cumcount() + 1).groupby("ID").last()
+
+    estado = acumulado.join(ultimos[["Fecha", "Racha"]].rename(columns={"Fecha": "Ultima_Fecha"}), how="outer")
+    # Sin nada aprobado en el rango, la racha va en una fila del primer año
+    estado["Año"] = estado["Año"].fillna(inicio.year)
+    estado[["Horas", "Jornadas", "Racha"]] = estado[["Horas", "Jornadas", "Racha"]].fillna(0)
+    estado.index.name = "ID"
+    return estado.astype({"Año": int, "Jornadas": int, "Racha": int})
+
+def _recalcular_resumen(conn, inicio, fin, unidades):
+    """Recalcula desde `asignaciones` el resumen de los meses y unidades afectados."""
+    meses = pd.period_range(inicio, fin, freq="M")
+    grupos = [(u, m.year, m.month, m.start_time.strftime("%Y-%m-%d"), (m + 1).start_time.strftime("%Y-%m-%d"))
+              for u in unidades for m in meses]
+    conn.executemany('DELETE FROM resumen_mensual WHERE Unidad = ? AND "Año" = ? AND Mes = ?',
+                     [g[:3] for g in grupos])
+    conn.executemany("""
+        INSERT INTO resumen_mensual (ID, Unidad, Turno, Jornada, "Año", Mes, Jornadas_Asignadas, Horas_Asignadas)
+        SELECT ID_Enfermera, Unidad, Turno, Jornada, ?, ?, COUNT(*), SUM(Horas)
+        FROM asignaciones
+        WHERE Unidad = ? AND Fecha >= ? AND Fecha < ?
+        GROUP BY ID_Enfermera, Unidad, Turno, Jornada
+    """, [(año, mes, u, desde, hasta) for u, año, mes, desde, hasta in grupos])
+    _recalcular_unidad_mes(conn, [g[:3] for g in grupos])
+
+_SELECT_UNIDAD_MES = """
+    SELECT Unidad, "Año", Mes, Turno, Jornada, COUNT(DISTINCT ID), SUM(Jornadas_Asignadas), SUM(Horas_Asignadas)
+    FROM resumen_mensual
+"""
+
+def _recalcular_unidad_mes(conn, grupos):
+    """Recalcula desde `resumen_mensual` el agregado por unidad y mes de los grupos (unidad, año, mes)."""
+    conn.executemany('DELETE FROM agregado_unidad_mes WHERE Unidad = ? AND "Año" = ? AND Mes = ?', grupos)
+    conn.executemany(f"""
+        INSERT INTO agregado_unidad_mes {_SELECT_UNIDAD_MES}
+        WHERE Unidad = ? AND "Año" = ? AND Mes = ?
+        GROUP BY Turno, Jornada
+    """, grupos)
+
+def guardar_asignaciones(df, periodo=None, unidades=None):
+    df = _preparar_asignaciones(df)
+    with transaccion() as conn:
+        _escribir_asignaciones(conn, *_cargar_aprobacion(conn, df), periodo, unidades)
+        _nueva_version(conn)
     
 def cargar_asignaciones():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM asignaciones", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT * FROM asignaciones", obtener_conexion())
+
+def cargar_asignaciones_periodo(inicio, fin, unidades=None):
+    """Asignaciones aprobadas entre `inicio` y `fin` (ambos incluidos), de `unidades` o de todas."""
+    sql = "SELECT * FROM asignaciones WHERE Fecha BETWEEN ? AND ?"
+    params = [pd.Timestamp(inicio).strftime("%Y-%m-%d"), pd.Timestamp(fin).strftime("%Y-%m-%d")]
+    if unidades is not None:
+        unidades = sorted({str(u) for u in unidades})
+        sql += f" AND Unidad IN ({', '.join('?' * len(unidades))})"
+        params += unidades
+    return pd.read_sql_query(sql + " ORDER BY Fecha", obtener_conexion(), params=params)
 
 def guardar_resumen_mensual(df):
-    conn = sqlite3.connect(DB_PATH)
-    df.to_sql("resumen_mensual", conn, if_exists="append", index=False)
-    conn.close()
+    with transaccion() as conn:
+        _upsert(conn, "resumen_mensual", df[CLAVE_RESUMEN + ["Jornadas_Asignadas", "Horas_Asignadas"]],
+                CLAVE_RESUMEN)
+        grupos = df[["Unidad", "Año", "Mes"]].drop_duplicates().astype(object)
+        _recalcular_unidad_mes(conn, list(grupos.itertuples(index=False, name=None)))
+        _nueva_version(conn)
+
+def cargar_resumen_mensual():
+    return pd.read_sql_query("SELECT * FROM resumen_mensual", obtener_conexion())
+
+COLUMNAS_FILTRO_RESUMEN = ["Año", "Mes", "Unidad", "Turno", "Jornada"]
+
+def catalogo_resumen():
+    """Valores distintos de cada columna filtrable del resumen mensual."""
+    conn = obtener_conexion()
+    return {col: [fila[0] for fila in conn.execute(
+                f'SELECT DISTINCT "{col}" FROM resumen_mensual WHERE "{col}" IS NOT NULL ORDER BY 1')]
+            for col in COLUMNAS_FILTRO_RESUMEN}
+
+def _where_resumen(filtros):
+    """WHERE parametrizado a partir de {columna: valores admitidos}; una lista vacía no admite nada."""
+    condiciones, parametros = [], []
+    for col, valores in (filtros or {}).items():
+        if col not in COLUMNAS_FILTRO_RESUMEN:
+            raise ValueError(f"Columna de filtro no válida: {col}")
+        valores = list(valores)
+        if not valores:
+            return " WHERE 0", []
+        condiciones.append(f'"{col}" IN ({", ".join("?" * len(valores))})')
+        parametros += [v.item() if hasattr(v, "item") else v for v in valores]
+    return (" WHERE " + " AND ".join(condiciones) if condiciones else ""), parametros
+
+def contar_resumen(filtros=None):
+    where, parametros = _where_resumen(filtros)
+    return obtener_conexion().execute(f"SELECT COUNT(*) FROM resumen_mensual{where}", parametros).fetchone()[0]
+
+def consultar_resumen(filtros=None, limite=None, desplazamiento=0):
+    """Filas del resumen mensual que cumplen `filtros`, ordenadas y opcionalmente paginadas."""
+    where, parametros = _where_resumen(filtros)
+    sql = f'SELECT * FROM resumen_mensual{where} ORDER BY "Año", Mes, Unidad, ID, Turno, Jornada'
+    if limite is not None:
+        sql += " LIMIT ? OFFSET ?"
+        parametros += [int(limite), int(desplazamiento)]
+    return pd.read_sql_query(sql, obtener_conexion(), params=parametros)
+
+def consultar_unidad_mes(filtros=None):
+    """Horas y jornadas por año, mes y unidad del agregado mensual, con los filtros del resumen."""
+    where, parametros = _where_resumen(filtros)
+    return pd.read_sql_query(
+        f'''SELECT "Año", Mes, Unidad, SUM(Jornadas) AS Jornadas, SUM(Horas) AS Horas
+            FROM agregado_unidad_mes{where} GROUP BY "Año", Mes, Unidad ORDER BY "Año", Mes, Unidad''',
+        obtener_conexion(), params=parametros)
+
+def consultar_topes(filtros=None, limite=None):
+    """
+    Horas anuales frente al tope de cada profesional, de menos a más horas
+    restantes. El filtro de mes no se aplica: el tope es anual.
+    """
+    where, parametros = _where_resumen({col: v for col, v in (filtros or {}).items() if col != "Mes"})
+    sql = f'SELECT * FROM tope_anual{where} ORDER BY Horas_Restantes, "Año", ID'
+    if limite is not None:
+        sql += " LIMIT ?"
+        parametros += [int(limite)]
+    return pd.read_sql_query(sql, obtener_conexion(), params=parametros)
+
+def guardar_aprobacion(df_assign, periodo=None, unidades=None):
+    """
+    Guarda una aprobación en una única transacción: upsert de las asignaciones
+    del periodo (`periodo` = (inicio, fin) y `unidades` planificadas; por
+    defecto, lo que abarca `df_assign`) y recálculo del resumen mensual de
+    los meses y unidades afectados.
+    """
+    df_assign = _preparar_asignaciones(df_assign)
+    with transaccion() as conn:
+        afectado = _escribir_asignaciones(conn, *_cargar_aprobacion(conn, df_assign), periodo, unidades)
+        if afectado is not None:
+            _recalcular_resumen(conn, *afectado)
+        _nueva_version(conn)
+
+# === Borradores (planificación por meses) ===
+_ORIGEN_BORRADOR = f"(SELECT {', '.join(COLUMNAS_ASIGNACIONES)} FROM asignaciones_borrador WHERE Borrador = ?)"
+
+# Un borrador sin aprobar ni descartar en este tiempo es de una sesión abandonada
+CADUCIDAD_BORRADOR = 24 * 60 * 60
+
+def _purgar_borradores(conn, caducidad):
+    conn.execute("DELETE FROM borradores WHERE Creado < ?", [time.time() - caducidad])
+    # También las filas de borradores sin registrar (bases anteriores a la tabla `borradores`)
+    for tabla in ("asignaciones_borrador", "sin_cubrir_borrador"):
+        conn.execute(f"DELETE FROM {tabla} WHERE Borrador NOT IN (SELECT Borrador FROM borradores)")
+
+def purgar_borradores(caducidad=CADUCIDAD_BORRADOR):
+    """Borra los borradores creados hace más de `caducidad` segundos (y sus filas)."""
+    with transaccion() as conn:
+        _purgar_borradores(conn, caducidad)
+
+def nuevo_borrador():
+    """Identificador de un borrador nuevo; de paso se borran los caducados."""
+    borrador = uuid.uuid4().hex
+    with transaccion() as conn:
+        _purgar_borradores(conn, CADUCIDAD_BORRADOR)
+        conn.execute("INSERT INTO borradores (Borrador, Creado) VALUES (?, ?)", [borrador, time.time()])
+    return borrador
+
+def guardar_tramo_borrador(borrador, df_assign, df_uncov=None):
+    """Añade al borrador las asignaciones (y los turnos sin cubrir) de un tramo ya resuelto."""
+    with transaccion() as conn:
+        if not df_assign.empty:
+            _insertar(conn, "asignaciones_borrador", _preparar_asignaciones(df_assign).assign(Borrador=borrador))
+        if df_uncov is not None and not df_uncov.empty:
+            df_uncov = df_uncov[["Fecha", "Unidad", "Turno", "Faltan"]].assign(Borrador=borrador)
+            _insertar(conn, "sin_cubrir_borrador", df_uncov)
+
+def cargar_borrador(borrador):
+    """(asignaciones, sin cubrir) del borrador, en el orden en que se guardaron."""
+    conn = obtener_conexion()
+    df_assign = pd.read_sql_query(f"SELECT * FROM {_ORIGEN_BORRADOR} ORDER BY rowid", conn, params=[borrador])
+    df_uncov = pd.read_sql_query(
+        "SELECT Fecha, Unidad, Turno, Faltan FROM sin_cubrir_borrador WHERE Borrador = ? ORDER BY rowid",
+        conn, params=[borrador])
+    return df_assign, df_uncov
+
+def aprobar_borrador(borrador, periodo=None, unidades=None):
+    """
+    Como `guardar_aprobacion`, pero con las filas del borrador, que se copian
+    al histórico dentro de SQLite sin pasar por memoria. El borrador se
+    conserva hasta `descartar_borrador` (aprobar dos veces es idempotente).
+    Un borrador caducado o descartado no se aprueba: vaciaría el periodo.
+    """
+    with transaccion() as conn:
+        if conn.execute("SELECT 1 FROM borradores WHERE Borrador = ?", [borrador]).fetchone() is None:
+            raise ValueError("El borrador ya no existe (caducado o descartado): vuelve a ejecutar la asignación.")
+        afectado = _escribir_asignaciones(conn, _ORIGEN_BORRADOR, [borrador], periodo, unidades)
+        if afectado is not None:
+            _recalcular_resumen(conn, *afectado)
+        _nueva_version(conn)
+
+def descartar_borrador(borrador):
+    with transaccion() as conn:
+        conn.execute("DELETE FROM asignaciones_borrador WHERE Borrador = ?", [borrador])
+        conn.execute("DELETE FROM sin_cubrir_borrador WHERE Borrador = ?", [borrador])
+        conn.execute("DELETE FROM borradores WHERE Borrador = ?", [borrador])
 
 def reset_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DROP TABLE IF EXISTS horas")
-    c.execute("DROP TABLE IF EXISTS asignaciones")
-    c.execute("DROP TABLE IF EXISTS resumen_mensual")
-    conn.commit()
-    conn.close()
+    with transaccion() as c:
+        c.execute("DROP TABLE IF EXISTS horas")
+        c.execute("DROP TABLE IF EXISTS asignaciones")
+        c.execute("DROP TABLE IF EXISTS resumen_mensual")
+        c.execute("DROP TABLE IF EXISTS acumulado_anual")
+        c.execute("DROP TABLE IF EXISTS agregado_unidad_mes")
+        c.execute("DROP TABLE IF EXISTS tope_anual")
+        c.execute("DROP TABLE IF EXISTS asignaciones_borrador")
+        c.execute("DROP TABLE IF EXISTS sin_cubrir_borrador")
+        c.execute("DROP TABLE IF EXISTS borradores")
     init_db()
+    with transaccion() as c:
+        _nueva_version(c)
@@ -0,0 +1,191 @@
+"""
+Comparación de escenarios de demanda con la misma plantilla.
+
+Cada escenario se resuelve con el modo voraz sobre un único
+`IndicePlantilla`, construido una vez para el rango de todas las variantes.
+Con más de un proceso, los arrays del índice se publican en memoria
+compartida y cada trabajador abre los bloques para cada escenario y los
+cierra al terminarlo. Los trabajadores no reciben el `Avance`: cancelar
+descarta los escenarios pendientes, pero espera a los que ya se están
+resolviendo.
+"""
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from flujo_asignacion import resumen_cobertura
+from motor_asignacion import (
+    COLUMNAS_ASIGNACION, IndicePlantilla, SeleccionMenosHoras, _asignar, _tramo, normalizar_demanda
+)
+
+# Índice de la plantilla abierto en cada proceso trabajador (ver `_iniciar_trabajador`)
+_trabajador = {}
+
+
+def _publicar(indice_plantilla):
+    """
+    Copia los arrays de un `IndicePlantilla` a bloques de memoria compartida.
+    Devuelve (descriptor, bloques): el descriptor es lo único que se envía a
+    cada proceso (nombres de bloque, formas y tipos, más IDs y categorías de
+    jornada, que son pequeños); los bloques se cierran y liberan al terminar.
+    """
+    grupos, inicio_grupo = [], 0
+    for clave, posiciones in indice_plantilla.indice.items():
+        grupos.append((clave, inicio_grupo, inicio_grupo + len(posiciones)))
+        inicio_grupo += len(posiciones)
+    posiciones = (np.concatenate(list(indice_plantilla.indice.values())).astype(np.int64)
+                  if indice_plantilla.indice else np.zeros(0, dtype=np.int64))
+    codigos_jornada, categorias_jornada = pd.factorize(indice_plantilla.jornadas, use_na_sentinel=False)
+    arrays = {
+        "no_disponible": indice_plantilla.no_disponible,
+        "codigos": np.asarray(indice_plantilla.codigos, dtype=np.int64),
+        "posiciones": posiciones,
+        "jornadas": codigos_jornada.astype(np.int64),
+    }
+
+    descriptor = {"arrays": {}, "grupos": grupos, "inicio": indice_plantilla.inicio,
+                  "ids": indice_plantilla.ids, "categorias_jornada": list(categorias_jornada)}
+    bloques = []
+    try:
+        for nombre, array in arrays.items():
+            bloque = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            bloques.append(bloque)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=bloque.buf)[...] = array
+            descriptor["arrays"][nombre] = (bloque.name, array.shape, array.dtype.str)
+    except BaseException:
+        _liberar(bloques)
+        raise
+    return descriptor, bloques
+
+
+def _abrir(descriptor):
+    """`IndicePlantilla` cuyos arrays son vistas de solo lectura de los bloques compartidos, y los bloques abiertos."""
+    bloques, vistas = [], {}
+    for nombre, (bloque_nombre, forma, tipo) in descriptor["arrays"].items():
+        bloque = shared_memory.SharedMemory(name=bloque_nombre)
+        bloques.append(bloque)
+        vista = np.ndarray(forma, dtype=np.dtype(tipo), buffer=bloque.buf)
+        vista.flags.writeable = False
+        vistas[nombre] = vista
+    indice = {clave: vistas["posiciones"][ini:fin] for clave, ini, fin in descriptor["grupos"]}
+    jornadas = np.asarray(descriptor["categorias_jornada"], dtype=object)[vistas["jornadas"]]
+    return IndicePlantilla(indice, descriptor["inicio"], vistas["no_disponible"], vistas["codigos"],
+                           descriptor["ids"], jornadas), bloques
+
+
+def _liberar(bloques):
+    for bloque in bloques:
+        bloque.close()
+        bloque.unlink()
+
+
+def _iniciar_trabajador(descriptor, staff_max_hours, staff_max_jornadas, estado_previo):
+    # Una vez por proceso: lo común a todos los escenarios no viaja con cada tarea
+    _trabajador.update(descriptor=descriptor, staff_max_hours=staff_max_hours,
+                       staff_max_jornadas=staff_max_jornadas, estado_previo=estado_previo)
+
+
+def _resolver_escenario(demand):
+    # Los bloques se abren para cada escenario y se cierran al terminar: el
+    # proceso no conserva proyecciones de la memoria compartida entre tareas
+    indice_plantilla, bloques = _abrir(_trabajador["descriptor"])
+    try:
+        assignments, uncovered, _, _ = _asignar(
+            None, demand, _trabajador["staff_max_hours"], _trabajador["staff_max_jornadas"], SeleccionMenosHoras,
+            estado_previo=_trabajador["estado_previo"], indice_plantilla=indice_plantilla)
+    except BaseException as e:
+        # Las variables locales de la traza retienen vistas de los bloques e impedirían cerrarlos
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        del indice_plantilla
+        for bloque in bloques:
+            bloque.close()
+    return assignments, uncovered
+
+
+def resumen_escenario(nombre, staff, demand, assignments, uncovered):
+    """
+    Fila de la comparativa de un escenario: cobertura, filas de demanda sin
+    cubrir y reparto de horas entre las profesionales de las unidades con
+    demanda en el escenario (las que no trabajan cuentan con 0 horas).
+    """
+    fila = resumen_cobertura(demand, assignments, nombre)
+    fila = {"Escenario": fila.pop("Modo"), **fila, "Filas_Sin_Cubrir": len(uncovered)}
+    ids = staff.loc[staff["Unidad_Asignada"].astype(str).isin(demand["Unidad"].astype(str).unique()), "ID"]
+    df_assign = pd.DataFrame(assignments, columns=COLUMNAS_ASIGNACION)
+    horas = (df_assign.groupby(df_assign["ID_Enfermera"].astype(str))["Horas"].sum()
+             .reindex(ids.astype(str).unique(), fill_value=0.0))
+    vacio = horas.empty
+    fila.update({
+        "Horas_Media": 0.0 if vacio else round(float(horas.mean()), 1),
+        "Horas_Min": 0.0 if vacio else round(float(horas.min()), 1),
+        "Horas_Max": 0.0 if vacio else round(float(horas.max()), 1),
+        "Horas_Desviacion": 0.0 if vacio else round(float(horas.std(ddof=0)), 1),
+    })
+    return fila
+
+
+def comparar_escenarios(staff, escenarios, staff_max_hours, staff_max_jornadas, estado_previo=None,
+                        max_workers=None, avance=None):
+    """
+    Resuelve con el modo voraz varias variantes de demanda para la misma
+    plantilla (`escenarios` = {nombre: demanda}). La plantilla se procesa una
+    sola vez, en un `IndicePlantilla` para el rango de fechas que cubre todas
+    las variantes, y las variantes se reparten entre procesos que leen ese
+    índice desde memoria compartida, sin copiarlo. El progreso se informa al
+    terminar cada escenario (en serie, día a día).
+    Devuelve (comparativa, resultados): un DataFrame con una fila por
+    escenario (ver `resumen_escenario`) y {nombre: (assignments, uncovered)}.
+    """
+    demandas = {nombre: normalizar_demanda(demand).reset_index(drop=True) for nombre, demand in escenarios.items()}
+    if not demandas:
+        return pd.DataFrame(), {}
+    fechas = pd.to_datetime(pd.concat([d["Fecha"] for d in demandas.values()], ignore_index=True),
+                            format="%Y-%m-%d")
+    if fechas.empty:
+        inicio, dias = pd.Timestamp(0), 0
+    else:
+        inicio, dias = fechas.min(), (fechas.max() - fechas.min()).days + 1
+    indice_plantilla = IndicePlantilla.construir(staff, inicio, dias)
+
+    n = len(demandas)
+    max_workers = min(max_workers or os.cpu_count() or 1, n)
+    resultados = {}
+    if max_workers <= 1:
+        for k, (nombre, demand) in enumerate(demandas.items()):
+            with _tramo(avance, k / n, 1 / n):
+                assignments, uncovered, _, _ = _asignar(
+                    staff, demand, staff_max_hours, staff_max_jornadas, SeleccionMenosHoras,
+                    estado_previo=estado_previo, avance=avance, indice_plantilla=indice_plantilla)
+            resultados[nombre] = (assignments, uncovered)
+    else:
+        descriptor, bloques = _publicar(indice_plantilla)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_iniciar_trabajador,
+                                     initargs=(descriptor, staff_max_hours, staff_max_jornadas,
+                                               estado_previo)) as pool:
+                futuros = {pool.submit(_resolver_escenario, demand): nombre for nombre, demand in demandas.items()}
+                try:
+                    for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                        nombre = futuros[futuro]
+                        resultados[nombre] = futuro.result()
+                        if avance is not None:
+                            avance.informar(hechos / n, f"{hechos}/{n} escenarios",
+                                            pd.to_numeric(demandas[nombre]["Personal_Requerido"],
+                                                          errors="coerce").clip(lower=0).sum(),
+                                            len(resultados[nombre][0]))
+                except BaseException:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+        finally:
+            _liberar(bloques)
+
+    resultados = {nombre: resultados[nombre] for nombre in demandas}
+    comparativa = pd.DataFrame([resumen_escenario(nombre, staff, demandas[nombre], *resultados[nombre])
+                                for nombre in demandas])
+    return comparativa, resultados
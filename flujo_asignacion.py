@@ -0,0 +1,294 @@
+"""
+Modo de asignación por flujo de coste mínimo.
+
+Para cada unidad y turno, una red de flujo propone a la vez todos los
+turnos del rango (máxima cobertura con la carga más repartida), y el pase
+día a día de `motor_asignacion._asignar` la aplica con las mismas
+comprobaciones que el modo voraz. El coste crece mucho con el rango: es
+para planes de hasta un mes (ver PRESUPUESTO_ASIGNACION en benchmark.py).
+"""
+import heapq
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from motor_asignacion import (
+    LIMITE_CONSECUTIVOS, SHIFT_HOURS, SeleccionMenosHoras, _asignar, _fase, _tramo,
+    acumulado_del_año, asignar_turnos, construir_disponibilidad, construir_indice, normalizar_demanda
+)
+
+INF = float("inf")
+
+
+class RedFlujo:
+    """
+    Red de flujo con costes enteros no negativos y flujo de coste mínimo por
+    el método primal-dual: en cada fase, Dijkstra con potenciales calcula las
+    distancias reducidas y después se empuja un flujo bloqueante (Dinic) por
+    los arcos de coste reducido cero. El número de fases está acotado por el
+    número de costes de camino distintos, no por el flujo total.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        # Cada arco: [destino, capacidad residual, coste, índice del inverso]
+        self.g = [[] for _ in range(n)]
+
+    def arco(self, u, v, cap, coste):
+        """Añade el arco u→v y devuelve un identificador para leer su flujo."""
+        self.g[u].append([v, cap, coste, len(self.g[v])])
+        self.g[v].append([u, 0, -coste, len(self.g[u]) - 1])
+        return u, len(self.g[u]) - 1
+
+    def flujo(self, arco):
+        u, k = arco
+        v, _, _, rev = self.g[u][k]
+        return self.g[v][rev][1]
+
+    def flujo_coste_minimo(self, s, t):
+        """Flujo máximo de s a t con coste mínimo. Devuelve (flujo, coste)."""
+        g, n = self.g, self.n
+        pot = [0] * n
+        flujo_total = coste_total = 0
+        while True:
+            # Dijkstra sobre costes reducidos (no negativos gracias a `pot`)
+            dist = [INF] * n
+            dist[s] = 0
+            monton = [(0, s)]
+            while monton:
+                d, u = heapq.heappop(monton)
+                if d > dist[u]:
+                    continue
+                if d >= dist[t]:
+                    break
+                pu = pot[u]
+                for v, cap, coste, _ in g[u]:
+                    if cap > 0:
+                        nd = d + coste + pu - pot[v]
+                        if nd < dist[v]:
+                            dist[v] = nd
+                            heapq.heappush(monton, (nd, v))
+            if dist[t] == INF:
+                return flujo_total, coste_total
+            dt = dist[t]
+            for v in range(n):
+                pot[v] += dist[v] if dist[v] < dt else dt
+
+            # Flujo bloqueante sobre los arcos admisibles (coste reducido 0)
+            while True:
+                nivel = self._niveles(s, t, pot)
+                if nivel[t] < 0:
+                    break
+                empujado = self._bloqueante(s, t, pot, nivel)
+                if not empujado:
+                    break
+                flujo_total += empujado
+                coste_total += empujado * (pot[t] - pot[s])
+
+    def _niveles(self, s, t, pot):
+        nivel = [-1] * self.n
+        nivel[s] = 0
+        cola = deque([s])
+        while cola:
+            u = cola.popleft()
+            for v, cap, coste, _ in self.g[u]:
+                if cap > 0 and nivel[v] < 0 and coste + pot[u] - pot[v] == 0:
+                    nivel[v] = nivel[u] + 1
+                    cola.append(v)
+        return nivel
+
+    def _bloqueante(self, s, t, pot, nivel):
+        g = self.g
+        siguiente = [0] * self.n
+        total = 0
+        while True:
+            # Búsqueda iterativa de un camino s→t en el grafo de niveles
+            camino = []
+            u = s
+            while u != t:
+                aristas = g[u]
+                k = siguiente[u]
+                while k < len(aristas):
+                    v, cap, coste, _ = aristas[k]
+                    if cap > 0 and nivel[v] == nivel[u] + 1 and coste + pot[u] - pot[v] == 0:
+                        break
+                    k += 1
+                siguiente[u] = k
+                if k == len(aristas):
+                    if u == s:
+                        return total
+                    # Callejón sin salida: se poda y se retrocede
+                    nivel[u] = -1
+                    u, _ = camino.pop()
+                    siguiente[u] += 1
+                    continue
+                camino.append((u, k))
+                u = aristas[k][0]
+            empuje = min(g[a][k][1] for a, k in camino)
+            for a, k in camino:
+                arista = g[a][k]
+                arista[1] -= empuje
+                g[arista[0]][arista[3]][1] += empuje
+            total += empuje
+
+
+def _tope_jornadas(max_horas, max_jornadas, horas_turno):
+    """Máximo de turnos que admiten a la vez los topes de jornadas y horas."""
+    por_jornadas = math.ceil(max_jornadas) if max_jornadas > 0 else 0
+    por_horas = math.floor(max_horas / horas_turno + 1e-9)
+    return max(0, min(por_jornadas, por_horas))
+
+
+def proponer_por_flujo(staff, demand, staff_max_hours, staff_max_jornadas, avance=None, horas_previas=None):
+    """
+    Propuesta global de asignación para una demanda ya normalizada. Para
+    cada (unidad, turno) se modela una red:
+
+        origen → día (capacidad = personal requerido)
+               → bloque de 8 días de la profesional (capacidad 1 por día,
+                 LIMITE_CONSECUTIVOS - 1 por bloque)
+               → profesional → sumidero (un arco por turno, con coste
+                 creciente según la carga: reparte las horas)
+
+    Cubre el máximo de turnos posible y, entre esas soluciones, la de carga
+    más repartida. `horas_previas` ({ID: horas}, opcional) son las horas ya
+    aprobadas en el año: el coste del primer turno de cada profesional parte
+    de ellas (en turnos), como el criterio de menos horas del modo voraz.
+    Devuelve {etiqueta de fila: [posiciones de staff]}.
+    Las rachas que cruzan dos bloques no caben en la red; las corrige el
+    pase cronológico de `_asignar`. `avance` se informa tras cada red.
+    """
+    propuesta = {}
+    if demand.empty:
+        return propuesta
+    indice = construir_indice(staff)
+    fechas = pd.to_datetime(demand["Fecha"], format="%Y-%m-%d")
+    inicio = fechas.min()
+    dias = (fechas - inicio).dt.days.to_numpy()
+    no_disponible = construir_disponibilidad(staff, inicio, int(dias.max()) + 1)
+    ids = staff["ID"].to_numpy()
+    requeridos = pd.to_numeric(demand["Personal_Requerido"], errors="coerce").fillna(0).clip(lower=0)
+    requeridos = requeridos.to_numpy().astype(np.int64)
+    tam_bloque = LIMITE_CONSECUTIVOS
+    max_bloque = LIMITE_CONSECUTIVOS - 1
+
+    filas_por_grupo = demand.assign(_dia=dias, _req=requeridos).groupby(["Unidad", "Turno"], sort=False)
+    for k, ((unidad, turno), filas) in enumerate(filas_por_grupo):
+        if avance is not None:
+            avance.informar(k / filas_por_grupo.ngroups, f"Propuesta por flujo: {unidad} · {turno}")
+        pool = indice.get((unidad, turno))
+        if pool is None or turno not in SHIFT_HOURS:
+            continue
+        horas_turno = SHIFT_HOURS[turno]
+        por_dia = filas.groupby("_dia", sort=True)["_req"].sum()
+        por_dia = por_dia[por_dia > 0]
+        if por_dia.empty:
+            continue
+        dias_grupo = por_dia.index.to_numpy()
+        dia0 = dias_grupo[0]
+
+        # Numeración de nodos: 0 origen, 1 sumidero, días, profesionales, bloques
+        n_dias = len(dias_grupo)
+        nodo_dia = {d: 2 + k for k, d in enumerate(dias_grupo)}
+        nodo_enf = {i: 2 + n_dias + k for k, i in enumerate(pool)}
+        siguiente = 2 + n_dias + len(pool)
+        aristas = []
+        bloques = {}
+        for d in dias_grupo:
+            libres = pool[~no_disponible[pool, d]]
+            b = (d - dia0) // tam_bloque
+            for i in libres:
+                clave = (i, b)
+                if clave not in bloques:
+                    bloques[clave] = [siguiente, 0]
+                    siguiente += 1
+                bloques[clave][1] += 1
+                aristas.append((nodo_dia[d], bloques[clave][0], d, i))
+
+        red = RedFlujo(siguiente)
+        for d, req in por_dia.items():
+            red.arco(0, nodo_dia[d], int(req), 0)
+        arcos_dia = [(red.arco(u, v, 1, 0), d, i) for u, v, d, i in aristas]
+        for (i, _), (nodo, libres) in bloques.items():
+            red.arco(nodo, nodo_enf[i], min(max_bloque, libres), 0)
+        for i in pool:
+            tope = _tope_jornadas(staff_max_hours[ids[i]], staff_max_jornadas[ids[i]], horas_turno)
+            tope = min(tope, n_dias)
+            # Coste marginal convexo que continúa la carga ya aprobada (enteros: turnos de este grupo)
+            base = round(horas_previas.get(str(ids[i]), 0) / horas_turno) if horas_previas else 0
+            for k in range(tope):
+                red.arco(nodo_enf[i], 1, 1, base + k)
+        red.flujo_coste_minimo(0, 1)
+
+        elegidas = {}
+        for arco, d, i in arcos_dia:
+            if red.flujo(arco):
+                elegidas.setdefault(d, []).append(i)
+        # Reparto entre filas del mismo día (demanda duplicada) por orden
+        for d, fila_dia in filas.groupby("_dia", sort=False):
+            cola = elegidas.get(d, [])
+            for fila, req in zip(fila_dia.index, fila_dia["_req"]):
+                propuesta[fila] = cola[:req]
+                cola = cola[req:]
+    return propuesta
+
+
+def asignar_turnos_flujo(staff, demand, staff_max_hours, staff_max_jornadas, estrategia=SeleccionMenosHoras,
+                         estado_previo=None, diagnostico=None, avance=None):
+    """
+    Modo de asignación por flujo de coste mínimo. La propuesta global de
+    `proponer_por_flujo` se aplica día a día con las mismas comprobaciones
+    que el modo voraz (disponibilidad, días consecutivos, descanso y topes),
+    y lo que la propuesta no cubra se completa con `estrategia`. Devuelve
+    (assignments, uncovered) con el mismo formato que `asignar_turnos`.
+    """
+    demand = normalizar_demanda(demand)
+    # La propuesta solo dispone de lo que queda de los topes del primer año del
+    # plan; si cruza el 1 de enero, el pase día a día aplica los del año nuevo
+    restante_horas, restante_jornadas, horas_previas = staff_max_hours, staff_max_jornadas, None
+    if estado_previo is not None and not estado_previo.empty:
+        previo = acumulado_del_año(estado_previo, int(demand["Fecha"].iloc[0][:4]))
+        restante_horas = {k: v - previo["Horas"].get(str(k), 0) for k, v in staff_max_hours.items()}
+        restante_jornadas = {k: v - previo["Jornadas"].get(str(k), 0) for k, v in staff_max_jornadas.items()}
+        horas_previas = previo["Horas"].to_dict()
+    # La propuesta ocupa la mitad de la barra de progreso y el pase día a día, el resto
+    with _fase(diagnostico, "propuesta_flujo"), _tramo(avance, 0.0, 0.5):
+        propuesta = proponer_por_flujo(staff, demand, restante_horas, restante_jornadas, avance=avance,
+                                       horas_previas=horas_previas)
+    with _tramo(avance, 0.5, 0.5):
+        assignments, uncovered, _, _ = _asignar(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                estrategia, propuesta=propuesta, estado_previo=estado_previo,
+                                                diagnostico=diagnostico, avance=avance)
+    return assignments, uncovered
+
+
+def resumen_cobertura(demand, assignments, modo):
+    """Fila de resumen de cobertura de un resultado de asignación."""
+    demandados = int(pd.to_numeric(demand["Personal_Requerido"], errors="coerce").fillna(0).sum())
+    cubiertos = len(assignments)
+    return {
+        "Modo": modo,
+        "Turnos_Demandados": demandados,
+        "Turnos_Cubiertos": cubiertos,
+        "Turnos_Sin_Cubrir": demandados - cubiertos,
+        "Cobertura_%": round(100 * cubiertos / demandados, 2) if demandados else 100.0,
+    }
+
+
+def comparar_cobertura(staff, demand, staff_max_hours, staff_max_jornadas, resultado_flujo=None,
+                       estado_previo=None):
+    """
+    Cobertura del modo voraz frente al de flujo de coste mínimo para la misma
+    plantilla y demanda. Si ya se tiene el resultado del modo flujo se pasa
+    en `resultado_flujo` para no recalcularlo.
+    """
+    voraz, _ = asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas, estado_previo=estado_previo)
+    if resultado_flujo is None:
+        resultado_flujo = asignar_turnos_flujo(staff, demand, staff_max_hours, staff_max_jornadas,
+                                               estado_previo=estado_previo)
+    return pd.DataFrame([
+        resumen_cobertura(demand, voraz, "Voraz"),
+        resumen_cobertura(demand, resultado_flujo[0], "Flujo de coste mínimo"),
+    ])
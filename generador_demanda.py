@@ -1,28 +1,27 @@
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 from datetime import datetime, timedelta, date
+from utils.demanda import DIAS_SEMANA, TURNOS, construir_demanda
+from utils.excel_utils import boton_descarga
 
 
 #Definición de funciones necesarias
-def to_excel_bytes(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    return output.getvalue()
-
 def generar_demanda_interactiva():
     st.markdown("""
-    ⚙️ Este módulo permite crear automáticamente la demanda de turnos para una unidad durante el rango de fechas seleccionado por el usuario.
+    ⚙️ Este módulo permite crear automáticamente la demanda de turnos para una o varias unidades durante el rango de fechas seleccionado por el usuario.
     
-    1. Selecciona la unidad que quieres planificar.
+    1. Selecciona las unidades que quieres planificar (todas usan la misma configuración semanal).
     2. Define el rango de fechas.
     3. Configura los profesionales que necesitas por turno para cada día de la semana.
     3. Descarga el Excel para usarlo en la herramienta o para guardar y analizar ese archivo posteriormente.
     """)
     
-    unidad_seleccionada = st.selectbox("Selecciona la unidad hospitalaria", [
-        "Medicina Interna", "UCI", "Urgencias", "Oncología", "Quirófano"])
+    unidades_hospital = ["Medicina Interna", "UCI", "Urgencias", "Oncología", "Quirófano"]
+    unidades_seleccionadas = st.multiselect("Selecciona las unidades hospitalarias", unidades_hospital,
+                                            default=unidades_hospital[:1])
+    if not unidades_seleccionadas:
+        st.warning("⚠️ Selecciona al menos una unidad.")
+        st.stop()
     
     col1, col2 = st.columns(2)
     fecha_inicio = col1.date_input("Fecha de inicio", value=date(2025, 1, 1))
@@ -33,8 +32,8 @@ def generar_demanda_interactiva():
         st.warning("⚠️ La fecha fin debe ser posterior a la fecha inicio.")
         st.stop()
     
-    dias_semana = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-    turnos = ["Mañana", "Tarde", "Noche"]
+    dias_semana = DIAS_SEMANA
+    turnos = TURNOS
 
     st.markdown("### Configuración de turnos por día")
     demanda_por_dia = {}
@@ -50,27 +49,12 @@ def generar_demanda_interactiva():
             )
 
     if st.button("📄 Generar demanda"):
-        fechas = [fecha_inicio + timedelta(days=i) for i in range((fecha_fin - fecha_inicio).days + 1)]        
-  
-        demanda = []
-        for fecha in fechas:
-            dia_castellano = dias_semana[fecha.weekday()]
-            for turno in turnos:
-                demanda.append({
-                    "Fecha": fecha.strftime("%Y-%m-%d"),
-                    "Unidad": unidad_seleccionada,
-                    "Turno": turno,
-                    "Personal_Requerido": demanda_por_dia[dia_castellano][turno]
-                })
-
-        df_demanda = pd.DataFrame(demanda)
+        df_demanda = construir_demanda({u: demanda_por_dia for u in unidades_seleccionadas}, fecha_inicio, fecha_fin)
 
         st.success("✅ Demanda generada correctamente.")
         st.dataframe(df_demanda.head(20))
 
-        st.download_button(
-            label="⬇️ Descargar Excel de demanda",
-            data=to_excel_bytes(df_demanda),
-            file_name=f"Demanda_{unidad_seleccionada}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        nombre_unidades = (unidades_seleccionadas[0] if len(unidades_seleccionadas) == 1
+                           else f"{len(unidades_seleccionadas)}_unidades")
+        boton_descarga("⬇️ Descargar Excel de demanda", lambda: df_demanda,
+                       f"Demanda_{nombre_unidades}_{fecha_inicio.strftime('%Y%m%d')}_{fecha_fin.strftime('%Y%m%d')}")
@@ -0,0 +1,774 @@
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+# Parámetros de turnos y límites anuales (SERMAS)
+SHIFT_HOURS = {"Mañana": 7.5, "Tarde": 7.5, "Noche": 10}
+BASE_MAX_HOURS = {"Mañana": 1642.5, "Tarde": 1642.5, "Noche": 1470}
+BASE_MAX_JORNADAS = {"Mañana": 219, "Tarde": 219, "Noche": 147}
+TURNOS_VALIDOS = {
+    turno: {"horas": BASE_MAX_HOURS[turno], "jornadas": BASE_MAX_JORNADAS[turno]}
+    for turno in SHIFT_HOURS
+}
+
+COLUMNAS_ASIGNACION = ["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]
+
+# Límite de días de trabajo seguidos: el día que haría el 8º no se asigna
+LIMITE_CONSECUTIVOS = 8
+
+# Contadores del diagnóstico por fila de demanda: candidatas del grupo,
+# asignadas y candidatas rechazadas por cada restricción. Quien alcanzó un
+# tope anual cuenta como rechazo en todas las filas siguientes de su grupo:
+# en una fila sin cubrir, rechazos + asignadas = candidatas.
+MOTIVOS_RECHAZO = ["No disponible", "Descanso 12 h", "Días consecutivos", "Tope de jornadas", "Tope de horas"]
+COLUMNAS_DIAGNOSTICO = ["Candidatas", "Asignadas"] + MOTIVOS_RECHAZO
+_COLUMNA_DIAGNOSTICO = {col: k for k, col in enumerate(COLUMNAS_DIAGNOSTICO)}
+
+# Valores por defecto (promedio) si el turno del contrato no es válido
+HORAS_POR_DEFECTO = 1585
+JORNADAS_POR_DEFECTO = 200
+FACTOR_PARCIAL = 0.8
+
+
+def calcular_limites(staff):
+    """
+    Calcula el máximo de horas y jornadas anuales de cada profesional según
+    su turno de contrato y jornada. Devuelve los dos diccionarios y la lista
+    de avisos encontrados (la interfaz decide cómo mostrarlos).
+    """
+    staff_max_hours = {}
+    staff_max_jornadas = {}
+    avisos = []
+    for row in staff.itertuples(index=False):
+        try:
+            turno = str(row.Turno_Contrato).strip()
+            jornada = str(row.Jornada).strip() if pd.notna(row.Jornada) else "Completa"
+            factor = FACTOR_PARCIAL if jornada == "Parcial" else 1
+
+            if turno in TURNOS_VALIDOS:
+                staff_max_hours[row.ID] = TURNOS_VALIDOS[turno]["horas"] * factor
+                staff_max_jornadas[row.ID] = TURNOS_VALIDOS[turno]["jornadas"] * factor
+            else:
+                avisos.append(f"Turno no válido '{turno}' para empleado {row.ID}. Usando valores por defecto.")
+                staff_max_hours[row.ID] = HORAS_POR_DEFECTO * factor
+                staff_max_jornadas[row.ID] = JORNADAS_POR_DEFECTO * factor
+        except Exception as e:
+            avisos.append(f"Error procesando empleado {row.ID}: {str(e)}")
+            # Valores por defecto seguros: asume jornada parcial
+            staff_max_hours[row.ID] = HORAS_POR_DEFECTO * FACTOR_PARCIAL
+            staff_max_jornadas[row.ID] = JORNADAS_POR_DEFECTO * FACTOR_PARCIAL
+    return staff_max_hours, staff_max_jornadas, avisos
+
+
+def construir_indice(staff):
+    """
+    Agrupa la plantilla por (unidad, turno) una sola vez por ejecución.
+    Cada entrada es un array con la posición de cada profesional en `staff`,
+    en el orden del archivo de plantilla, que es el que decide los empates de
+    horas al elegir candidatas.
+    """
+    return dict(staff.groupby(["Unidad_Asignada", "Turno_Contrato"], sort=False).indices)
+
+
+def construir_disponibilidad(staff, inicio, dias):
+    """
+    Matriz booleana profesional × día (posición en `staff` × días desde
+    `inicio`) que vale True cuando la profesional NO está disponible.
+    `Fechas_No_Disponibilidad` debe venir ya parseada como lista de
+    'YYYY-MM-DD'; las fechas fuera del plan se ignoran.
+    """
+    no_disponible = np.zeros((len(staff), dias), dtype=bool)
+    listas = staff["Fechas_No_Disponibilidad"].map(
+        lambda lst: lst if isinstance(lst, (list, tuple, set)) else [])
+    fechas = listas.reset_index(drop=True).explode().dropna()
+    if fechas.empty:
+        return no_disponible
+    offsets = (pd.to_datetime(fechas.astype(str), format="%Y-%m-%d", errors="coerce")
+               - pd.Timestamp(inicio)).dt.days
+    dentro = offsets.notna() & (offsets >= 0) & (offsets < dias)
+    no_disponible[fechas.index[dentro].to_numpy(), offsets[dentro].to_numpy(dtype=np.int64)] = True
+    return no_disponible
+
+
+class IndicePlantilla:
+    """
+    Lo que la asignación precalcula de la plantilla para un rango de fechas:
+    índice de candidatas por (unidad, turno), matriz de no disponibilidad
+    desde `inicio`, código de ID de cada fila de `staff` e IDs y jornadas.
+    No cambia durante la asignación, así que se puede construir una vez y
+    usar (o compartir entre procesos) para varias demandas del mismo rango.
+    """
+    __slots__ = ("indice", "inicio", "no_disponible", "codigos", "ids", "jornadas")
+
+    def __init__(self, indice, inicio, no_disponible, codigos, ids, jornadas):
+        self.indice = indice
+        self.inicio = pd.Timestamp(inicio)
+        self.no_disponible = no_disponible
+        self.codigos = codigos
+        self.ids = ids
+        self.jornadas = jornadas
+
+    @classmethod
+    def construir(cls, staff, inicio, dias, diagnostico=None):
+        with _fase(diagnostico, "indice_candidatas"):
+            indice = construir_indice(staff)
+        with _fase(diagnostico, "disponibilidad"):
+            no_disponible = construir_disponibilidad(staff, inicio, dias)
+            jornadas = staff["Jornada"].to_numpy()
+        # Un registro de estado por ID (un ID repetido comparte contadores)
+        with _fase(diagnostico, "estado_inicial"):
+            codigos, ids = pd.factorize(staff["ID"])
+        return cls(indice, inicio, no_disponible, codigos, ids.tolist(), jornadas)
+
+    def cubre(self, fechas):
+        """True si todas las `fechas` (datetime) caen dentro del rango del índice."""
+        dias = (fechas - self.inicio).dt.days
+        return bool(((dias >= 0) & (dias < self.no_disponible.shape[1])).all())
+
+
+class EstadoPlantilla:
+    """
+    Estado acumulado de cada profesional durante la asignación, en arrays
+    indexados por profesional: último día trabajado, racha de días seguidos
+    que termina en ese día, jornadas y horas. Los días son enteros (días desde
+    1970-01-01), así el estado vale entre tramos o ejecuciones distintas.
+    Jornadas y horas son las del año en curso (`año`); las de los demás años
+    del plan se guardan aparte y se recuperan con `cambiar_año`.
+    Todas las comprobaciones y actualizaciones son de coste constante.
+    """
+    __slots__ = ("ultimo_dia", "racha", "jornadas", "horas", "max_horas", "max_jornadas", "año", "_otros_años")
+
+    SIN_DIA = np.iinfo(np.int64).min // 2
+
+    def __init__(self, max_horas, max_jornadas):
+        n = len(max_horas)
+        self.ultimo_dia = np.full(n, self.SIN_DIA, dtype=np.int64)
+        self.racha = np.zeros(n, dtype=np.int32)
+        self.jornadas = np.zeros(n, dtype=np.int32)
+        self.horas = np.zeros(n, dtype=np.float64)
+        self.max_horas = np.asarray(max_horas, dtype=np.float64)
+        self.max_jornadas = np.asarray(max_jornadas, dtype=np.float64)
+        self.año = None
+        # año -> (horas, jornadas) de los años que no son el actual
+        self._otros_años = {}
+
+    def sembrar(self, ids, previo, año=None):
+        """
+        Parte del estado de ejecuciones anteriores: `previo` es un DataFrame
+        indexado por ID con Horas, Jornadas, Ultima_Fecha ('YYYY-MM-DD' o
+        vacía) y Racha, y una fila por año del plan si trae la columna Año
+        (sin ella, los contadores son los de `año`). Se alinea aquí con `ids`
+        (orden de los contadores) y deja `año` como año en curso.
+        """
+        if previo is not None and not previo.empty:
+            previo = previo.copy()
+            previo.index = previo.index.astype(str)
+            if "Año" not in previo:
+                previo["Año"] = año
+            posiciones = pd.Index(ids, dtype=object).astype(str).get_indexer(previo.index)
+            conocida_id = posiciones >= 0
+            previo, posiciones = previo[conocida_id], posiciones[conocida_id]
+            horas = previo["Horas"].fillna(0).to_numpy(dtype=np.float64)
+            jornadas = previo["Jornadas"].fillna(0).to_numpy(dtype=np.int32)
+            años_previo = previo["Año"].to_numpy()
+            for año_previo in pd.unique(años_previo):
+                del_año = años_previo == año_previo
+                contadores = (np.zeros_like(self.horas), np.zeros_like(self.jornadas))
+                np.add.at(contadores[0], posiciones[del_año], horas[del_año])
+                np.add.at(contadores[1], posiciones[del_año], jornadas[del_año])
+                self._otros_años[año_previo if año_previo is None else int(año_previo)] = contadores
+            # La racha y el último día no dependen del año: la primera fila de cada ID
+            primera = ~previo.index.duplicated()
+            previo, posiciones = previo[primera], posiciones[primera]
+            ultima = pd.to_datetime(previo["Ultima_Fecha"], format="%Y-%m-%d", errors="coerce")
+            conocida = ultima.notna().to_numpy()
+            self.ultimo_dia[posiciones[conocida]] = (ultima[conocida] - pd.Timestamp(0)).dt.days.to_numpy()
+            self.racha[posiciones[conocida]] = previo["Racha"].to_numpy()[conocida]
+        contadores = self._otros_años.pop(año, None)
+        if contadores is not None:
+            self.horas, self.jornadas = contadores
+        self.año = año
+
+    def cambiar_año(self, año):
+        """
+        Pasa a contar jornadas y horas de `año` (los topes son anuales): guarda
+        los contadores del año en curso y recupera los de `año`, o cero si aún
+        no tiene. La racha y el último día trabajado se mantienen.
+        """
+        if año == self.año:
+            return
+        if self.año is not None:
+            self._otros_años[self.año] = (self.horas, self.jornadas)
+        contadores = self._otros_años.pop(año, None)
+        if contadores is None:
+            contadores = (np.zeros_like(self.horas), np.zeros_like(self.jornadas))
+        self.horas, self.jornadas = contadores
+        self.año = año
+
+    def descartada(self, i, horas_turno):
+        """Tope anual de jornadas u horas alcanzado: no volverá a ser apta."""
+        return (self.jornadas[i] >= self.max_jornadas[i]
+                or self.horas[i] + horas_turno > self.max_horas[i])
+
+    def apta(self, i, dia):
+        """Días consecutivos y descanso de 12 h para una sola profesional."""
+        ultimo = self.ultimo_dia[i]
+        # Con un único turno por contrato, menos de 12 h entre turnos equivale
+        # a repetir día; los días se procesan en orden, basta con el último.
+        if ultimo == dia:
+            return False
+        # La racha previa solo cuenta si el último día trabajado fue ayer
+        return ultimo != dia - 1 or self.racha[i] + 1 < LIMITE_CONSECUTIVOS
+
+    def registrar(self, i, dia, horas_turno):
+        self.racha[i] = self.racha[i] + 1 if self.ultimo_dia[i] == dia - 1 else 1
+        self.ultimo_dia[i] = dia
+        self.jornadas[i] += 1
+        self.horas[i] += horas_turno
+
+    def motivo_no_apta(self, i, dia):
+        """Restricción por la que `apta(i, dia)` es falso (para el diagnóstico)."""
+        return "Descanso 12 h" if self.ultimo_dia[i] == dia else "Días consecutivos"
+
+    def motivo_descarte(self, i):
+        """Tope por el que `descartada(i, ...)` es cierto (para el diagnóstico)."""
+        return "Tope de jornadas" if self.jornadas[i] >= self.max_jornadas[i] else "Tope de horas"
+
+    def sumar(self, i, horas_turno):
+        """Cuenta un turno para los topes sin tocar la racha (asignaciones fuera de orden cronológico)."""
+        self.jornadas[i] += 1
+        self.horas[i] += horas_turno
+
+    def exportar(self, ids):
+        """
+        Estado en el formato que lee `sembrar` (DataFrame indexado por `ids`,
+        una fila por año con contadores), para continuar en otro tramo.
+        """
+        conocida = self.ultimo_dia != self.SIN_DIA
+        fechas = np.where(conocida, self.ultimo_dia, 0).astype("datetime64[D]").astype(str)
+        ultima = np.where(conocida, fechas, None)
+        por_año = dict(self._otros_años)
+        por_año[self.año] = (self.horas, self.jornadas)
+        indice = pd.Index(ids, dtype=object).astype(str)
+        return pd.concat([
+            pd.DataFrame({
+                "Año": año,
+                "Horas": horas,
+                "Jornadas": jornadas,
+                "Ultima_Fecha": ultima,
+                "Racha": self.racha,
+            }, index=indice)
+            for año, (horas, jornadas) in sorted(por_año.items(), key=lambda par: (par[0] is None, par[0] or 0))
+        ])
+
+
+class Diagnostico:
+    """
+    Instrumentación de una ejecución: tiempo de reloj por fase y, por cada
+    fila de demanda, contadores de COLUMNAS_DIAGNOSTICO (cuántas candidatas
+    descartó cada restricción). Los contadores son un array entero por
+    bloque de demanda que solo se toca al rechazar una candidata, así el
+    coste es despreciable y se puede dejar siempre activo.
+    Con `asignar_turnos_paralelo`, las fases de cada proceso se suman.
+    """
+
+    def __init__(self):
+        self.fases = {}
+        self._bloques = []
+
+    @contextmanager
+    def fase(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nombre] = self.fases.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def nuevo_bloque(self, demand):
+        """Contadores (filas de `demand` × COLUMNAS_DIAGNOSTICO) de una pasada de asignación."""
+        conteos = np.zeros((len(demand), len(COLUMNAS_DIAGNOSTICO)), dtype=np.int32)
+        self._bloques.append((demand[["Fecha", "Unidad", "Turno", "Personal_Requerido"]], conteos))
+        return conteos
+
+    def unir(self, otro):
+        for nombre, segundos in otro.fases.items():
+            self.fases[nombre] = self.fases.get(nombre, 0.0) + segundos
+        self._bloques += otro._bloques
+
+    def tiempos(self):
+        return pd.DataFrame({"Fase": list(self.fases), "Segundos": [round(s, 4) for s in self.fases.values()]})
+
+    def rechazos(self):
+        """Una fila por fila de demanda con sus contadores, en orden de fecha."""
+        bloques = [dem.astype({"Unidad": str, "Turno": str}).reset_index(drop=True)
+                   .join(pd.DataFrame(conteos, columns=COLUMNAS_DIAGNOSTICO))
+                   for dem, conteos in self._bloques]
+        if not bloques:
+            return pd.DataFrame(columns=["Fecha", "Unidad", "Turno", "Personal_Requerido"] + COLUMNAS_DIAGNOSTICO)
+        return pd.concat(bloques, ignore_index=True).sort_values("Fecha", kind="stable", ignore_index=True)
+
+    def informe(self):
+        """
+        Informe estructurado: {"Fases": tiempos, "Motivos": candidatas
+        rechazadas por restricción en total y en las filas que quedaron sin
+        cubrir, "Rechazos": contadores por fila de demanda}.
+        """
+        rechazos = self.rechazos()
+        requeridos = pd.to_numeric(rechazos["Personal_Requerido"], errors="coerce").fillna(0)
+        sin_cubrir = rechazos[rechazos["Asignadas"] < requeridos]
+        motivos = pd.DataFrame({
+            "Motivo": MOTIVOS_RECHAZO,
+            "Rechazos": rechazos[MOTIVOS_RECHAZO].sum().to_numpy(),
+            "Rechazos_en_filas_sin_cubrir": sin_cubrir[MOTIVOS_RECHAZO].sum().to_numpy(),
+        })
+        return {"Fases": self.tiempos(), "Motivos": motivos, "Rechazos": rechazos}
+
+
+class AsignacionCancelada(Exception):
+    """Se ha pedido cancelar la asignación en curso (ver `Avance.cancelar`)."""
+
+
+class Avance:
+    """
+    Progreso y cancelación de una asignación que se ejecuta en otro hilo. El
+    motor llama a `informar` al cambiar de día (o al terminar cada grupo de
+    unidades en paralelo) con la fracción hecha y los puestos demandados y
+    cubiertos desde el aviso anterior; otro hilo lee `fraccion`, `texto`,
+    `demandados`, `cubiertos` y `detalle` (filas de resumen por tramo).
+    Tras `cancelar`, el siguiente `informar` lanza AsignacionCancelada.
+    """
+
+    def __init__(self):
+        self.fraccion = 0.0
+        self.texto = ""
+        self.demandados = 0
+        self.cubiertos = 0
+        self.detalle = []
+        self._cancelada = threading.Event()
+        self._inicio, self._ancho = 0.0, 1.0
+
+    def cancelar(self):
+        self._cancelada.set()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    @contextmanager
+    def tramo(self, inicio, ancho):
+        """Dentro del bloque, las fracciones son de un tramo que ocupa [inicio, inicio + ancho] del actual."""
+        anterior = self._inicio, self._ancho
+        self._inicio, self._ancho = self._inicio + self._ancho * inicio, self._ancho * ancho
+        try:
+            yield self
+        finally:
+            self._inicio, self._ancho = anterior
+
+    def informar(self, fraccion, texto="", demandados=0, cubiertos=0):
+        if self._cancelada.is_set():
+            raise AsignacionCancelada()
+        self.fraccion = min(1.0, self._inicio + self._ancho * fraccion)
+        self.texto = texto
+        self.demandados += int(demandados)
+        self.cubiertos += int(cubiertos)
+
+
+def _fase(diagnostico, nombre):
+    return diagnostico.fase(nombre) if diagnostico is not None else nullcontext()
+
+
+def _tramo(avance, inicio, ancho):
+    return avance.tramo(inicio, ancho) if avance is not None else nullcontext()
+
+
+class SeleccionMenosHoras:
+    """
+    Estrategia de selección por defecto: en cada (unidad, turno) elige las
+    candidatas aptas con menos horas acumuladas y, a igualdad, por orden de
+    plantilla. Mantiene un montículo por grupo, así elegir k profesionales
+    cuesta O(k log n) en vez de ordenar el grupo entero en cada fila.
+    Para otro criterio basta con heredar y redefinir `clave`.
+    """
+
+    def __init__(self, indice, estado, codigos):
+        self.indice = indice
+        self.estado = estado
+        self.codigos = codigos
+        self._montones = {}
+
+    def clave(self, i):
+        return (float(self.estado.horas[self.codigos[i]]), i)
+
+    def elegir(self, grupo, req, apta, descartada, asignar):
+        """
+        Recorre las candidatas del grupo en orden de `clave` y llama a
+        `asignar(i)` con las que pasan `apta(i)` hasta cubrir `req`. Las que
+        cumplen `descartada(i)` (tope anual alcanzado) salen del grupo para
+        siempre. Devuelve cuántas se han asignado.
+        """
+        monton = self._montones.get(grupo)
+        if monton is None:
+            monton = [self.clave(i) for i in self.indice.get(grupo, ())]
+            heapq.heapify(monton)
+            self._montones[grupo] = monton
+
+        apartadas = []
+        asignadas = 0
+        while monton and not asignadas >= req:
+            entrada = heapq.heappop(monton)
+            i = entrada[-1]
+            actual = self.clave(i)
+            if actual != entrada:
+                # Clave desfasada (el ID también tiene turnos en otro grupo)
+                heapq.heappush(monton, actual)
+                continue
+            if descartada(i):
+                continue
+            if apta(i):
+                asignar(i)
+                asignadas += 1
+            apartadas.append(i)
+        for i in apartadas:
+            heapq.heappush(monton, self.clave(i))
+        return asignadas
+
+
+def normalizar_demanda(demand):
+    """Devuelve la demanda con `Fecha` en texto 'YYYY-MM-DD' y ordenada por fecha."""
+    demand = demand.copy()
+    demand["Fecha"] = pd.to_datetime(demand["Fecha"]).dt.strftime("%Y-%m-%d")
+    return demand.sort_values(by="Fecha", kind="stable")
+
+
+def asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas, estrategia=SeleccionMenosHoras,
+                   estado_previo=None, diagnostico=None, avance=None):
+    """
+    Asignación voraz día a día: para cada fila de demanda se eligen las
+    profesionales disponibles de la unidad y turno según `estrategia` (por
+    defecto, las de menos horas acumuladas), respetando jornadas máximas,
+    días consecutivos, descanso de 12 h y horas máximas. `estado_previo`
+    (ver `EstadoPlantilla.sembrar`) arrastra horas, jornadas y rachas de
+    planificaciones ya aprobadas. Los topes son anuales: si la demanda cruza
+    el 1 de enero, horas y jornadas vuelven a contar desde lo aprobado para el
+    año nuevo (la racha sigue). Con un `Diagnostico` se registran los
+    tiempos por fase y los rechazos por restricción; con un `Avance`, el
+    progreso día a día (y se puede cancelar). Devuelve (assignments,
+    uncovered) como listas de diccionarios.
+    """
+    assignments, uncovered, _, _ = _asignar(staff, normalizar_demanda(demand), staff_max_hours,
+                                            staff_max_jornadas, estrategia, estado_previo=estado_previo,
+                                            diagnostico=diagnostico, avance=avance)
+    return assignments, uncovered
+
+
+def _asignar(staff, demand, staff_max_hours, staff_max_jornadas, estrategia, propuesta=None,
+             estado_previo=None, diagnostico=None, avance=None, indice_plantilla=None):
+    """
+    Núcleo de `asignar_turnos` sobre una demanda ya normalizada. Además de
+    (assignments, uncovered) devuelve, para cada registro, la etiqueta de la
+    fila de demanda que lo originó, para poder fusionar resultados parciales.
+
+    `propuesta` (opcional) asocia etiquetas de fila de demanda con posiciones
+    de `staff` preferidas para esa fila: se asignan primero si siguen siendo
+    aptas y el resto de la fila se completa con `estrategia`.
+    `diagnostico` (opcional) es un `Diagnostico` donde se anotan tiempos y
+    rechazos; `avance` (opcional), un `Avance` al que se informa cada día.
+    `indice_plantilla` (opcional) es un `IndicePlantilla` ya construido para
+    `staff` y un rango que contiene la demanda; si no, se construye aquí.
+    """
+    assignments, uncovered = [], []
+    filas_assign, filas_uncov = [], []
+    if demand.empty:
+        return assignments, uncovered, filas_assign, filas_uncov
+
+    fechas_plan = pd.to_datetime(demand["Fecha"], format="%Y-%m-%d")
+    if indice_plantilla is None:
+        indice_plantilla = IndicePlantilla.construir(
+            staff, fechas_plan.min(), (fechas_plan.max() - fechas_plan.min()).days + 1, diagnostico)
+    elif not indice_plantilla.cubre(fechas_plan):
+        raise ValueError("La demanda tiene fechas fuera del rango del índice de la plantilla.")
+    indice, no_disponible = indice_plantilla.indice, indice_plantilla.no_disponible
+    codigos, ids, jornadas = indice_plantilla.codigos, indice_plantilla.ids, indice_plantilla.jornadas
+    dias_demanda = (fechas_plan - indice_plantilla.inicio).dt.days.to_numpy()
+    años_demanda = fechas_plan.dt.year.to_numpy()
+    epoca = (indice_plantilla.inicio - pd.Timestamp(0)).days
+
+    with _fase(diagnostico, "estado_inicial"):
+        estado = EstadoPlantilla([staff_max_hours[i] for i in ids], [staff_max_jornadas[i] for i in ids])
+        estado.sembrar(ids, estado_previo, año=int(años_demanda[0]))
+        seleccion = estrategia(indice, estado, codigos)
+    conteos = diagnostico.nuevo_bloque(demand) if diagnostico is not None else None
+    conteo = None
+    # Por grupo: candidatas que salieron del montículo por un tope anual y
+    # cuántas por motivo; siguen contando como rechazo en las filas siguientes
+    retiradas = {}
+    n_filas = len(demand)
+    dia_anterior, fecha_anterior, demandados, cubiertos = None, None, 0, 0
+
+    with _fase(diagnostico, "asignacion"):
+        for k, (dia, año, fila, dem) in enumerate(zip(dias_demanda, años_demanda, demand.index,
+                                                       demand.itertuples(index=False))):
+            if año != estado.año:
+                # Año nuevo: los topes vuelven a empezar y las retiradas por tope vuelven a ser candidatas
+                estado.cambiar_año(int(año))
+                seleccion = estrategia(indice, estado, codigos)
+                retiradas = {}
+            fecha = dem.Fecha
+            unidad = dem.Unidad
+            turno = dem.Turno
+            req = dem.Personal_Requerido
+            assigned_count = 0
+            dia_abs = epoca + dia
+            if avance is not None and dia != dia_anterior:
+                if dia_anterior is not None:
+                    avance.informar(k / n_filas, fecha_anterior, demandados, cubiertos)
+                dia_anterior, fecha_anterior, demandados, cubiertos = dia, fecha, 0, 0
+            if conteos is not None:
+                conteo = conteos[k]
+                conteo[_COLUMNA_DIAGNOSTICO["Candidatas"]] = len(indice.get((unidad, turno), ()))
+
+            if (unidad, turno) in indice:
+                horas_turno = SHIFT_HOURS[turno]
+                retiradas_grupo, motivos_retiradas = retiradas.setdefault((unidad, turno), (set(), {}))
+                if conteo is not None:
+                    for motivo, n in motivos_retiradas.items():
+                        conteo[_COLUMNA_DIAGNOSTICO[motivo]] += n
+                asignadas_propuesta = set()
+
+                def apta(i, contar=True):
+                    if i in asignadas_propuesta:
+                        return False  # ya asignada en esta fila: no es un rechazo
+                    if no_disponible[i, dia]:
+                        if conteo is not None and contar:
+                            conteo[_COLUMNA_DIAGNOSTICO["No disponible"]] += 1
+                        return False
+                    if estado.apta(codigos[i], dia_abs):
+                        return True
+                    if conteo is not None and contar:
+                        conteo[_COLUMNA_DIAGNOSTICO[estado.motivo_no_apta(codigos[i], dia_abs)]] += 1
+                    return False
+
+                def descartada(i):
+                    if not estado.descartada(codigos[i], horas_turno):
+                        return False
+                    # El tope es definitivo: se cuenta una vez aquí y luego en cada fila del grupo
+                    if conteo is not None and i not in retiradas_grupo:
+                        motivo = estado.motivo_descarte(codigos[i])
+                        retiradas_grupo.add(i)
+                        motivos_retiradas[motivo] = motivos_retiradas.get(motivo, 0) + 1
+                        conteo[_COLUMNA_DIAGNOSTICO[motivo]] += 1
+                    return True
+
+                def asignar(i):
+                    assignments.append({
+                        "Fecha": fecha,
+                        "Unidad": unidad,
+                        "Turno": turno,
+                        "ID_Enfermera": ids[codigos[i]],
+                        "Jornada": jornadas[i],
+                        "Horas": horas_turno,
+                    })
+                    filas_assign.append(fila)
+                    estado.registrar(codigos[i], dia_abs, horas_turno)
+
+                if propuesta:
+                    # Las propuestas que no sirven se cuentan cuando `elegir` llega a ellas
+                    for i in propuesta.get(fila, ()):
+                        if assigned_count >= req: break
+                        if apta(i, contar=False) and not descartada(i):
+                            asignar(i)
+                            asignadas_propuesta.add(i)
+                            assigned_count += 1
+                assigned_count += seleccion.elegir((unidad, turno), req - assigned_count, apta, descartada, asignar)
+            if conteo is not None:
+                conteo[_COLUMNA_DIAGNOSTICO["Asignadas"]] = assigned_count
+            if avance is not None:
+                demandados += max(int(req), 0)
+                cubiertos += assigned_count
+            if assigned_count < req:
+                uncovered.append({"Fecha": fecha, "Unidad": unidad, "Turno": turno, "Faltan": req - assigned_count})
+                filas_uncov.append(fila)
+        if avance is not None:
+            avance.informar(1.0, fecha_anterior, demandados, cubiertos)
+
+    return assignments, uncovered, filas_assign, filas_uncov
+
+
+def agrupar_unidades(staff):
+    """
+    Reparte las unidades en grupos independientes: dos unidades van juntas
+    si comparten algún ID de profesional (comparten sus contadores). Sin IDs
+    repetidos entre unidades, cada unidad es su propio grupo. Las filas sin
+    unidad no cuentan: no son candidatas de ninguna demanda.
+    """
+    padre = {}
+
+    def raiz(u):
+        while padre.setdefault(u, u) != u:
+            padre[u] = padre[padre[u]]
+            u = padre[u]
+        return u
+
+    # Sin unidad (NaN) la búsqueda de la raíz no terminaría: NaN != NaN
+    staff = staff.dropna(subset=["Unidad_Asignada"])
+    for unidades in staff.groupby("ID", sort=False)["Unidad_Asignada"].unique():
+        for u in unidades[1:]:
+            padre[raiz(u)] = raiz(unidades[0])
+        raiz(unidades[0])
+
+    grupos = {}
+    for u in padre:
+        grupos.setdefault(raiz(u), []).append(u)
+    return list(grupos.values())
+
+
+def _filtrar_previo(estado_previo, ids):
+    """Filas de `estado_previo` de un grupo de IDs (lo que se envía a cada proceso)."""
+    if estado_previo is None:
+        return None
+    return estado_previo[estado_previo.index.isin([str(i) for i in ids])]
+
+
+def _asignar_tramo(*args):
+    """`_asignar` en otro proceso; devuelve también su `Diagnostico` (último argumento), que no vuelve solo."""
+    return _asignar(*args), args[-1]
+
+
+def asignar_turnos_paralelo(staff, demand, staff_max_hours, staff_max_jornadas,
+                            estrategia=SeleccionMenosHoras, max_workers=None, estado_previo=None,
+                            diagnostico=None, avance=None):
+    """
+    Igual que `asignar_turnos`, pero resuelve cada grupo de unidades
+    independiente (ver `agrupar_unidades`) en un proceso aparte y fusiona los
+    resultados en el mismo orden que la ejecución en serie. El progreso se
+    informa al terminar cada grupo; al cancelar, los grupos pendientes no se
+    llegan a empezar.
+    """
+    demand = normalizar_demanda(demand).reset_index(drop=True)
+    grupos = agrupar_unidades(staff)
+    max_workers = min(max_workers or os.cpu_count() or 1, len(grupos))
+    if max_workers <= 1 or len(grupos) <= 1:
+        assignments, uncovered, _, _ = _asignar(staff, demand, staff_max_hours, staff_max_jornadas, estrategia,
+                                                estado_previo=estado_previo, diagnostico=diagnostico, avance=avance)
+        return assignments, uncovered
+
+    tramos = []
+    for unidades in grupos:
+        staff_grupo = staff[staff["Unidad_Asignada"].isin(unidades)]
+        demand_grupo = demand[demand["Unidad"].isin(unidades)]
+        if demand_grupo.empty:
+            continue
+        ids = set(staff_grupo["ID"])
+        tramos.append((staff_grupo, demand_grupo,
+                       {k: v for k, v in staff_max_hours.items() if k in ids},
+                       {k: v for k, v in staff_max_jornadas.items() if k in ids},
+                       estrategia, None, _filtrar_previo(estado_previo, ids),
+                       Diagnostico() if diagnostico is not None else None))
+    # La demanda de unidades sin plantilla no tiene candidatas: queda sin cubrir
+    resto = demand[~demand["Unidad"].isin(staff["Unidad_Asignada"].dropna())]
+    if not resto.empty:
+        tramos.append((staff.iloc[0:0], resto, {}, {}, estrategia, None, None,
+                       Diagnostico() if diagnostico is not None else None))
+
+    with _fase(diagnostico, "procesos"), ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futuros = {pool.submit(_asignar_tramo, *tramo): k for k, tramo in enumerate(tramos)}
+        resultados = [None] * len(tramos)
+        try:
+            for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                resultado, diagnostico_tramo = futuro.result()
+                resultados[futuros[futuro]] = resultado
+                if diagnostico is not None:
+                    diagnostico.unir(diagnostico_tramo)
+                if avance is not None:
+                    demanda_tramo = tramos[futuros[futuro]][1]["Personal_Requerido"]
+                    avance.informar(hechos / len(tramos), f"{hechos}/{len(tramos)} grupos de unidades",
+                                    pd.to_numeric(demanda_tramo, errors="coerce").clip(lower=0).sum(),
+                                    len(resultado[0]))
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    # Fusión estable por fila de demanda: mismo orden que en serie
+    assignments = [a for _, a in sorted(
+        ((fila, a) for r in resultados for a, fila in zip(r[0], r[2])), key=lambda x: x[0])]
+    uncovered = [u for _, u in sorted(
+        ((fila, u) for r in resultados for u, fila in zip(r[1], r[3])), key=lambda x: x[0])]
+    return assignments, uncovered
+
+
+def estado_tras_asignaciones(assignments, estado_previo=None):
+    """
+    Estado (formato de `EstadoPlantilla.sembrar`) que resulta de aplicar
+    `assignments`, en orden cronológico, sobre `estado_previo`: así el tramo
+    siguiente de una planificación continúa con las horas, jornadas y rachas
+    del anterior. Horas y jornadas se llevan por año: al cruzar el 1 de enero
+    el tramo siguiente empieza con los topes del año nuevo.
+    """
+    if not assignments:
+        return estado_previo
+    ids = pd.Index([], dtype=object) if estado_previo is None else estado_previo.index.astype(str).unique()
+    ids = ids.union(pd.Index([str(a["ID_Enfermera"]) for a in assignments], dtype=object).unique())
+    posiciones = ids.get_indexer([str(a["ID_Enfermera"]) for a in assignments])
+    fechas = pd.to_datetime([a["Fecha"] for a in assignments], format="%Y-%m-%d")
+    dias = (fechas - pd.Timestamp(0)).days.to_numpy()
+    años = fechas.year.to_numpy()
+    horas = np.array([a["Horas"] for a in assignments], dtype=np.float64)
+    orden = np.argsort(dias, kind="stable")
+    estado = EstadoPlantilla(np.zeros(len(ids)), np.zeros(len(ids)))
+    estado.sembrar(ids, estado_previo, año=int(años[orden[0]]))
+    for k in orden:
+        if años[k] != estado.año:
+            estado.cambiar_año(int(años[k]))
+        estado.registrar(posiciones[k], dias[k], horas[k])
+    return estado.exportar(ids)
+
+
+def acumulado_del_año(estado_previo, año):
+    """Horas y Jornadas de `estado_previo` en `año`, una fila por ID (vacío si no hay estado)."""
+    if estado_previo is None or estado_previo.empty:
+        return pd.DataFrame({"Horas": [], "Jornadas": []}, index=pd.Index([], dtype=object))
+    if "Año" in estado_previo:
+        estado_previo = estado_previo[estado_previo["Año"] == año]
+    acumulado = estado_previo[["Horas", "Jornadas"]]
+    return acumulado.groupby(acumulado.index.astype(str)).sum()
+
+
+def asignar_por_meses(staff, demand, staff_max_hours, staff_max_jornadas, asignar=None, estado_previo=None,
+                      avance=None, **kwargs):
+    """
+    Planificación por tramos mensuales: resuelve la demanda mes a mes con
+    `asignar` (por defecto `asignar_turnos_paralelo`; admite cualquier función
+    con la firma de `asignar_turnos`) y pasa a cada mes el estado en que dejó
+    el anterior. Es un generador de (mes 'YYYY-MM', assignments, uncovered):
+    quien lo recorre puede guardar cada mes en cuanto termina y no acumular
+    todo el horizonte en memoria. Con el motor voraz el resultado es el mismo
+    que planificando todo el rango de una vez. `avance` recibe el progreso
+    de cada mes como parte del total.
+    """
+    asignar = asignar or asignar_turnos_paralelo
+    demand = normalizar_demanda(demand)
+    meses = demand.groupby(demand["Fecha"].str[:7], sort=True)
+    for k, (mes, demanda_mes) in enumerate(meses):
+        with _tramo(avance, k / meses.ngroups, 1 / meses.ngroups):
+            assignments, uncovered = asignar(staff, demanda_mes, staff_max_hours, staff_max_jornadas,
+                                             estado_previo=estado_previo, avance=avance, **kwargs)
+        with _fase(kwargs.get("diagnostico"), "estado_entre_meses"):
+            estado_previo = estado_tras_asignaciones(assignments, estado_previo)
+        yield mes, assignments, uncovered
+
+
+def calcular_resumen_mensual(df_assign):
+    """Horas y jornadas asignadas por profesional, unidad, turno, jornada, año y mes."""
+    fechas = pd.to_datetime(df_assign["Fecha"])
+    return (df_assign.assign(Año=fechas.dt.year, Mes=fechas.dt.month)
+            .groupby(["ID_Enfermera", "Unidad", "Turno", "Jornada", "Año", "Mes"])
+            .agg(Horas_Asignadas=("Horas", "sum"),
+                 Jornadas_Asignadas=("Fecha", "count"))
+            .reset_index()
+            .rename(columns={"ID_Enfermera": "ID"}))
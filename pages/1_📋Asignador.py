@@ -1,100 +1,220 @@
 import streamlit as st
 import pandas as pd
 import ast
+import hashlib
 from datetime import datetime, timedelta, date
-from io import BytesIO
 from db_manager import (
-    init_db, guardar_asignaciones, guardar_resumen_mensual,
-    descargar_bd_desde_drive, subir_bd_a_drive, reset_db
+    preparar_bd, guardar_aprobacion, cargar_asignaciones_periodo, cargar_estado_previo, subir_bd_a_drive, reset_db,
+    nuevo_borrador, guardar_tramo_borrador, cargar_borrador, aprobar_borrador, descartar_borrador, usa_bd
 )
+from motor_asignacion import (
+    COLUMNAS_ASIGNACION, LIMITE_CONSECUTIVOS, AsignacionCancelada, Avance, Diagnostico, asignar_por_meses,
+    asignar_turnos_paralelo, calcular_resumen_mensual
+)
+from utils.compacto import compactar, expandir
+from utils.demanda import DIAS_SEMANA, TURNOS, construir_demanda
+from utils.excel_utils import boton_descarga, formatos_disponibles
+from utils.plantilla import COLUMNAS_DEMANDA, leer_tabla, preparar_plantilla
+from utils.tareas import Tarea
 
 #Definir funciones necesarias
-def to_excel_bytes(df):
-    #Convierte DataFrame a bytes para descarga en Excel
-    if df is None or df.empty:
-        return b''  # Retorna bytes vacíos si no hay datos
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False)
-    return output.getvalue()
-
-def parse_dates(cell):
+@st.cache_data(max_entries=8, show_spinner="Procesando plantilla de personal...")
+def cargar_plantilla(huella, _contenido):
     """
-    Parsea fechas de no disponibilidad en varios formatos a lista de strings 'YYYY-MM-DD'.
-    Maneja todos los casos posibles de forma segura.
+    Lee, valida y parsea la plantilla de personal y calcula sus límites de
+    horas y jornadas. Se cachea por la huella SHA-256 del archivo (`huella`),
+    así las recargas de la página por cualquier widget no vuelven a procesar
+    el mismo Excel; se conservan las últimas plantillas distintas.
+    Devuelve (staff, staff_max_hours, staff_max_jornadas, avisos_carga,
+    avisos_limites); staff es None si faltan columnas.
     """
-    def safe_str_convert(value):
-        """Conversión segura a string"""
-        try:
-            return str(value).strip()
-        except:
-            return ""
-    def try_parse_date(date_str):
-        """Intenta parsear una fecha en múltiples formatos"""
-        date_str = safe_str_convert(date_str)
-        for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
-            try:
-                return datetime.strptime(date_str, fmt).date()
-            except ValueError:
-                continue
-        return None
-    # Caso 1: Valor es None, NaN, vacío o cualquier tipo inesperado
-    try:
-        if pd.isna(cell) or cell is None or not safe_str_convert(cell):
-            return []
-    except Exception:
-        return []
-    # Caso 2: Si ya es una lista válida
-    if isinstance(cell, list):
-        try:
-            return sorted(list(set(cell)))  # Eliminar duplicados y ordenar
-        except:
-            return []
-    # Procesamiento principal
-    dates = set()
-    content = safe_str_convert(cell)
+    return preparar_plantilla(leer_tabla(_contenido))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cargar_demanda(huella, _contenido):
+    #Demanda desde Excel, cacheada por la huella SHA-256 del archivo
+    return leer_tabla(_contenido)
+
+def mostrar_avisos(avisos):
+    for tipo, mensaje in avisos:
+        if tipo == "error":
+            st.error(mensaje)
+        elif tipo == "info":
+            st.info(mensaje)
+        else:
+            st.warning(mensaje)
+
+def resultado_asignacion():
+    """
+    (asignaciones, sin cubrir) compactas (ver `utils.compacto`) de la última
+    ejecución: de la sesión o, si se planificó por meses, del borrador.
+    """
+    borrador = st.session_state.get("borrador")
+    if borrador is None:
+        return st.session_state["df_assign"], st.session_state.get("df_uncov")
+    df_assign, df_uncov = cargar_borrador(borrador)
+    return compactar(df_assign), (None if df_uncov.empty else compactar(df_uncov))
+
+def olvidar_borrador():
+    # El borrador de la ejecución anterior ya no se va a aprobar
+    if st.session_state.get("borrador") is not None:
+        descartar_borrador(st.session_state["borrador"])
+        st.session_state["borrador"] = None
+
+# En segundo plano: mientras se ejecutan, la sincronización no sustituye la base de datos
+@usa_bd
+def ejecutar_asignacion(staff, demand, staff_max_hours, staff_max_jornadas, modo_asignacion, por_meses, avance,
+                        cubrir_todo=False):
+    """
+    Cálculo completo de una ejecución, pensado para `utils.tareas.Tarea`: no
+    usa `st.*` y devuelve el diccionario que se guarda en la sesión. El
+    avance (fracción, coberturas y, por meses, una fila por mes terminado) se
+    publica en `avance`; si se cancela, el borrador a medias se descarta y se
+    propaga `AsignacionCancelada`.
+    """
+    # Los motores de flujo y reparación solo se importan al ejecutar, no al abrir la página
+    from flujo_asignacion import asignar_turnos_flujo, comparar_cobertura
+    from reparacion_asignacion import reparar_asignacion
+
+    # Tiempos por fase y candidatas rechazadas por cada restricción
+    diagnostico = Diagnostico()
+    avisos = []
+
+    # Horas y jornadas del año ya aprobadas y rachas que vienen del periodo anterior
+    fechas_planificadas = pd.to_datetime(demand["Fecha"])
+    unidades_planificadas = demand["Unidad"].dropna().unique().tolist()
+    with diagnostico.fase("estado_previo"):
+        estado_previo = cargar_estado_previo(fechas_planificadas.min(), fechas_planificadas.max(),
+                                             unidades_planificadas)
+
+    cambios_reparacion = comparativa_cobertura = borrador = None
     try:
-        # Caso 3: Timestamp de pandas (ej: '2025-04-14 00:00:00')
-        if " " in content and "-" in content and ":" in content:
-            try:
-                date_part = content.split(" ")[0]
-                date_obj = datetime.strptime(date_part, "%Y-%m-%d").date()
-                return [date_obj.strftime("%Y-%m-%d")]
-            except:
-                pass
-        # Dividir por comas y procesar cada parte
-        parts = [part.strip() for part in content.split(",") if part.strip()]
-        for part in parts:
-            # Manejar rangos (contiene '-')
-            if "-" in part:
-                range_parts = part.split("-")
-                if len(range_parts) == 2:
-                    start, end = map(safe_str_convert, range_parts)
-                    start_date = try_parse_date(start)
-                    end_date = try_parse_date(end)
-                    if start_date and end_date:
-                        if start_date > end_date:
-                            st.warning(f"Rango inválido: {start} > {end}")
-                            continue
-                        current = start_date
-                        while current <= end_date:
-                            dates.add(current.strftime("%Y-%m-%d"))
-                            current += timedelta(days=1)
-                    else:
-                        st.warning(f"Formato no reconocido en rango: '{part}'")
-                else:
-                    st.warning(f"Formato de rango inválido: '{part}'")
-            # Fecha individual
-            else:
-                date_obj = try_parse_date(part)
-                if date_obj:
-                    dates.add(date_obj.strftime("%Y-%m-%d"))
-                else:
-                    st.warning(f"Formato de fecha no reconocido: '{part}'")
-        return sorted(list(dates))
-    except Exception as e:
-        st.error(f"Error procesando: '{content}'. Se omitirá esta entrada.")
-        return []
+        if modo_asignacion == "Reparar planificación aprobada":
+            with diagnostico.fase("carga_aprobadas"):
+                previas = cargar_asignaciones_periodo(fechas_planificadas.min(), fechas_planificadas.max(),
+                                                      unidades_planificadas)
+                # Lo aprobado justo después del periodo limita las rachas del final
+                fin_periodo = fechas_planificadas.max()
+                posteriores = cargar_asignaciones_periodo(fin_periodo + pd.Timedelta(days=1),
+                                                          fin_periodo + pd.Timedelta(days=LIMITE_CONSECUTIVOS))
+            if previas.empty:
+                avisos.append(("info", "🛈 No hay planificación aprobada para estas fechas y unidades: se asignan todos los turnos."))
+            with diagnostico.fase("reparacion"):
+                assignments, uncovered, cambios = reparar_asignacion(staff, demand, previas, staff_max_hours,
+                                                                     staff_max_jornadas, estado_previo=estado_previo,
+                                                                     posteriores=posteriores, diagnostico=diagnostico,
+                                                                     avance=avance, cubrir_todo=cubrir_todo)
+            cambios_reparacion = compactar(cambios)
+        elif por_meses:
+            # Cada mes parte del estado en que dejó el anterior y se guarda en el
+            # borrador en cuanto termina: en memoria solo queda el resumen
+            motor = asignar_turnos_flujo if modo_asignacion == "Flujo de coste mínimo" else asignar_turnos_paralelo
+            borrador = nuevo_borrador()
+            resumenes = []
+            for mes, assignments, uncovered in asignar_por_meses(
+                    staff, demand, staff_max_hours, staff_max_jornadas, asignar=motor, estado_previo=estado_previo,
+                    diagnostico=diagnostico, avance=avance):
+                df_mes = pd.DataFrame(assignments, columns=COLUMNAS_ASIGNACION)
+                with diagnostico.fase("guardado_borrador"):
+                    guardar_tramo_borrador(borrador, df_mes, pd.DataFrame(uncovered))
+                with diagnostico.fase("resumen_mensual"):
+                    resumenes.append(calcular_resumen_mensual(df_mes))
+                avance.detalle.append({"Mes": mes, "Turnos asignados": len(df_mes),
+                                       "Personal sin cubrir": sum(u["Faltan"] for u in uncovered)})
+        elif modo_asignacion == "Flujo de coste mínimo":
+            assignments, uncovered = asignar_turnos_flujo(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                          estado_previo=estado_previo, diagnostico=diagnostico,
+                                                          avance=avance)
+            with diagnostico.fase("comparativa_voraz"):
+                comparativa_cobertura = comparar_cobertura(
+                    staff, demand, staff_max_hours, staff_max_jornadas, resultado_flujo=(assignments, uncovered),
+                    estado_previo=estado_previo)
+        else:
+            # Cada unidad se resuelve en su propio proceso; el resultado es el mismo que en serie
+            assignments, uncovered = asignar_turnos_paralelo(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                             estado_previo=estado_previo, diagnostico=diagnostico,
+                                                             avance=avance)
+    except AsignacionCancelada:
+        if borrador is not None:
+            descartar_borrador(borrador)
+        raise
+
+    resultado = {
+        "asignacion_completada": True,
+        "borrador": borrador,
+        "cambios_reparacion": cambios_reparacion,
+        "comparativa_cobertura": comparativa_cobertura,
+        "avisos_asignacion": avisos,
+        # Periodo y unidades que sustituye la aprobación en el histórico
+        "periodo_planificado": (fechas_planificadas.min(), fechas_planificadas.max()),
+        "unidades_planificadas": unidades_planificadas
+    }
+
+    # En la sesión las tablas se guardan compactas (códigos y días enteros);
+    # se pasan a texto solo al mostrarlas o exportarlas
+    if borrador is None:
+        df_assign = pd.DataFrame(assignments, columns=COLUMNAS_ASIGNACION)
+        with diagnostico.fase("resumen_mensual"):
+            resumen_mensual = calcular_resumen_mensual(df_assign)
+        resultado.update({
+            "df_assign": compactar(df_assign),
+            "df_uncov": compactar(pd.DataFrame(uncovered)) if uncovered else None,
+            "resumen_mensual": compactar(resumen_mensual),
+        })
+    else:
+        resultado.update({
+            "df_assign": None,
+            "df_uncov": None,
+            "resumen_mensual": compactar(pd.concat(resumenes, ignore_index=True)),
+        })
+    informe = diagnostico.informe()
+    resultado["diagnostico"] = {**informe, "Rechazos": compactar(informe["Rechazos"])}
+    return resultado
+
+@usa_bd
+def ejecutar_escenarios(staff, escenarios, staff_max_hours, staff_max_jornadas, avance):
+    """
+    Comparativa de variantes de demanda para `utils.tareas.Tarea` (sin
+    `st.*`). Como una ejecución normal, parte de lo ya aprobado en la base
+    de datos; devuelve lo que se guarda en la sesión.
+    """
+    from escenarios_asignacion import comparar_escenarios
+
+    fechas = pd.to_datetime(pd.concat([d["Fecha"] for d in escenarios.values()], ignore_index=True))
+    unidades = pd.concat([d["Unidad"].dropna().astype(str) for d in escenarios.values()]).unique().tolist()
+    estado_previo = cargar_estado_previo(fechas.min(), fechas.max(), unidades)
+    comparativa, _ = comparar_escenarios(staff, escenarios, staff_max_hours, staff_max_jornadas,
+                                         estado_previo=estado_previo, avance=avance)
+    return {"comparativa_escenarios": comparativa}
+
+@st.fragment(run_every=1)
+def seguir_tarea():
+    """
+    Avance de la ejecución en segundo plano; se refresca cada segundo sin
+    recargar el resto de la página. Al terminar guarda el resultado (o el
+    motivo de que no lo haya) en la sesión y recarga la página completa.
+    """
+    tarea = st.session_state.get("tarea_asignacion")
+    if tarea is None:
+        return
+    if tarea.en_curso:
+        avance = tarea.avance
+        texto = avance.texto or "Preparando la asignación…"
+        if avance.demandados:
+            texto += f" · cobertura {avance.cubiertos / avance.demandados:.1%}"
+        st.progress(min(avance.fraccion, 1.0), text=texto)
+        if avance.detalle:
+            st.dataframe(pd.DataFrame(avance.detalle), hide_index=True)
+        st.button("⏹️ Cancelar asignación", on_click=tarea.cancelar, disabled=avance.cancelada)
+        return
+    del st.session_state["tarea_asignacion"]
+    if tarea.cancelada:
+        st.session_state["fin_tarea"] = ("warning", "⏹️ Asignación cancelada: no se ha guardado ningún resultado.")
+    elif tarea.error is not None:
+        st.session_state["fin_tarea"] = ("error", f"❌ Error en la asignación: {tarea.error}")
+    else:
+        st.session_state.update(tarea.resultado)
+    st.rerun()
 
 def generar_plantilla_ejemplo():
     data = {
@@ -110,11 +230,8 @@ def generar_plantilla_ejemplo():
     return pd.DataFrame(data)
 
 #Inicialización de variables
-SHIFT_HOURS = {"Mañana": 7.5, "Tarde": 7.5, "Noche": 10}
-BASE_MAX_HOURS = {"Mañana": 1642.5, "Tarde": 1642.5, "Noche": 1470}
-BASE_MAX_JORNADAS = {"Mañana": 219, "Tarde": 219, "Noche": 147}
-dias_semana = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-turnos = ["Mañana", "Tarde", "Noche"]
+dias_semana = DIAS_SEMANA
+turnos = TURNOS
 
 
 #Títulos y descripción
@@ -136,8 +253,9 @@ st.markdown("""
 
 #Carga BBDD
 FILE_ID = "1zqAyIB1BLfCc2uH1v29r-clARHoh2o_s"
-descargar_bd_desde_drive(FILE_ID)
-init_db()
+if "bd_sincronizada" not in st.session_state:
+    preparar_bd(FILE_ID)
+    st.session_state["bd_sincronizada"] = True
 
 #Comprobar estado para conservar el de la sesión anterior.
 if "asignacion_completada" not in st.session_state:
@@ -145,7 +263,8 @@ if "asignacion_completada" not in st.session_state:
         "asignacion_completada": False,
         "df_assign": None,
         "file_staff": None,
-        "df_uncov": None
+        "df_uncov": None,
+        "borrador": None
     })
 
 if "file_staff" not in st.session_state:
@@ -159,44 +278,18 @@ file_staff = st.sidebar.file_uploader(
     help="""La columna 'Fechas_No_Disponibilidad' puede contener fechas individuales (20/07/2025), rangos (01/02/2025-10/02/2025) o combinaciones de ambas separadas por comas (01/07/2025-15/07/2025, 12/10/2025)"""
 )
 
-if st.sidebar.download_button(
-    label="📥 Ejemplo de plantilla",
-    data=to_excel_bytes(generar_plantilla_ejemplo()),
-    file_name="Plantilla_Turnos_Ejemplo.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    use_container_width=False  # Esto hace el botón más pequeño
-):
-    pass  # Para que no aparezca "None" en el sidebar
+with st.sidebar:
+    boton_descarga("📥 Ejemplo de plantilla", generar_plantilla_ejemplo, "Plantilla_Turnos_Ejemplo")
 
 if file_staff:
     st.session_state["file_staff"] = file_staff
-    staff = pd.read_excel(file_staff)
-    staff.columns = staff.columns.str.strip()
-
-    # Validar columnas requeridas
-    required_columns = ["ID", "Unidad_Asignada", "Jornada", "Turno_Contrato", "Fechas_No_Disponibilidad"]
-    if not all(col in staff.columns for col in required_columns):
-        missing = [col for col in required_columns if col not in staff.columns]
-        st.error(f"Faltan columnas requeridas: {', '.join(missing)}")
+    contenido_staff = file_staff.getvalue()
+    staff, staff_max_hours, staff_max_jornadas, avisos_carga, avisos_limites = cargar_plantilla(
+        hashlib.sha256(contenido_staff).hexdigest(), contenido_staff)
+    mostrar_avisos(avisos_carga)
+    if staff is None:
         st.stop()
 
-    # Limpieza y validación de datos
-    staff = staff.dropna(subset=["ID", "Turno_Contrato"])  # Eliminar filas sin ID o Turno
-    #Normalización de valores
-    staff["Turno_Contrato"] = staff["Turno_Contrato"].astype(str).str.strip().str.capitalize()
-    staff["Jornada"] = staff["Jornada"].astype(str).str.strip().str.capitalize()
-    
-    # Validar valores aceptados
-    valid_turnos = ["Mañana", "Tarde", "Noche"]
-    invalid_turnos = staff[~staff["Turno_Contrato"].isin(valid_turnos)]
-    
-    if not invalid_turnos.empty:
-        st.warning(f"Se encontraron turnos no válidos: {invalid_turnos['Turno_Contrato'].unique()}")
-        staff = staff[staff["Turno_Contrato"].isin(valid_turnos)]  # Filtrar solo turnos válidos
-    
-    # Procesar fechas
-    staff["Fechas_No_Disponibilidad"] = staff["Fechas_No_Disponibilidad"].apply(parse_dates)
-
     #MOSTRAR EJEMPLO DE PARSING
     sample = staff["Fechas_No_Disponibilidad"].iloc[0] if not staff.empty else []
     #st.sidebar.markdown(f"🔍 **Ejemplo de fechas parseadas:**\n`{sample}`")
@@ -210,8 +303,8 @@ demand = None
 if metodo == "Desde Excel":
     file_demand = st.sidebar.file_uploader("Demanda de turnos (.xlsx)", type=["xlsx"])
     if file_demand:
-        demand = pd.read_excel(file_demand)
-        demand.columns = demand.columns.str.strip()
+        contenido_demand = file_demand.getvalue()
+        demand = cargar_demanda(hashlib.sha256(contenido_demand).hexdigest(), contenido_demand)
         st.subheader("📆 Demanda desde archivo")
         st.dataframe(demand)
 elif metodo == "Desde aplicación":
@@ -220,8 +313,6 @@ elif metodo == "Desde aplicación":
     col1, col2 = st.columns(2)
     fecha_inicio = col1.date_input("Fecha de inicio", value=date(2025, 1, 1))
     fecha_fin = col2.date_input("Fecha de fin", value=date(2025, 1, 31))
-    fechas = [fecha_inicio + timedelta(days=i) for i in range((fecha_fin - fecha_inicio).days + 1)]
-    
     #Aviso rango de fechas erróneo
     if fecha_fin <= fecha_inicio:
         st.warning("⚠️ La fecha fin debe ser posterior a la fecha inicio.")
@@ -237,178 +328,109 @@ elif metodo == "Desde aplicación":
             demanda_por_dia[dia][turno] = cols[i].number_input(
                 label=f"{turno}", min_value=0, max_value=20, value=valor_default, key=f"{dia}_{turno}"
              )
-    demanda = []
-    for fecha in fechas:
-        dia_cast = dias_semana[fecha.weekday()]
-        for turno in turnos:
-             demanda.append({
-                 "Fecha": fecha.isoformat(),
-                 "Unidad": unidad,
-                 "Turno": turno,
-                 "Personal_Requerido": demanda_por_dia[dia_cast][turno]
-             })
-    demand = pd.DataFrame(demanda)
+    demand = construir_demanda({unidad: demanda_por_dia}, fecha_inicio, fecha_fin)
 
 #Ejecutar asignación
-if file_staff is not None and st.button("3️⃣🚀 Ejecutar asignación"):
-    TURNOS_VALIDOS = {
-    "Mañana": {"horas": 1642.5, "jornadas": 219},
-    "Tarde": {"horas": 1642.5, "jornadas": 219},
-    "Noche": {"horas": 1470, "jornadas": 147}
-    }
-    # Modificar la creación de staff_max_hours y staff_max_jornadas
-    staff_max_hours = {}
-    staff_max_jornadas = {}
-    for _, row in staff.iterrows():
-        try:
-            turno = str(row.Turno_Contrato).strip()
-            jornada = str(row.Jornada).strip() if pd.notna(row.Jornada) else "Completa"
-        
-            # Validar y obtener valores para el turno
-            if turno in TURNOS_VALIDOS:
-                factor = 0.8 if jornada == "Parcial" else 1
-                staff_max_hours[row.ID] = TURNOS_VALIDOS[turno]["horas"] * factor
-                staff_max_jornadas[row.ID] = TURNOS_VALIDOS[turno]["jornadas"] * factor
-            else:
-                st.warning(f"Turno no válido '{turno}' para empleado {row.ID}. Usando valores por defecto.")
-                # Valores por defecto (promedio)
-                staff_max_hours[row.ID] = 1585 * (0.8 if jornada == "Parcial" else 1)
-                staff_max_jornadas[row.ID] = 200 * (0.8 if jornada == "Parcial" else 1)
-        except Exception as e:
-            st.error(f"Error procesando empleado {row.ID}: {str(e)}")
-            # Valores por defecto seguros
-            staff_max_hours[row.ID] = 1585 * 0.8  # Asume jornada parcial por seguridad
-            staff_max_jornadas[row.ID] = 200 * 0.8
+modo_asignacion = st.radio(
+    "Modo de asignación", ["Voraz", "Flujo de coste mínimo", "Reparar planificación aprobada"], horizontal=True,
+    help="""El modo voraz asigna día a día a las profesionales con menos horas. El flujo de coste mínimo planifica todo el rango a la vez para cubrir más turnos y se compara con el voraz; es solo para planes pequeños (hasta un mes): con varios meses y miles de profesionales tarda minutos. Reparar parte de la planificación ya aprobada para esas fechas y unidades y solo cambia los turnos afectados por la nueva plantilla o demanda (bajas, ausencias, cambios de personal requerido)."""
+)
+por_meses = st.checkbox(
+    "📆 Planificar por meses", disabled=modo_asignacion == "Reparar planificación aprobada",
+    help="""Resuelve el rango mes a mes arrastrando horas, jornadas y rachas de un mes al siguiente. Cada mes se guarda en un borrador de la base de datos en cuanto termina y se muestra mientras se calculan los siguientes; al aprobar, el borrador pasa al histórico. Recomendado para rangos largos (la memoria no crece con el número de meses)."""
+)
+cubrir_todo = st.checkbox(
+    "🩹 Cubrir todos los huecos del periodo", disabled=modo_asignacion != "Reparar planificación aprobada",
+    help="""Al reparar, solo se cubren los huecos de los días con cambios (turnos retirados o días sin nada aprobado en la unidad) y de los días de alrededor cuyas rachas pueden cambiar; el resto de la planificación aprobada no se toca. Márcalo si ha aumentado el personal requerido en días ya planificados: se intentan todos los huecos del periodo."""
+)
+en_curso = st.session_state.get("tarea_asignacion") is not None
+if file_staff is not None and st.button("3️⃣🚀 Ejecutar asignación", disabled=en_curso):
+    for aviso in avisos_limites:
+        st.warning(aviso)
     
     st.markdown("""👩‍⚕️ Personal cargado""")
     st.dataframe(staff)
-    #Aquí está obviando las horas anteriores. En código 31/07 algo así: 
-    #df_prev = cargar_horas()
-    #staff_hours = dict(zip(df_prev["ID"], df_prev["Horas_Acumuladas"])) if not df_prev.empty else {row.ID: 0 for _, row in staff.iterrows()}
-    #staff_jornadas = dict.fromkeys(staff["ID"], 0)
-    
-    staff_hours = {row.ID: 0 for _, row in staff.iterrows()}
-    staff_dates = {row.ID: [] for _, row in staff.iterrows()}
-    staff_jornadas = {row.ID: 0 for _, row in staff.iterrows()}  # Inicialización adicional para jornadas
-    assignments, uncovered = [], []
 
     if demand is None:
         st.warning("⚠️ No se ha cargado ninguna demanda de turnos.")
         st.stop()
 
-    if not all(col in demand.columns for col in ["Fecha", "Unidad", "Turno", "Personal_Requerido"]):
+    if not all(col in demand.columns for col in COLUMNAS_DEMANDA):
         st.error("❌ La demanda debe contener las columnas: Fecha, Unidad, Turno, Personal_Requerido")
         st.stop()
 
-    demand_sorted = demand.sort_values(by="Fecha")
-    #st.subheader("📆 Demanda generada")
-    #st.dataframe(demand)
-
-    for _, dem in demand_sorted.iterrows():
-        fecha = dem["Fecha"]
-        unidad = dem["Unidad"]
-        turno = dem["Turno"]
-        req = dem["Personal_Requerido"]
-        assigned_count = 0
-
-        cands = staff[
-            (staff["Unidad_Asignada"] == unidad) &
-            (staff["Turno_Contrato"] == turno) &
-            (~staff["Fechas_No_Disponibilidad"].apply(lambda lst: fecha in lst))
-        ].copy()
-
-        if not cands.empty:
-            cands["Horas_Asignadas"] = cands["ID"].map(staff_hours)
-            cands["Jornadas_Asignadas"] = cands["ID"].map(lambda x: len(staff_dates[x]))
-
-            def jornada_ok(row):
-                return len(staff_dates[row.ID]) < staff_max_jornadas[row.ID]
-            
-            def consecutive_ok(nurse_id):
-                fechas_asignadas = staff_dates[nurse_id]
-                if not fechas_asignadas: return True
-                # Convertir todas las fechas a datetime.date y ordenarlas
-                fechas_datetime = sorted([datetime.strptime(f, "%Y-%m-%d").date() for f in fechas_asignadas])
-                fecha_actual = datetime.strptime(fecha, "%Y-%m-%d").date()
-                # Verificar si la fecha_actual sería el 8vo día consecutivo
-                consecutivos = 1
-                for i in range(1, 8):
-                    fecha_anterior = fecha_actual - timedelta(days=i)
-                    if fecha_anterior in fechas_datetime:
-                        consecutivos += 1
-                    else: break
-                return consecutivos < 8
-
-            def descanso_12h_ok(nurse_id):
-                fechas_previas = staff_dates[nurse_id]
-                if not fechas_previas:
-                    return True
-                fecha_actual = datetime.strptime(fecha, "%Y-%m-%d")
-                for fecha_ant in fechas_previas:
-                    fecha_prev = datetime.strptime(fecha_ant, "%Y-%m-%d")
-                    if abs((fecha_actual - fecha_prev).total_seconds()) < 12 * 3600:
-                        return False
-                return True
-
-            def hours_ok(row):
-                return staff_hours[row.ID] + SHIFT_HOURS[turno] <= staff_max_hours[row.ID]
-
-            cands = cands[cands.apply(jornada_ok, axis=1)]
-            cands = cands[cands["ID"].apply(consecutive_ok)]
-            cands = cands[cands["ID"].apply(descanso_12h_ok)]
-            cands = cands[cands.apply(hours_ok, axis=1)]
-            cands = cands.sort_values(by="Horas_Asignadas")
-
-        if not cands.empty:
-            for _, cand in cands.iterrows():
-                if assigned_count >= req: break
-                assignments.append({
-                    "Fecha": fecha,
-                    "Unidad": unidad,
-                    "Turno": turno,
-                    "ID_Enfermera": cand.ID,
-                    "Jornada": cand.Jornada,
-                    "Horas": SHIFT_HOURS[turno], 
-                })
-                staff_hours[cand.ID] += SHIFT_HOURS[turno]
-                staff_dates[cand.ID].append(fecha)
-                assigned_count += 1
-        if assigned_count < req:
-            uncovered.append({"Fecha": fecha, "Unidad": unidad, "Turno": turno, "Faltan": req - assigned_count})
-
-    df_assign = pd.DataFrame(assignments)
- 
-    df_uncov = pd.DataFrame(uncovered) if uncovered else None 
-
-    st.session_state.update({
-        "asignacion_completada": True,
-        "df_assign": df_assign,
-        "df_uncov": pd.DataFrame(uncovered) if uncovered else None,
-        "uncovered": uncovered 
-    })
-
-    df_assign["Fecha"] = pd.to_datetime(df_assign["Fecha"])
-    df_assign["Año"] = df_assign["Fecha"].dt.year
-    df_assign["Mes"] = df_assign["Fecha"].dt.month
-
-    st.session_state["resumen_mensual"] = (df_assign.assign(
-        Año=df_assign["Fecha"].dt.year,
-        Mes=df_assign["Fecha"].dt.month
-).groupby(["ID_Enfermera", "Unidad", "Turno", "Jornada", "Año", "Mes"])
- .agg(Horas_Asignadas=("Horas", "sum"),
-      Jornadas_Asignadas=("Fecha", "count"))
- .reset_index()
- .rename(columns={"ID_Enfermera": "ID"}))
+    # El cálculo sigue en segundo plano; la página muestra el avance en cada refresco
+    olvidar_borrador()
+    st.session_state.update({"asignacion_completada": False, "avisos_asignacion": [], "fin_tarea": None})
+    st.session_state["tarea_asignacion"] = Tarea(
+        ejecutar_asignacion, Avance(), staff, demand, staff_max_hours, staff_max_jornadas, modo_asignacion, por_meses,
+        cubrir_todo=cubrir_todo)
+
+with st.expander("🧪 Comparar escenarios de demanda"):
+    st.markdown("""Resuelve a la vez varias variantes de la demanda con la misma plantilla (modo voraz) y compara cobertura, turnos sin cubrir y reparto de horas, sin tocar la planificación actual. Al cancelar, los escenarios pendientes ya no empiezan, pero se espera a que terminen los que ya se están resolviendo en otros procesos.""")
+    escenarios = {}
+    if metodo == "Desde aplicación":
+        texto_finde = st.text_input(
+            "Personal por turno en fin de semana en cada escenario", placeholder="4, 5, 6",
+            help="""Cada valor es un escenario: la demanda de arriba con ese personal en cada turno de sábado y domingo.""")
+        valores = sorted({int(v) for v in texto_finde.replace(";", ",").split(",") if v.strip().isdigit()})
+        for valor in valores:
+            plantilla_finde = {dia: ({t: valor for t in turnos} if dia in dias_semana[5:] else demanda_por_dia[dia])
+                               for dia in dias_semana}
+            escenarios[f"Fin de semana {valor}"] = construir_demanda({unidad: plantilla_finde}, fecha_inicio, fecha_fin)
+    else:
+        variantes = st.file_uploader("Variantes de demanda (.xlsx)", type=["xlsx"], accept_multiple_files=True)
+        for variante in variantes or []:
+            contenido_variante = variante.getvalue()
+            escenarios[variante.name] = cargar_demanda(hashlib.sha256(contenido_variante).hexdigest(),
+                                                       contenido_variante)
+    if demand is not None:
+        escenarios = {"Actual": demand, **escenarios}
+    invalidos = [n for n, d in escenarios.items() if not all(col in d.columns for col in COLUMNAS_DEMANDA)]
+    if invalidos:
+        st.error(f"❌ Sin las columnas Fecha, Unidad, Turno, Personal_Requerido: {', '.join(invalidos)}")
+    if st.button("🧪 Comparar escenarios", disabled=en_curso or file_staff is None or bool(invalidos) or len(escenarios) < 2):
+        st.session_state.update({"comparativa_escenarios": None, "fin_tarea": None})
+        st.session_state["tarea_asignacion"] = Tarea(
+            ejecutar_escenarios, Avance(), staff, escenarios, staff_max_hours, staff_max_jornadas)
+    if st.session_state.get("comparativa_escenarios") is not None:
+        st.dataframe(st.session_state["comparativa_escenarios"], hide_index=True)
+
+seguir_tarea()
+if st.session_state.get("fin_tarea") is not None:
+    mostrar_avisos([st.session_state["fin_tarea"]])
 
 if st.session_state["asignacion_completada"]:
-    df_assign = st.session_state["df_assign"].drop(columns=["Confirmado"], errors="ignore")
-    uncovered = st.session_state.get("uncovered", [])
+    df_assign, df_uncov = resultado_asignacion()
+    df_assign = df_assign.drop(columns=["Confirmado"], errors="ignore")
+    df_vista = expandir(df_assign, "%d/%m/%Y")
     st.success("✅ Asignación completada")
+    mostrar_avisos(st.session_state.get("avisos_asignacion", []))
+    if st.session_state.get("cambios_reparacion") is not None:
+        cambios = st.session_state["cambios_reparacion"]
+        st.markdown(f"""🛠️ Cambios respecto a la planificación aprobada: {(cambios["Cambio"] == "Retirada").sum()} turnos retirados y {(cambios["Cambio"] == "Nueva").sum()} asignados""")
+        st.dataframe(expandir(cambios), hide_index=True)
+    if st.session_state.get("comparativa_cobertura") is not None:
+        st.markdown("""📈 Cobertura frente al modo voraz""")
+        st.dataframe(st.session_state["comparativa_cobertura"], hide_index=True)
+    if st.session_state.get("diagnostico") is not None:
+        informe = st.session_state["diagnostico"]
+        with st.expander("⏱️ Diagnóstico de la ejecución"):
+            st.markdown("""Tiempo por fase (en el modo por unidades, las fases de cada proceso se suman)""")
+            st.dataframe(informe["Fases"], hide_index=True)
+            st.markdown("""Candidatas rechazadas por cada restricción""")
+            st.dataframe(informe["Motivos"], hide_index=True)
+            rechazos = informe["Rechazos"]
+            requeridos = pd.to_numeric(rechazos["Personal_Requerido"], errors="coerce").fillna(0)
+            st.markdown("""Filas de demanda sin cubrir y por qué""")
+            st.dataframe(expandir(rechazos[rechazos["Asignadas"] < requeridos]), hide_index=True)
+            boton_descarga("⬇️ Descargar diagnóstico", lambda: {**informe, "Rechazos": expandir(informe["Rechazos"])},
+                           "Diagnostico_Asignacion")
     st.markdown("""🔍Turnos asignados""")
-    st.dataframe(df_assign.assign(Fecha=lambda x: pd.to_datetime(x['Fecha']).dt.strftime('%d/%m/%Y')))
+    st.dataframe(df_vista)
     
-    if uncovered:
-        df_uncov = pd.DataFrame(uncovered)
+    if df_uncov is not None:
+        df_uncov = expandir(df_uncov)
         st.markdown("⚠️ Turnos sin cubrir")
         st.dataframe(df_uncov)
         # Solo mostrar botón si hay datos
@@ -417,9 +439,8 @@ if st.session_state["asignacion_completada"]:
             fecha_inicio_descarga = fecha_inicio
             fecha_fin_descarga = fecha_fin
             # Crear nombres de archivo
-            file_name_uncov = f"Turnos_Descubiertos_{unidad_descarga}_{fecha_inicio_descarga.strftime('%Y%m%d')}_{fecha_fin_descarga.strftime('%Y%m%d')}.xlsx"
-            st.download_button("⬇️ Descargar turnos sin cubrir", data=to_excel_bytes(df_uncov), file_name=file_name_uncov,
-                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            base_uncov = f"Turnos_Descubiertos_{unidad_descarga}_{fecha_inicio_descarga.strftime('%Y%m%d')}_{fecha_fin_descarga.strftime('%Y%m%d')}"
+            boton_descarga("⬇️ Descargar turnos sin cubrir", lambda: df_uncov, base_uncov)
 
     st.markdown("### ✅ Confirmación de asignación")
     aprobacion = st.radio("¿Deseas aprobar esta asignación?", ["Pendiente", "Aprobar", "Rehacer"], index=0)
@@ -431,21 +452,25 @@ if st.session_state["asignacion_completada"]:
         
         # Verificar columnas requeridas (asegurando que los nombres coincidan exactamente)
         required_cols = ["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]
-        if not all(col in st.session_state["df_assign"].columns for col in required_cols):
-            missing_cols = [col for col in required_cols if col not in st.session_state["df_assign"].columns]
+        df_assign = expandir(df_assign)
+        if not all(col in df_assign.columns for col in required_cols):
+            missing_cols = [col for col in required_cols if col not in df_assign.columns]
             st.error(f"❌ Faltan columnas requeridas: {missing_cols}")
             st.stop()
 
-        # Crear DataFrame para guardar (asegurando mayúsculas correctas)
-        df_to_save = st.session_state["df_assign"][["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]].copy()
-        df_to_save["Fecha"] = pd.to_datetime(df_to_save["Fecha"]).dt.strftime("%Y-%m-%d")
-
         # Guardar con validación - debug
         try:
-            #st.write("Columnas en df_to_save:", df_to_save.columns.tolist())
-            #st.write("Primeras filas:", df_to_save.head())
-            guardar_asignaciones(df_to_save)
-            guardar_resumen_mensual(st.session_state["resumen_mensual"])
+            if st.session_state.get("borrador") is not None:
+                # El borrador pasa al histórico sin salir de la base de datos
+                aprobar_borrador(st.session_state["borrador"], st.session_state.get("periodo_planificado"),
+                                 st.session_state.get("unidades_planificadas"))
+            else:
+                # Crear DataFrame para guardar (asegurando mayúsculas correctas)
+                df_to_save = df_assign[["Fecha", "Unidad", "Turno", "ID_Enfermera", "Jornada", "Horas"]]
+                #st.write("Columnas en df_to_save:", df_to_save.columns.tolist())
+                #st.write("Primeras filas:", df_to_save.head())
+                guardar_aprobacion(df_to_save, st.session_state.get("periodo_planificado"),
+                                   st.session_state.get("unidades_planificadas"))
             subir_bd_a_drive(FILE_ID)
             st.success("✅ Datos guardados en la base de datos correctamente.")
         except Exception as e:
@@ -474,32 +499,47 @@ if st.session_state["asignacion_completada"]:
             fecha_fin_descarga = fecha_fin
 
         # Crear nombres de archivo usando las variables correctas
-        file_name_planilla = f"Turnos_Asignados_{unidad_descarga}_{fecha_inicio_descarga.strftime('%Y%m%d')}_{fecha_fin_descarga.strftime('%Y%m%d')}.xlsx"
-        file_name_resumen = f"Resumen_{unidad_descarga}_{fecha_inicio_descarga.strftime('%Y%m%d')}_{fecha_fin_descarga.strftime('%Y%m%d')}.xlsx"
-    
-        st.download_button(
-            "⬇️ Descargar planilla asignada", 
-            data=to_excel_bytes(st.session_state["df_assign"].assign(Fecha=lambda x: pd.to_datetime(x['Fecha']).dt.strftime('%d/%m/%Y'))),
-            file_name=file_name_planilla, 
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        st.download_button(
-            "⬇️ Descargar resumen por profesional", 
-            data=to_excel_bytes(st.session_state["resumen_mensual"]), 
-            file_name=file_name_resumen, 
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        sufijo = f"{unidad_descarga}_{fecha_inicio_descarga.strftime('%Y%m%d')}_{fecha_fin_descarga.strftime('%Y%m%d')}"
+
+        # Los archivos se generan al pulsar cada botón, no en cada rerun
+        df_planilla = df_vista
+        df_resumen = st.session_state["resumen_mensual"]
+        df_sin_cubrir = df_uncov
+
+        def planilla():
+            return df_planilla
+
+        def resumen():
+            return df_resumen
+
+        def libro_completo():
+            hojas = {"Planilla": planilla(), "Resumen": df_resumen}
+            if df_sin_cubrir is not None:
+                hojas["Sin cubrir"] = df_sin_cubrir
+            return hojas
+
+        formato = st.radio("Formato de descarga", formatos_disponibles(), horizontal=True)
+        boton_descarga("⬇️ Descargar planilla asignada", planilla, f"Turnos_Asignados_{sufijo}", formato)
+        boton_descarga("⬇️ Descargar resumen por profesional", resumen, f"Resumen_{sufijo}", formato)
+        boton_descarga("⬇️ Descargar todo en un Excel (planilla, resumen y sin cubrir)", libro_completo,
+                       f"Planificacion_{sufijo}")
 
     elif aprobacion == "Rehacer":
+        olvidar_borrador()
         st.session_state["asignacion_completada"] = False
         st.rerun()
         #st.experimental_rerun()
 
     if st.button("🔄 Reiniciar aplicación"):
+        olvidar_borrador()
+        if st.session_state.get("tarea_asignacion") is not None:
+            st.session_state["tarea_asignacion"].cancelar()
         # Limpiar archivos subidos y datos de demanda
         keys_to_reset = [
             "file_staff", "df_assign", "df_uncov", "asignacion_completada",
-            "uncovered", "resumen_mensual", "demand", "unidad", "fecha_inicio", "fecha_fin"
+            "borrador", "diagnostico", "resumen_mensual", "comparativa_cobertura", "cambios_reparacion", "periodo_planificado",
+            "unidades_planificadas", "avisos_asignacion", "tarea_asignacion", "fin_tarea", "comparativa_escenarios",
+            "demand", "unidad", "fecha_inicio", "fecha_fin"
         ]
         for key in keys_to_reset:
             if key in st.session_state:
@@ -514,6 +554,8 @@ if st.session_state["asignacion_completada"]:
 
 st.sidebar.markdown("---")
 if st.sidebar.button("🗑️ Resetear base de datos"):
+    if st.session_state.get("tarea_asignacion") is not None:
+        st.session_state["tarea_asignacion"].cancelar()
     reset_db()
     st.session_state.clear()
     st.sidebar.success("✅ Base de datos reiniciada correctamente.")
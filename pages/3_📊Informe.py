@@ -1,65 +1,74 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
-from io import BytesIO
-from pathlib import Path
+from db_manager import catalogo_resumen, consultar_resumen, consultar_topes, consultar_unidad_mes, contar_resumen, \
+    preparar_bd, version_bd
+from utils.excel_utils import boton_descarga, formatos_disponibles
+from utils.graficos import grafico_horas_restantes, grafico_horas_unidad_mes
 
-DB_PATH = Path("turnos.db")
+TAMANOS_PAGINA = [50, 100, 500]
+PROFESIONALES_GRAFICO = 20
 
-def cargar_resumen_mensual():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM resumen_mensual", conn)
-    conn.close()
-    return df
+@st.cache_data(show_spinner=False, max_entries=4)
+def cargar_catalogo(version):
+    # `version` solo sirve de clave: cambia con cada escritura en la base de datos
+    return catalogo_resumen()
 
-def to_excel_bytes(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Resumen")
-    return output.getvalue()
+# Los gráficos salen de los agregados que se mantienen al guardar y se guardan
+# como PNG por versión y filtros: mientras no se escriba nada, no se vuelven a dibujar
+@st.cache_data(show_spinner=False, max_entries=16)
+def grafico_unidades(version, filtros):
+    return grafico_horas_unidad_mes(consultar_unidad_mes(filtros))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def grafico_topes(version, filtros):
+    return grafico_horas_restantes(consultar_topes(filtros, limite=PROFESIONALES_GRAFICO))
 
 st.set_page_config(page_title="Informe", layout="wide")
 st.title("📊Visualizador de Turnos asignados")
 
-df = cargar_resumen_mensual()
+# La página puede ser la primera que se abre (enlace directo o recarga): prepara
+# la base de datos igual que la portada y el Asignador, una vez por sesión
+FILE_ID = "1zqAyIB1BLfCc2uH1v29r-clARHoh2o_s"
+if "bd_sincronizada" not in st.session_state:
+    with st.spinner("Sincronizando la base de datos..."):
+        preparar_bd(FILE_ID)
+    st.session_state["bd_sincronizada"] = True
+
+version = version_bd()
+catalogo = cargar_catalogo(version)
 
-if df.empty:
+if not catalogo["Año"]:
     #st.warning("⚠️ Actualmente no hay datos registrados en la Base de Datos. Ejecuta la aplicación desde la pestaña Asignador y vuelve aquí. ")
     st.info("🛈 Actualmente no hay datos registrados en la Base de Datos. Ejecuta la aplicación desde la pestaña Asignador y vuelve a esta pestaña.")
     st.stop()
 
-# Conversión de tipos
-df["Año"] = df["Año"].astype(int)
-df["Mes"] = df["Mes"].astype(int)
-
 st.sidebar.header("🔍 Filtros")
-years = sorted(df["Año"].unique())
-months = sorted(df["Mes"].unique())
-unidades = df["Unidad"].unique().tolist()
-turnos = df["Turno"].unique().tolist()
-jornadas = df["Jornada"].unique().tolist()
+filtros = {
+    col: st.sidebar.multiselect(col, catalogo[col], default=catalogo[col])
+    for col in ["Año", "Mes", "Unidad", "Turno", "Jornada"]
+}
 
-año_sel = st.sidebar.multiselect("Año", years, default=years)
-mes_sel = st.sidebar.multiselect("Mes", months, default=months)
-unidad_sel = st.sidebar.multiselect("Unidad", unidades, default=unidades)
-turno_sel = st.sidebar.multiselect("Turno", turnos, default=turnos)
-jornada_sel = st.sidebar.multiselect("Jornada", jornadas, default=jornadas)
-
-# Aplicar filtros
-df_filtrado = df[
-    (df["Año"].isin(año_sel)) &
-    (df["Mes"].isin(mes_sel)) &
-    (df["Unidad"].isin(unidad_sel)) &
-    (df["Turno"].isin(turno_sel)) &
-    (df["Jornada"].isin(jornada_sel))
-]
+# Los filtros se aplican en SQL y solo se lee la página visible
+total = contar_resumen(filtros)
+col1, col2 = st.columns(2)
+tamano = col1.selectbox("Filas por página", TAMANOS_PAGINA, index=1)
+n_paginas = max(1, -(-total // tamano))
+pagina = col2.number_input("Página", min_value=1, max_value=n_paginas, value=1, step=1)
+df_pagina = consultar_resumen(filtros, limite=tamano, desplazamiento=(pagina - 1) * tamano)
 
 st.markdown("### 📋 Datos filtrados")
-st.dataframe(df_filtrado, use_container_width=True)
+st.caption(f"Filas {min(total, (pagina - 1) * tamano + 1)}–{(pagina - 1) * tamano + len(df_pagina)} de {total}")
+st.dataframe(df_pagina, use_container_width=True)
+
+# La descarga completa se genera solo cuando se pide, para los filtros actuales
+formato = st.radio("Formato de descarga", formatos_disponibles(), horizontal=True)
+boton_descarga("⬇️ Descargar resumen filtrado", lambda: consultar_resumen(filtros), "Resumen_Filtrado", formato,
+               hoja="Resumen")
 
-st.download_button(
-    label="⬇️ Descargar resumen filtrado en Excel",
-    data=to_excel_bytes(df_filtrado),
-    file_name="Resumen_Filtrado.xlsx",
-    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-)
+st.markdown("### 📈 Gráficos")
+tab_unidades, tab_topes = st.tabs(["Horas por unidad y mes", "Profesionales más cerca de su tope anual"])
+with tab_unidades:
+    st.image(grafico_unidades(version, filtros))
+with tab_topes:
+    st.caption(f"Las {PROFESIONALES_GRAFICO} profesionales con menos horas restantes en el año "
+               "(sin aplicar el filtro de mes).")
+    st.image(grafico_topes(version, filtros))
@@ -0,0 +1,339 @@
+"""
+Reparación de una planificación aprobada tras cambios en la plantilla o en
+la demanda.
+
+En vez de volver a resolver el periodo, se retiran solo los turnos que ya
+no son válidos y se cubren los huecos de los días con cambios. Un
+`Calendario` de días trabajados permite comprobar rachas a ambos lados de
+cada día, porque la cobertura se hace entre turnos ya fijados.
+"""
+import numpy as np
+import pandas as pd
+
+from motor_asignacion import (
+    COLUMNAS_ASIGNACION, LIMITE_CONSECUTIVOS, SHIFT_HOURS, EstadoPlantilla, SeleccionMenosHoras,
+    _COLUMNA_DIAGNOSTICO, _fase, construir_disponibilidad, construir_indice, normalizar_demanda
+)
+
+COLUMNAS_CAMBIOS = ["Fecha", "Unidad", "Turno", "ID_Enfermera", "Cambio", "Motivo"]
+
+
+class Calendario:
+    """
+    Días trabajados por profesional en una matriz booleana profesional × día,
+    con LIMITE_CONSECUTIVOS días de margen a cada lado del periodo para ver
+    las rachas que entran o salen de él. A diferencia de `EstadoPlantilla`,
+    no exige recorrer los días en orden: la racha de un día se mide mirando
+    a los dos lados, así se puede asignar entre turnos ya fijados.
+    """
+
+    def __init__(self, n, dia_inicio, dias):
+        self.margen = LIMITE_CONSECUTIVOS
+        self.origen = dia_inicio - self.margen
+        self.trabaja = np.zeros((n, dias + 2 * self.margen), dtype=bool)
+
+    def columna(self, dia):
+        return dia - self.origen
+
+    def marcar(self, codigos, dias):
+        self.trabaja[codigos, np.asarray(dias) - self.origen] = True
+
+    def racha_con(self, c, dia):
+        """Longitud de la racha que tendría `c` si trabajase también `dia`."""
+        fila, col = self.trabaja[c], dia - self.origen
+        izquierda = derecha = 0
+        while izquierda < LIMITE_CONSECUTIVOS and col - izquierda - 1 >= 0 and fila[col - izquierda - 1]:
+            izquierda += 1
+        while derecha < LIMITE_CONSECUTIVOS and col + derecha + 1 < len(fila) and fila[col + derecha + 1]:
+            derecha += 1
+        return izquierda + 1 + derecha
+
+    def apta(self, c, dia):
+        return not self.trabaja[c, dia - self.origen] and self.racha_con(c, dia) < LIMITE_CONSECUTIVOS
+
+    def motivo_no_apta(self, c, dia):
+        """Restricción por la que `apta(c, dia)` es falso (para el diagnóstico)."""
+        return "Descanso 12 h" if self.trabaja[c, dia - self.origen] else "Días consecutivos"
+
+
+def _retirar(previas, mascara, motivo, retiradas):
+    retiradas.append(previas[mascara].assign(Cambio="Retirada", Motivo=motivo))
+    return previas[~mascara]
+
+
+def _excesos_de_racha(trabajados):
+    """
+    Etiquetas de las filas que completan una racha de LIMITE_CONSECUTIVOS
+    días (la primera de cada racha demasiado larga). `trabajados` tiene
+    _codigo, _dia y _fija; las filas fijas (días anteriores al periodo)
+    cuentan para la racha pero no se pueden retirar.
+    """
+    orden = trabajados.sort_values(["_codigo", "_dia"], kind="stable")
+    corte = (orden["_codigo"].diff() != 0) | (orden["_dia"].diff() != 1)
+    racha = corte.cumsum()
+    posicion = orden.groupby(racha).cumcount() + 1
+    exceso = orden[(posicion >= LIMITE_CONSECUTIVOS).to_numpy() & ~orden["_fija"].to_numpy()]
+    return exceso.groupby(racha[exceso.index]).head(1).index
+
+
+def reparar_asignacion(staff, demand, previas, staff_max_hours, staff_max_jornadas,
+                       estrategia=SeleccionMenosHoras, estado_previo=None, posteriores=None, diagnostico=None,
+                       avance=None, cubrir_todo=False):
+    """
+    Repara una planificación aprobada (`previas`, con las columnas de
+    COLUMNAS_ASIGNACION) tras cambios en la plantilla o en la demanda, sin
+    volver a resolver el periodo entero:
+
+    1. Se retiran solo las asignaciones que ya no son válidas: profesional
+       fuera de la plantilla o de esa unidad/turno, cambio de jornada, nueva
+       no disponibilidad, rachas o topes anuales superados, o demanda
+       reducida (salen primero las profesionales con más horas).
+    2. Los huecos que quedan se cubren con `estrategia`, comprobando
+       disponibilidad, turno en el día, topes y la racha a ambos lados del
+       día (a lo sumo LIMITE_CONSECUTIVOS días de cada lado) contra los
+       turnos fijados. Solo se cubren los de días con cambios (un turno
+       retirado o una unidad sin nada aprobado ese día) y los de los
+       LIMITE_CONSECUTIVOS días a cada lado, donde la retirada libera rachas;
+       los demás se dejan como estaban. La demanda aprobada no se guarda, así
+       que más personal requerido en un día ya planificado no se distingue
+       de un hueco que la planificación aprobada ya dejaba: con
+       `cubrir_todo` se intentan todos los huecos del periodo.
+
+    El resto de asignaciones no cambia. `estado_previo` (ver
+    `cargar_estado_previo`) aporta las horas de cada año y la racha anterior al
+    periodo; `posteriores`, las asignaciones aprobadas de los
+    LIMITE_CONSECUTIVOS días siguientes, que cuentan para las rachas pero
+    no se modifican. Devuelve (assignments, uncovered, cambios): la planificación
+    completa del periodo como DataFrame con las columnas de
+    COLUMNAS_ASIGNACION (no se pasa a diccionarios: suele ser casi toda
+    la planificación aprobada), la lista de turnos sin cubrir con el formato
+    de `asignar_turnos` y un DataFrame con las asignaciones retiradas y
+    nuevas y su motivo. Con `diagnostico`, los contadores de rechazo se
+    anotan en la cobertura de huecos (Asignadas incluye las fijadas);
+    `avance` se informa cada día de esa cobertura.
+    """
+    demand = normalizar_demanda(demand)
+    previas = previas.reindex(columns=COLUMNAS_ASIGNACION).reset_index(drop=True)
+    previas["Fecha"] = pd.to_datetime(previas["Fecha"]).dt.strftime("%Y-%m-%d")
+    planificados = set(zip(previas["Fecha"], previas["Unidad"].astype(str)))
+
+    fechas = pd.to_datetime(pd.concat([demand["Fecha"], previas["Fecha"]]), format="%Y-%m-%d")
+    if fechas.empty:
+        return pd.DataFrame(columns=COLUMNAS_ASIGNACION), [], pd.DataFrame(columns=COLUMNAS_CAMBIOS)
+    inicio = fechas.min()
+    dias = (fechas.max() - inicio).days + 1
+    epoca = (inicio - pd.Timestamp(0)).days
+
+    indice = construir_indice(staff)
+    no_disponible = construir_disponibilidad(staff, inicio, dias)
+    jornadas = staff["Jornada"].to_numpy()
+    codigos, ids = pd.factorize(staff["ID"])
+    ids = ids.tolist()
+    estado = EstadoPlantilla([staff_max_hours[i] for i in ids], [staff_max_jornadas[i] for i in ids])
+    estado.sembrar(ids, estado_previo, año=inicio.year)
+    calendario = Calendario(len(ids), epoca, dias)
+
+    # Posición en `staff` de cada asignación previa por (ID, unidad, turno)
+    claves_staff = pd.MultiIndex.from_arrays([staff["ID"].astype(str), staff["Unidad_Asignada"].astype(str),
+                                              staff["Turno_Contrato"].astype(str)])
+    primera = ~claves_staff.duplicated()
+    pos = claves_staff[primera].get_indexer(pd.MultiIndex.from_arrays(
+        [previas["ID_Enfermera"].astype(str), previas["Unidad"].astype(str), previas["Turno"].astype(str)]))
+    pos = np.where(pos >= 0, np.flatnonzero(primera)[pos], -1)
+    dia_rel = (pd.to_datetime(previas["Fecha"], format="%Y-%m-%d") - inicio).dt.days.to_numpy()
+    previas = previas.assign(_pos=pos, _dia=dia_rel + epoca,
+                             _codigo=np.where(pos >= 0, codigos[np.maximum(pos, 0)], -1),
+                             _año=previas["Fecha"].str[:4].astype(int))
+
+    # 1. Validación de lo aprobado frente a los datos nuevos
+    retiradas = []
+    previas = _retirar(previas, previas["_pos"] < 0, "Fuera de la plantilla, unidad o turno", retiradas)
+    pos = previas["_pos"].to_numpy()
+    previas = _retirar(previas, previas["Jornada"].astype(str).to_numpy() != jornadas[pos].astype(str),
+                       "Cambio de jornada", retiradas)
+    previas = _retirar(previas, no_disponible[previas["_pos"].to_numpy(), previas["_dia"].to_numpy() - epoca],
+                       "No disponible", retiradas)
+    previas = _retirar(previas, previas.duplicated(["_codigo", "_dia"]), "Turno duplicado en el día", retiradas)
+
+    # Racha con la que llega cada profesional al primer día (días fijos previos)
+    fijos = pd.DataFrame({"_codigo": np.zeros(0, dtype=np.int64), "_dia": np.zeros(0, dtype=np.int64)})
+    if estado_previo is not None and not estado_previo.empty:
+        # Racha y último día se repiten en las filas de cada año: basta la primera
+        previo = estado_previo[~estado_previo.index.astype(str).duplicated()]
+        previo = previo.set_axis(previo.index.astype(str)).reindex(pd.Index(ids, dtype=object).astype(str))
+        ultima = pd.to_datetime(previo["Ultima_Fecha"], format="%Y-%m-%d", errors="coerce")
+        seguida = (ultima == inicio - pd.Timedelta(days=1)).to_numpy()
+        racha = np.where(seguida, previo["Racha"].fillna(0).to_numpy(), 0).astype(np.int64)
+        c = np.repeat(np.arange(len(ids)), racha)
+        atras = np.arange(len(c)) - np.repeat(np.cumsum(racha) - racha, racha) + 1
+        fijos = pd.DataFrame({"_codigo": c, "_dia": epoca - atras})
+        calendario.marcar(fijos["_codigo"].to_numpy(), fijos["_dia"].to_numpy())
+    if posteriores is not None and not posteriores.empty:
+        # Días ya aprobados tras el periodo: solo los de profesionales de la plantilla
+        codigo_id = pd.Series(np.arange(len(ids)), index=pd.Index(ids, dtype=object).astype(str))
+        c = codigo_id.reindex(posteriores["ID_Enfermera"].astype(str)).to_numpy()
+        dia = (pd.to_datetime(posteriores["Fecha"]) - pd.Timestamp(0)).dt.days.to_numpy()
+        dentro = ~np.isnan(c) & (dia > epoca + dias - 1) & (dia <= epoca + dias - 1 + LIMITE_CONSECUTIVOS)
+        despues = pd.DataFrame({"_codigo": c[dentro].astype(np.int64), "_dia": dia[dentro]}).drop_duplicates()
+        calendario.marcar(despues["_codigo"].to_numpy(), despues["_dia"].to_numpy())
+        fijos = pd.concat([fijos, despues], ignore_index=True)
+    fijos.index = -1 - np.arange(len(fijos))
+    while True:
+        trabajados = pd.concat([previas[["_codigo", "_dia"]].assign(_fija=False), fijos.assign(_fija=True)])
+        exceso = _excesos_de_racha(trabajados)
+        if exceso.empty:
+            break
+        previas = _retirar(previas, previas.index.isin(exceso), "Días consecutivos", retiradas)
+
+    # Los topes son anuales: cada año del periodo se suma y se comprueba con sus contadores
+    for año, del_año in previas.groupby("_año"):
+        estado.cambiar_año(año)
+        horas = del_año.groupby("_codigo")["Horas"].agg(["sum", "count"])
+        estado.horas[horas.index.to_numpy()] += horas["sum"].to_numpy(dtype=np.float64)
+        estado.jornadas[horas.index.to_numpy()] += horas["count"].to_numpy().astype(np.int32)
+        sobrepasadas = np.flatnonzero((estado.jornadas > np.ceil(estado.max_jornadas))
+                                      | (estado.horas > estado.max_horas + 1e-9))
+        for c in sobrepasadas:
+            # Se retiran los últimos turnos de la profesional hasta volver a los topes
+            filas = del_año.index[del_año["_codigo"] == c][::-1]
+            quitar = []
+            for fila in filas:
+                if estado.jornadas[c] <= np.ceil(estado.max_jornadas[c]) and estado.horas[c] <= estado.max_horas[c] + 1e-9:
+                    break
+                estado.jornadas[c] -= 1
+                estado.horas[c] -= previas.at[fila, "Horas"]
+                quitar.append(fila)
+            previas = _retirar(previas, previas.index.isin(quitar), "Tope anual", retiradas)
+
+    # Demanda por hueco (fecha, unidad, turno) frente a lo que sigue asignado
+    requeridos = pd.to_numeric(demand["Personal_Requerido"], errors="coerce").fillna(0).clip(lower=0).astype(np.int64)
+    req_hueco = requeridos.groupby([demand["Fecha"].astype(str), demand["Unidad"].astype(str),
+                                    demand["Turno"].astype(str)], sort=False).sum()
+    claves = pd.MultiIndex.from_arrays([previas["Fecha"], previas["Unidad"].astype(str), previas["Turno"].astype(str)])
+    permitido = req_hueco.reindex(claves, fill_value=0).to_numpy()
+    horas_fila = np.zeros(len(previas))
+    for año in previas["_año"].unique():
+        estado.cambiar_año(año)
+        del_año = (previas["_año"] == año).to_numpy()
+        horas_fila[del_año] = estado.horas[previas["_codigo"].to_numpy()[del_año]]
+    orden_horas = previas.assign(_horas=horas_fila, _permitido=permitido)
+    orden_horas = orden_horas.sort_values("_horas", ascending=True, kind="stable")
+    puesto = orden_horas.groupby(["Fecha", "Unidad", "Turno"], sort=False).cumcount()
+    sobrantes = orden_horas.index[(puesto.to_numpy() >= orden_horas["_permitido"].to_numpy())]
+    for fila in sobrantes:
+        estado.cambiar_año(previas.at[fila, "_año"])
+        estado.jornadas[previas.at[fila, "_codigo"]] -= 1
+        estado.horas[previas.at[fila, "_codigo"]] -= previas.at[fila, "Horas"]
+    previas = _retirar(previas, previas.index.isin(sobrantes), "Demanda reducida", retiradas)
+    calendario.marcar(previas["_codigo"].to_numpy(), previas["_dia"].to_numpy())
+
+    # 2. Cobertura de los huecos, en orden cronológico
+    req_hueco = req_hueco.to_dict()
+    cubiertos = previas.groupby(["Fecha", previas["Unidad"].astype(str), previas["Turno"].astype(str)],
+                                sort=False).size().to_dict()
+    fechas_demanda = pd.to_datetime(demand["Fecha"], format="%Y-%m-%d")
+    dias_demanda = (fechas_demanda - inicio).dt.days.to_numpy()
+    afectados = None
+    if not cubrir_todo:
+        # Días con cambios y su ventana de rachas: fuera de ella no se toca nada
+        nuevos = [fecha for fecha, unidad, _ in req_hueco if (fecha, unidad) not in planificados]
+        cambios = pd.concat([r["Fecha"] for r in retiradas] + [pd.Series(nuevos, dtype=object)])
+        afectados = np.zeros(dias, dtype=bool)
+        for dia in (pd.to_datetime(cambios.unique(), format="%Y-%m-%d") - inicio).days:
+            afectados[max(0, dia - LIMITE_CONSECUTIVOS):dia + LIMITE_CONSECUTIVOS + 1] = True
+    años_demanda = fechas_demanda.dt.year.to_numpy()
+    seleccion, año_seleccion = None, None
+    nuevas, uncovered = [], []
+    conteos = diagnostico.nuevo_bloque(demand) if diagnostico is not None else None
+    conteo = None
+    # Como en `_asignar`: candidatas que salieron del montículo por un tope
+    # anual, por grupo, y cuántas por motivo; cuentan en las filas siguientes
+    retiradas_tope = {}
+    dia_anterior, fecha_anterior, demandados, cubiertos_avance = None, None, 0, 0
+    contados = set()
+    with _fase(diagnostico, "cobertura_huecos"):
+        for k, (dia, año, dem) in enumerate(zip(dias_demanda, años_demanda, demand.itertuples(index=False))):
+            fecha, unidad, turno = dem.Fecha, dem.Unidad, dem.Turno
+            clave = (fecha, str(unidad), str(turno))
+            req = req_hueco.get(clave, 0)
+            ya = cubiertos.get(clave, 0)
+            if avance is not None:
+                if dia != dia_anterior:
+                    if dia_anterior is not None:
+                        avance.informar(k / len(demand), fecha_anterior, demandados, cubiertos_avance)
+                    dia_anterior, fecha_anterior, demandados, cubiertos_avance = dia, fecha, 0, 0
+                # Un hueco repetido en la demanda se cuenta una sola vez
+                if clave not in contados:
+                    contados.add(clave)
+                    demandados += req
+                    cubiertos_avance += min(ya, req)
+            if conteos is not None:
+                conteo = conteos[k]
+                conteo[_COLUMNA_DIAGNOSTICO["Candidatas"]] = len(indice.get((unidad, turno), ()))
+                conteo[_COLUMNA_DIAGNOSTICO["Asignadas"]] = min(ya, req)
+            if ya >= req:
+                continue
+            if afectados is not None and not afectados[dia]:
+                uncovered.append({"Fecha": fecha, "Unidad": unidad, "Turno": turno, "Faltan": req - ya})
+                continue
+            if año != año_seleccion:
+                # Año nuevo: contadores de ese año y montículos con todas las candidatas
+                estado.cambiar_año(int(año))
+                seleccion, año_seleccion = estrategia(indice, estado, codigos), año
+                retiradas_tope = {}
+            dia_abs = epoca + dia
+            asignadas = 0
+            if (unidad, turno) in indice:
+                horas_turno = SHIFT_HOURS[turno]
+                retiradas_grupo, motivos_retiradas = retiradas_tope.setdefault((unidad, turno), (set(), {}))
+                if conteo is not None:
+                    for motivo, n in motivos_retiradas.items():
+                        conteo[_COLUMNA_DIAGNOSTICO[motivo]] += n
+
+                def apta(i):
+                    if no_disponible[i, dia]:
+                        if conteo is not None:
+                            conteo[_COLUMNA_DIAGNOSTICO["No disponible"]] += 1
+                        return False
+                    if calendario.apta(codigos[i], dia_abs):
+                        return True
+                    if conteo is not None:
+                        conteo[_COLUMNA_DIAGNOSTICO[calendario.motivo_no_apta(codigos[i], dia_abs)]] += 1
+                    return False
+
+                def descartada(i):
+                    if not estado.descartada(codigos[i], horas_turno):
+                        return False
+                    # El tope es definitivo: se cuenta una vez aquí y luego en cada fila del grupo
+                    if conteo is not None and i not in retiradas_grupo:
+                        motivo = estado.motivo_descarte(codigos[i])
+                        retiradas_grupo.add(i)
+                        motivos_retiradas[motivo] = motivos_retiradas.get(motivo, 0) + 1
+                        conteo[_COLUMNA_DIAGNOSTICO[motivo]] += 1
+                    return True
+
+                def asignar(i):
+                    nuevas.append({"Fecha": fecha, "Unidad": unidad, "Turno": turno,
+                                   "ID_Enfermera": ids[codigos[i]], "Jornada": jornadas[i], "Horas": horas_turno})
+                    calendario.marcar([codigos[i]], [dia_abs])
+                    estado.sumar(codigos[i], horas_turno)
+
+                asignadas = seleccion.elegir((unidad, turno), req - ya, apta, descartada, asignar)
+            cubiertos[clave] = ya + asignadas
+            cubiertos_avance += asignadas
+            if conteo is not None:
+                conteo[_COLUMNA_DIAGNOSTICO["Asignadas"]] += asignadas
+            if ya + asignadas < req:
+                uncovered.append({"Fecha": fecha, "Unidad": unidad, "Turno": turno, "Faltan": req - ya - asignadas})
+        if avance is not None:
+            avance.informar(1.0, fecha_anterior, demandados, cubiertos_avance)
+
+    # Resultado: asignaciones fijadas + nuevas, con los IDs tal como vienen en la plantilla
+    fijadas = previas.assign(ID_Enfermera=[ids[c] for c in previas["_codigo"]],
+                             Jornada=jornadas[previas["_pos"].to_numpy()])[COLUMNAS_ASIGNACION]
+    df_nuevas = pd.DataFrame(nuevas, columns=COLUMNAS_ASIGNACION)
+    resultado = pd.concat([fijadas, df_nuevas], ignore_index=True).sort_values("Fecha", kind="stable")
+    cambios = pd.concat([r[COLUMNAS_CAMBIOS] for r in retiradas]
+                        + [df_nuevas.assign(Cambio="Nueva", Motivo="Hueco cubierto")[COLUMNAS_CAMBIOS]],
+                        ignore_index=True)
+    return resultado.reset_index(drop=True), uncovered, cambios
@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("streamlit.testing.v1")
+
+import benchmark
+
+
+@pytest.mark.parametrize("pagina", list(benchmark.PRESUPUESTO_ARRANQUE))
+def test_arranque_dentro_de_presupuesto(pagina):
+    """Primer render en frío de cada página (mediana de 3 procesos nuevos) frente a su presupuesto."""
+    presupuesto = benchmark.PRESUPUESTO_ARRANQUE[pagina]
+    fila, = benchmark.comprobar_arranque(repeticiones=3, presupuestos={pagina: presupuesto})
+    assert not fila["excepciones"], fila["excepciones"]
+    assert fila["dentro_presupuesto"], f"{pagina}: {fila['segundos']} s (presupuesto {presupuesto} s)"
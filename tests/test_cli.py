@@ -0,0 +1,26 @@
+import pandas as pd
+
+import cli
+
+
+def test_demandas_con_el_mismo_nombre_no_se_sobrescriben(tmp_path):
+    plantilla = tmp_path / "plantilla.csv"
+    pd.DataFrame({"ID": ["E1", "E2"], "Unidad_Asignada": ["UCI", "URG"], "Jornada": "Completa",
+                  "Turno_Contrato": "Mañana", "Fechas_No_Disponibilidad": ""}).to_csv(plantilla, index=False)
+    demandas = []
+    for unidad in ("UCI", "URG"):
+        (tmp_path / unidad).mkdir()
+        demandas.append(tmp_path / unidad / "demanda.csv")
+        pd.DataFrame({"Fecha": ["2025-01-01"], "Unidad": [unidad], "Turno": ["Mañana"],
+                      "Personal_Requerido": [1]}).to_csv(demandas[-1], index=False)
+    # La misma demanda en dos formatos, en la misma carpeta
+    pd.read_csv(demandas[0]).to_excel(tmp_path / "UCI" / "demanda.xlsx", index=False)
+    demandas.append(tmp_path / "UCI" / "demanda.xlsx")
+
+    salida = tmp_path / "salida"
+    assert cli.main(["--plantilla", str(plantilla), "--demanda", *map(str, demandas), "--salida", str(salida),
+                     "--formato", "csv", "--modo", "voraz"]) == 0
+    asignados = sorted(p.name for p in salida.glob("Turnos_Asignados_*"))
+    assert asignados == ["Turnos_Asignados_UCI_demanda_1.csv", "Turnos_Asignados_UCI_demanda_3.csv",
+                         "Turnos_Asignados_URG_demanda.csv"]
+    assert pd.read_csv(salida / "Turnos_Asignados_URG_demanda.csv")["ID_Enfermera"].tolist() == ["E2"]
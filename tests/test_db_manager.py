@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+import db_manager
+
+
+@pytest.fixture
+def bd(tmp_path, monkeypatch):
+    """Base local en un directorio temporal y copia remota (OrigenDirectorio) en otro."""
+    remoto = tmp_path / "remoto"
+    remoto.mkdir()
+    monkeypatch.setenv(db_manager.ENV_ORIGEN_BD, str(remoto))
+    monkeypatch.setattr(db_manager, "DB_PATH", tmp_path / "turnos.db")
+    monkeypatch.setattr(db_manager, "_ultima_comprobacion", {})
+    yield remoto / "turnos.db"
+    db_manager.cerrar_conexiones()
+
+
+def _base_anterior(ruta, unidad):
+    """Base de una versión anterior de la aplicación: sin `metadatos` ni modo WAL."""
+    conn = sqlite3.connect(ruta)
+    conn.execute("CREATE TABLE asignaciones (Fecha TEXT, Unidad TEXT, Turno TEXT, ID_Enfermera TEXT, "
+                 "Jornada TEXT, Horas REAL)")
+    conn.execute("INSERT INTO asignaciones VALUES ('2025-01-01', ?, 'Mañana', 'E1', 'Completa', 7.5)", [unidad])
+    conn.commit()
+    conn.close()
+
+
+def _sincronizar():
+    return db_manager.sincronizar_bd(db_manager.origen_por_defecto("x"), forzar=True)
+
+
+def test_preparar_no_cuenta_como_cambio_local(bd):
+    _base_anterior(bd, "UCI")
+    assert db_manager.preparar_bd("x") == "descargada"
+    # WAL e init_db cambian el archivo, pero no son escrituras de datos
+    assert _sincronizar() == "actualizada"
+    _base_anterior(bd.with_name("nueva.db"), "URG")
+    bd.with_name("nueva.db").replace(bd)
+    assert _sincronizar() == "descargada"
+
+
+def test_no_descarga_encima_de_escrituras_locales(bd):
+    _base_anterior(bd, "UCI")
+    db_manager.preparar_bd("x")
+    db_manager.guardar_horas(pd.DataFrame({"ID": ["E1"], "Turno_Contrato": ["Mañana"], "Horas": [7.5]}))
+    assert _sincronizar() == "local_modificada"
+    assert len(db_manager.cargar_horas()) == 1
+
+
+def test_no_sustituye_la_base_con_trabajo_en_curso(bd):
+    _base_anterior(bd, "UCI")
+    db_manager.preparar_bd("x")
+    dentro, salir = threading.Event(), threading.Event()
+    unidades = []
+
+    @db_manager.usa_bd
+    def tarea():
+        conn = db_manager.obtener_conexion()
+        dentro.set()
+        salir.wait(10)
+        unidades.extend(fila[0] for fila in conn.execute("SELECT Unidad FROM asignaciones"))
+
+    hilo = threading.Thread(target=tarea)
+    hilo.start()
+    dentro.wait(10)
+    _base_anterior(bd.with_name("nueva.db"), "URG")
+    bd.with_name("nueva.db").replace(bd)
+    assert _sincronizar() == "ocupada"
+    salir.set()
+    hilo.join(10)
+    # La conexión de la tarea no se cerró por debajo y leyó la base sin sustituir
+    assert unidades == ["UCI"]
+    assert _sincronizar() == "descargada"
+
+
+def _plan(unidad):
+    return pd.DataFrame({"Fecha": ["2025-01-01", "2025-01-02"], "Unidad": unidad, "Turno": "Mañana",
+                         "ID_Enfermera": "E1", "Jornada": "Completa", "Horas": 7.5})
+
+
+def test_borradores_caducados_se_borran(bd):
+    db_manager.init_db()
+    db_manager.guardar_aprobacion(_plan("UCI"))
+    antiguo, reciente = db_manager.nuevo_borrador(), db_manager.nuevo_borrador()
+    for borrador in (antiguo, reciente):
+        db_manager.guardar_tramo_borrador(borrador, _plan("UCI"))
+    with db_manager.transaccion() as conn:
+        conn.execute("UPDATE borradores SET Creado = Creado - ? WHERE Borrador = ?",
+                     [db_manager.CADUCIDAD_BORRADOR + 1, antiguo])
+        # Filas de un borrador de una base anterior, sin registrar
+        conn.execute("INSERT INTO asignaciones_borrador SELECT 'huerfano', * FROM asignaciones")
+
+    db_manager.purgar_borradores()
+    borradores = [fila[0] for fila in db_manager.obtener_conexion().execute(
+        "SELECT DISTINCT Borrador FROM asignaciones_borrador")]
+    assert borradores == [reciente]
+    # Aprobar un borrador caducado no vacía el periodo aprobado
+    with pytest.raises(ValueError):
+        db_manager.aprobar_borrador(antiguo, ("2025-01-01", "2025-01-02"), ["UCI"])
+    assert len(db_manager.cargar_asignaciones()) == 2
+
+
+def test_estado_previo_de_un_plan_que_cruza_el_año(bd):
+    db_manager.init_db()
+    db_manager.guardar_aprobacion(pd.DataFrame({
+        "Fecha": ["2025-12-30", "2025-12-31", "2026-01-01", "2026-01-05"],
+        "Unidad": ["UCI", "UCI", "UCI", "URG"], "Turno": "Mañana",
+        "ID_Enfermera": "E1", "Jornada": "Completa", "Horas": 7.5}))
+
+    estado = db_manager.cargar_estado_previo("2025-12-31", "2026-01-10", ["UCI"])
+    # Una fila por año; lo que el plan sustituye (UCI en el rango) no cuenta
+    assert estado.loc["E1", ["Año", "Jornadas"]].values.tolist() == [[2025, 1], [2026, 1]]
+    assert (estado.loc["E1", "Ultima_Fecha"] == "2025-12-30").all()
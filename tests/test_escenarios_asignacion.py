@@ -0,0 +1,52 @@
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import escenarios_asignacion as escenarios
+from benchmark import generar_demanda_sintetica, generar_plantilla_sintetica
+from motor_asignacion import IndicePlantilla, asignar_turnos, calcular_limites
+from utils.fechas import parse_dates_columna
+
+MAPAS = Path("/proc/self/maps")
+
+
+def _proyecciones(bloques):
+    """Bloques de memoria compartida que este proceso tiene proyectados."""
+    mapas = MAPAS.read_text()
+    return [b.name for b in bloques if b.name in mapas]
+
+
+@pytest.fixture
+def plantilla():
+    inicio = date(2025, 1, 1)
+    staff = generar_plantilla_sintetica(60, 3, inicio, 31)
+    staff["Fechas_No_Disponibilidad"], _ = parse_dates_columna(staff["Fechas_No_Disponibilidad"])
+    staff_max_hours, staff_max_jornadas, _ = calcular_limites(staff)
+    return staff, generar_demanda_sintetica(staff, inicio, 31), staff_max_hours, staff_max_jornadas
+
+
+@pytest.mark.skipif(not MAPAS.exists(), reason="necesita /proc/self/maps")
+def test_trabajador_cierra_la_memoria_compartida(plantilla, monkeypatch):
+    staff, demand, staff_max_hours, staff_max_jornadas = plantilla
+    monkeypatch.setattr(escenarios, "_trabajador", {})
+    descriptor, bloques = escenarios._publicar(IndicePlantilla.construir(staff, pd.Timestamp("2025-01-01"), 31))
+    try:
+        # Los bloques del proceso que publica se cierran aparte: solo se miran los que abre el trabajador
+        for bloque in bloques:
+            bloque.close()
+        escenarios._iniciar_trabajador(descriptor, staff_max_hours, staff_max_jornadas, None)
+
+        resultado = escenarios._resolver_escenario(demand.reset_index(drop=True))
+        assert resultado == asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas)
+        assert _proyecciones(bloques) == []
+
+        # También si el escenario falla (fechas fuera del índice)
+        fuera = demand.assign(Fecha="2025-03-01").reset_index(drop=True)
+        with pytest.raises(ValueError):
+            escenarios._resolver_escenario(fuera)
+        assert _proyecciones(bloques) == []
+    finally:
+        for bloque in bloques:
+            bloque.unlink()
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from flujo_asignacion import asignar_turnos_flujo
+from utils.plantilla import preparar_plantilla
+
+
+def test_flujo_parte_de_las_horas_aprobadas():
+    staff = pd.DataFrame({
+        "ID": ["E1", "E2"],
+        "Unidad_Asignada": ["UCI"] * 2,
+        "Jornada": ["Completa"] * 2,
+        "Turno_Contrato": ["Mañana"] * 2,
+        "Fechas_No_Disponibilidad": [np.nan] * 2,
+    })
+    staff, staff_max_hours, staff_max_jornadas, _, _ = preparar_plantilla(staff)
+    demand = pd.DataFrame({"Fecha": pd.date_range("2025-03-01", periods=4).strftime("%Y-%m-%d"),
+                           "Unidad": "UCI", "Turno": "Mañana", "Personal_Requerido": 1})
+    # E1 lleva 300 h en el año: el reparto de carga debe dar los turnos a E2, como el voraz
+    estado_previo = pd.DataFrame({"Año": [2025], "Horas": [300.0], "Jornadas": [40], "Ultima_Fecha": [None],
+                                  "Racha": [0]}, index=["E1"])
+    assignments, uncovered = asignar_turnos_flujo(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                  estado_previo=estado_previo)
+    assert uncovered == []
+    assert [a["ID_Enfermera"] for a in assignments] == ["E2"] * 4
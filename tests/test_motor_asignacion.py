@@ -0,0 +1,172 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from motor_asignacion import MOTIVOS_RECHAZO, Diagnostico, agrupar_unidades, asignar_por_meses, asignar_turnos, \
+    asignar_turnos_paralelo
+from utils.plantilla import preparar_plantilla
+
+
+def _con_limite(funcion, *args, segundos=10, **kwargs):
+    """Resultado de `funcion` en un hilo aparte; falla en vez de colgar la suite si no termina."""
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.update(valor=funcion(*args, **kwargs)), daemon=True)
+    hilo.start()
+    hilo.join(segundos)
+    assert not hilo.is_alive(), f"{funcion.__name__} no terminó en {segundos} s"
+    return resultado["valor"]
+
+
+def _plantilla_con_unidad_vacia():
+    staff = pd.DataFrame({
+        "ID": ["E1", "E2", "E3", "E4"],
+        "Unidad_Asignada": ["UCI", "URG", np.nan, "UCI"],
+        "Jornada": ["Completa"] * 4,
+        "Turno_Contrato": ["Mañana"] * 4,
+        "Fechas_No_Disponibilidad": [np.nan] * 4,
+    })
+    staff, staff_max_hours, staff_max_jornadas, _, _ = preparar_plantilla(staff)
+    return staff, staff_max_hours, staff_max_jornadas
+
+
+def test_agrupar_unidades_ignora_unidad_vacia():
+    staff, _, _ = _plantilla_con_unidad_vacia()
+    grupos = _con_limite(agrupar_unidades, staff)
+    assert sorted(map(sorted, grupos)) == [["UCI"], ["URG"]]
+
+
+def test_asignar_paralelo_con_unidad_vacia():
+    staff, staff_max_hours, staff_max_jornadas = _plantilla_con_unidad_vacia()
+    demand = pd.DataFrame({"Fecha": ["2025-01-01", "2025-01-01"], "Unidad": ["UCI", "URG"],
+                           "Turno": ["Mañana", "Mañana"], "Personal_Requerido": [2, 1]})
+    assignments, uncovered = _con_limite(asignar_turnos_paralelo, staff, demand, staff_max_hours,
+                                         staff_max_jornadas, max_workers=2)
+    assert sorted(a["ID_Enfermera"] for a in assignments) == ["E1", "E2", "E4"]
+    assert uncovered == []
+
+
+def test_diagnostico_cuenta_topes_en_filas_siguientes():
+    n = 10
+    staff = pd.DataFrame({
+        "ID": [f"E{i}" for i in range(n)],
+        "Unidad_Asignada": ["UCI"] * n,
+        "Jornada": ["Completa", "Parcial"] * (n // 2),
+        "Turno_Contrato": ["Mañana"] * n,
+        "Fechas_No_Disponibilidad": [np.nan] * n,
+    })
+    staff, staff_max_hours, _, _, _ = preparar_plantilla(staff)
+    staff_max_jornadas = {i: 30 for i in staff["ID"]}
+    demand = pd.DataFrame({"Fecha": pd.date_range("2025-01-01", periods=90).strftime("%Y-%m-%d"),
+                           "Unidad": "UCI", "Turno": "Mañana", "Personal_Requerido": 5})
+    diagnostico = Diagnostico()
+    asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas, diagnostico=diagnostico)
+
+    rechazos = diagnostico.rechazos()
+    sin_cubrir = rechazos[rechazos["Asignadas"] < rechazos["Personal_Requerido"]]
+    assert not sin_cubrir.empty
+    total = sin_cubrir[MOTIVOS_RECHAZO].sum(axis=1) + sin_cubrir["Asignadas"]
+    assert (total == sin_cubrir["Candidatas"]).all()
+    assert (sin_cubrir["Tope de jornadas"] > 0).all()
+
+
+def _plantilla_fin_de_año():
+    """Tres profesionales con 5 jornadas al año y un turno diario del 22-12-2025 al 10-01-2026."""
+    staff = pd.DataFrame({
+        "ID": ["E1", "E2", "E3"],
+        "Unidad_Asignada": ["UCI"] * 3,
+        "Jornada": ["Completa"] * 3,
+        "Turno_Contrato": ["Mañana"] * 3,
+        "Fechas_No_Disponibilidad": [np.nan] * 3,
+    })
+    staff, staff_max_hours, _, _, _ = preparar_plantilla(staff)
+    demand = pd.DataFrame({"Fecha": pd.date_range("2025-12-22", "2026-01-10").strftime("%Y-%m-%d"),
+                           "Unidad": "UCI", "Turno": "Mañana", "Personal_Requerido": 1})
+    return staff, demand, staff_max_hours, {i: 5 for i in staff["ID"]}
+
+
+def _jornadas_por_año(assignments):
+    df = pd.DataFrame(assignments)
+    return df.groupby([df["Fecha"].str[:4], "ID_Enfermera"]).size()
+
+
+def test_topes_anuales_empiezan_de_cero_en_enero():
+    staff, demand, staff_max_hours, staff_max_jornadas = _plantilla_fin_de_año()
+    # 10 turnos en cada año para 15 jornadas por año: sin reinicio faltarían 5 en enero
+    assignments, uncovered = asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas)
+    assert uncovered == []
+    assert _jornadas_por_año(assignments).max() <= 5
+
+    por_meses = [a for _, tramo, _ in asignar_por_meses(staff, demand, staff_max_hours, staff_max_jornadas,
+                                                           asignar=asignar_turnos) for a in tramo]
+    assert por_meses == assignments
+
+
+def test_estado_previo_por_año():
+    staff, demand, staff_max_hours, staff_max_jornadas = _plantilla_fin_de_año()
+    # E1 ya tiene aprobado todo su tope de 2026 (en otra unidad): solo puede trabajar en diciembre
+    estado_previo = pd.DataFrame({"Año": [2025, 2026], "Horas": [0.0, 37.5], "Jornadas": [0, 5],
+                                  "Ultima_Fecha": [None, None], "Racha": [0, 0]}, index=["E1", "E1"])
+    for asignar in (asignar_turnos, asignar_turnos_paralelo):
+        assignments, _ = asignar(staff, demand, staff_max_hours, staff_max_jornadas, estado_previo=estado_previo)
+        jornadas = _jornadas_por_año(assignments)
+        assert jornadas.get(("2025", "E1"), 0) > 0
+        assert ("2026", "E1") not in jornadas
+
+
+# Resultado de referencia de `asignar_turnos` para `_caso_de_referencia`: desempate
+# por orden de la plantilla, tope de jornadas (E1), ausencias (E3, E5), límite de
+# días consecutivos (E2 descansa el día 8) y filas sin cubrir
+ASIGNACIONES_DE_REFERENCIA = [
+    ("2025-03-01", "Mañana", "E1", "Completa", 7.5),
+    ("2025-03-01", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-01", "Noche", "E4", "Completa", 10),
+    ("2025-03-02", "Mañana", "E1", "Completa", 7.5),
+    ("2025-03-02", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-02", "Noche", "E5", "Parcial", 10),
+    ("2025-03-03", "Mañana", "E1", "Completa", 7.5),
+    ("2025-03-03", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-03", "Noche", "E4", "Completa", 10),
+    ("2025-03-04", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-04", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-04", "Noche", "E5", "Parcial", 10),
+    ("2025-03-05", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-05", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-05", "Noche", "E4", "Completa", 10),
+    ("2025-03-06", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-06", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-06", "Noche", "E5", "Parcial", 10),
+    ("2025-03-07", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-07", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-07", "Noche", "E4", "Completa", 10),
+    ("2025-03-08", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-08", "Noche", "E5", "Parcial", 10),
+    ("2025-03-09", "Mañana", "E3", "Completa", 7.5),
+    ("2025-03-09", "Mañana", "E2", "Parcial", 7.5),
+    ("2025-03-09", "Noche", "E4", "Completa", 10),
+]
+
+
+def _caso_de_referencia():
+    staff = pd.DataFrame({
+        "ID": ["E1", "E2", "E3", "E4", "E5"],
+        "Unidad_Asignada": ["UCI"] * 5,
+        "Jornada": ["Completa", "Parcial", "Completa", "Completa", "Parcial"],
+        "Turno_Contrato": ["Mañana", "Mañana", "Mañana", "Noche", "Noche"],
+        "Fechas_No_Disponibilidad": [np.nan, np.nan, "02/03/2025-03/03/2025", np.nan, "05/03/2025"],
+    })
+    staff, staff_max_hours, staff_max_jornadas, _, _ = preparar_plantilla(staff)
+    fechas = list(pd.date_range("2025-03-01", periods=9).strftime("%Y-%m-%d"))
+    demand = pd.DataFrame({"Fecha": fechas * 2, "Unidad": "UCI", "Turno": ["Mañana"] * 9 + ["Noche"] * 9,
+                           "Personal_Requerido": [2] * 8 + [3] + [1] * 9})
+    return staff, demand, staff_max_hours, {**staff_max_jornadas, "E1": 3}
+
+
+def test_asignar_turnos_resultado_de_referencia():
+    assignments, uncovered = asignar_turnos(*_caso_de_referencia())
+    assert assignments == [
+        {"Fecha": fecha, "Unidad": "UCI", "Turno": turno, "ID_Enfermera": id_, "Jornada": jornada, "Horas": horas}
+        for fecha, turno, id_, jornada, horas in ASIGNACIONES_DE_REFERENCIA
+    ]
+    assert uncovered == [{"Fecha": "2025-03-08", "Unidad": "UCI", "Turno": "Mañana", "Faltan": 1},
+                         {"Fecha": "2025-03-09", "Unidad": "UCI", "Turno": "Mañana", "Faltan": 1}]
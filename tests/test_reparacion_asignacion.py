@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from motor_asignacion import COLUMNAS_ASIGNACION, COLUMNAS_DIAGNOSTICO, Diagnostico, asignar_turnos
+from reparacion_asignacion import reparar_asignacion
+from utils.plantilla import preparar_plantilla
+
+
+def test_diagnostico_igual_que_el_voraz_sin_plan_aprobado():
+    n = 10
+    staff = pd.DataFrame({
+        "ID": [f"E{i}" for i in range(n)],
+        "Unidad_Asignada": ["UCI"] * n,
+        "Jornada": ["Completa", "Parcial"] * (n // 2),
+        "Turno_Contrato": ["Mañana"] * n,
+        "Fechas_No_Disponibilidad": [np.nan, "05/01/2025-20/01/2025"] + [np.nan] * (n - 2),
+    })
+    staff, staff_max_hours, _, _, _ = preparar_plantilla(staff)
+    staff_max_jornadas = {i: 30 for i in staff["ID"]}
+    demand = pd.DataFrame({"Fecha": pd.date_range("2025-01-01", periods=90).strftime("%Y-%m-%d"),
+                           "Unidad": "UCI", "Turno": "Mañana", "Personal_Requerido": 5})
+
+    # Sin nada aprobado, reparar es cubrir todos los huecos en orden: mismas asignaciones y mismos rechazos
+    voraz, reparacion = Diagnostico(), Diagnostico()
+    assignments, _ = asignar_turnos(staff, demand, staff_max_hours, staff_max_jornadas, diagnostico=voraz)
+    resultado, _, _ = reparar_asignacion(staff, demand, pd.DataFrame(columns=COLUMNAS_ASIGNACION),
+                                         staff_max_hours, staff_max_jornadas, diagnostico=reparacion)
+    assert len(resultado) == len(assignments)
+    esperado, obtenido = voraz.rechazos()[COLUMNAS_DIAGNOSTICO], reparacion.rechazos()[COLUMNAS_DIAGNOSTICO]
+    assert (esperado["Tope de jornadas"] > 0).any()
+    pd.testing.assert_frame_equal(obtenido.reset_index(drop=True), esperado.reset_index(drop=True))
+
+
+def test_solo_cubre_huecos_cerca_de_los_cambios():
+    staff = pd.DataFrame({
+        "ID": ["E1", "E2", "E3", "E4"],
+        "Unidad_Asignada": ["UCI"] * 4,
+        "Jornada": ["Completa"] * 4,
+        "Turno_Contrato": ["Mañana"] * 4,
+        "Fechas_No_Disponibilidad": [np.nan] * 4,
+    })
+    demand = pd.DataFrame({"Fecha": pd.date_range("2025-01-01", "2025-02-28").strftime("%Y-%m-%d"),
+                           "Unidad": "UCI", "Turno": "Mañana", "Personal_Requerido": 2})
+    plantilla, staff_max_hours, staff_max_jornadas, _, _ = preparar_plantilla(staff)
+    assignments, _ = asignar_turnos(plantilla, demand, staff_max_hours, staff_max_jornadas)
+    # Plan aprobado con un hueco el 15 de febrero; después, E1 causa baja el 5 de enero
+    previas = pd.DataFrame(assignments)
+    previas = previas.drop(previas.index[previas["Fecha"] == "2025-02-15"][:1])
+    plantilla, staff_max_hours, staff_max_jornadas, _, _ = preparar_plantilla(
+        staff.assign(Fechas_No_Disponibilidad=["05/01/2025", np.nan, np.nan, np.nan]))
+
+    resultado, uncovered, cambios = reparar_asignacion(plantilla, demand, previas, staff_max_hours,
+                                                       staff_max_jornadas)
+    nuevas = cambios.loc[cambios["Cambio"] == "Nueva", "Fecha"]
+    assert nuevas.tolist() == ["2025-01-05"]
+    assert [(u["Fecha"], u["Faltan"]) for u in uncovered] == [("2025-02-15", 1)]
+
+    resultado, uncovered, cambios = reparar_asignacion(plantilla, demand, previas, staff_max_hours,
+                                                       staff_max_jornadas, cubrir_todo=True)
+    assert sorted(cambios.loc[cambios["Cambio"] == "Nueva", "Fecha"]) == ["2025-01-05", "2025-02-15"]
+    assert uncovered == []
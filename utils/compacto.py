@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+
+def compactar(df):
+    """
+    Representación compacta de una tabla de la planificación para guardarla
+    en la sesión: `Fecha` pasa a `Dia` (int32, días desde 1970-01-01), los
+    textos a categóricas (códigos enteros) y los números al tipo más pequeño
+    que los representa sin pérdida. `expandir` hace la conversión inversa.
+    """
+    columnas = {}
+    for col in df.columns:
+        serie = df[col]
+        if col == "Fecha":
+            # Cada fecha distinta se convierte una sola vez
+            codigos, unicas = pd.factorize(serie.to_numpy())
+            dias = pd.to_datetime(unicas).to_numpy().astype("datetime64[D]").astype(np.int32)
+            columnas["Dia"] = dias[codigos]
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            columnas[col] = serie.values
+        elif pd.api.types.is_bool_dtype(serie):
+            columnas[col] = serie.to_numpy()
+        elif pd.api.types.is_integer_dtype(serie):
+            columnas[col] = pd.to_numeric(serie, downcast="integer").to_numpy()
+        elif pd.api.types.is_float_dtype(serie):
+            reducida = serie.astype(np.float32)
+            columnas[col] = (reducida if (reducida == serie).all() else serie).to_numpy()
+        else:
+            columnas[col] = pd.Categorical(serie.astype(object).where(serie.notna(), None))
+    return pd.DataFrame(columnas)
+
+
+def texto_fechas(dias, formato="%Y-%m-%d"):
+    """Días desde 1970-01-01 a texto; cada día distinto se formatea una sola vez."""
+    unicos, posicion = np.unique(np.asarray(dias), return_inverse=True)
+    textos = pd.DatetimeIndex(unicos.astype("datetime64[D]")).strftime(formato).to_numpy(dtype=object)
+    return textos[posicion]
+
+
+def expandir(df, formato_fecha="%Y-%m-%d"):
+    """Tabla legible a partir de `compactar`: `Dia` vuelve a ser `Fecha`, como texto en `formato_fecha`."""
+    if df is None or "Dia" not in df.columns:
+        return df
+    posicion = df.columns.get_loc("Dia")
+    fechas = texto_fechas(df["Dia"].to_numpy(), formato_fecha)
+    df = df.drop(columns="Dia")
+    df.insert(posicion, "Fecha", fechas)
+    return df
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+TURNOS = ["Mañana", "Tarde", "Noche"]
+
+
+def _tabla_semanal(plantilla, turnos):
+    """Plantilla de una unidad como array 7 × turnos (lunes = fila 0)."""
+    if isinstance(plantilla, dict):
+        # {día: {turno: personal}}, el formato que construyen los formularios
+        plantilla = pd.DataFrame(plantilla).T
+    tabla = pd.DataFrame(plantilla)
+    if not tabla.index.isin(DIAS_SEMANA).all():
+        tabla.index = [DIAS_SEMANA[int(d)] for d in tabla.index]
+    tabla = tabla.reindex(index=DIAS_SEMANA, columns=turnos)
+    return tabla.fillna(0).to_numpy(dtype=np.int64)
+
+
+def construir_demanda(plantillas, fecha_inicio, fecha_fin, turnos=TURNOS):
+    """
+    Demanda diaria de varias unidades a partir de una plantilla semanal por
+    unidad: `plantillas` es {unidad: tabla día de la semana × turno}, como
+    DataFrame (índice DIAS_SEMANA o 0-6, columnas de turno) o como
+    diccionario {día: {turno: personal}}.
+
+    Se construye sin bucles por fecha: la tabla de cada unidad se indexa con
+    el día de la semana de todo el rango de una vez. Devuelve Fecha como
+    texto 'YYYY-MM-DD' (no categórica: `pd.to_datetime` devuelve una
+    categórica para las Series categóricas largas), Unidad y Turno como
+    categóricas y Personal_Requerido como int32, ordenadas por fecha,
+    unidad y turno.
+    """
+    unidades = list(plantillas)
+    turnos = list(turnos)
+    fechas = pd.date_range(fecha_inicio, fecha_fin, freq="D")
+    semana = (np.stack([_tabla_semanal(plantillas[u], turnos) for u in unidades])
+              if unidades else np.zeros((0, 7, len(turnos)), dtype=np.int64))
+
+    # (unidades, 7, turnos) → (fechas, unidades, turnos)
+    requerido = semana[:, fechas.weekday, :].transpose(1, 0, 2)
+    n_fechas, n_unidades, n_turnos = requerido.shape
+    return pd.DataFrame({
+        "Fecha": np.repeat(fechas.strftime("%Y-%m-%d").to_numpy(dtype=object), n_unidades * n_turnos),
+        "Unidad": pd.Categorical.from_codes(np.tile(np.repeat(np.arange(n_unidades), n_turnos), n_fechas),
+                                            categories=unidades),
+        "Turno": pd.Categorical.from_codes(np.tile(np.arange(n_turnos), n_fechas * n_unidades),
+                                           categories=turnos),
+        "Personal_Requerido": requerido.ravel().astype(np.int32),
+    })
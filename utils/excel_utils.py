@@ -0,0 +1,105 @@
+import importlib.util
+import io
+
+import pandas as pd
+
+# Formatos de exportación: extensión y tipo MIME
+FORMATOS = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _disponible(modulo):
+    return importlib.util.find_spec(modulo) is not None
+
+
+def formatos_disponibles():
+    """Formatos que se pueden generar con las dependencias instaladas (Parquet necesita pyarrow)."""
+    return [f for f in FORMATOS if f != "Parquet" or _disponible("pyarrow")]
+
+
+def _filas(df):
+    # Valores nativos de Python y None para los huecos: es lo que esperan los escritores de xlsx
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def _hojas(datos, hoja):
+    return datos if isinstance(datos, dict) else {hoja: datos}
+
+
+def a_excel(datos, hoja="Hoja1"):
+    """
+    Libro xlsx en bytes a partir de un DataFrame o de un diccionario
+    {nombre de hoja: DataFrame} (un libro con varias hojas). Se escribe en
+    modo streaming, fila a fila y sin estilos: con xlsxwriter si está
+    instalado (constant_memory) y si no con openpyxl en modo write_only.
+    """
+    salida = io.BytesIO()
+    if _disponible("xlsxwriter"):
+        import xlsxwriter
+        libro = xlsxwriter.Workbook(salida, {"constant_memory": True, "in_memory": False})
+        for nombre, df in _hojas(datos, hoja).items():
+            ws = libro.add_worksheet(str(nombre)[:31])
+            ws.write_row(0, 0, [str(c) for c in df.columns])
+            for r, fila in enumerate(_filas(df), start=1):
+                ws.write_row(r, 0, fila)
+        libro.close()
+    else:
+        from openpyxl import Workbook
+        libro = Workbook(write_only=True)
+        for nombre, df in _hojas(datos, hoja).items():
+            ws = libro.create_sheet(str(nombre)[:31])
+            ws.append([str(c) for c in df.columns])
+            for fila in _filas(df):
+                ws.append(fila)
+        libro.save(salida)
+    return salida.getvalue()
+
+
+def a_csv(df):
+    # utf-8 con BOM para que Excel muestre bien las tildes
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def a_parquet(df):
+    if not _disponible("pyarrow"):
+        raise ImportError("La exportación a Parquet necesita el paquete 'pyarrow'.")
+    salida = io.BytesIO()
+    df.to_parquet(salida, index=False)
+    return salida.getvalue()
+
+
+def exportar(df, formato="Excel", hoja="Hoja1"):
+    """Bytes de `df` en `formato` (una clave de FORMATOS)."""
+    if formato == "Excel":
+        return a_excel(df, hoja=hoja)
+    if formato == "CSV":
+        return a_csv(df)
+    if formato == "Parquet":
+        return a_parquet(df)
+    raise ValueError(f"Formato de exportación no válido: {formato}")
+
+
+def nombre_archivo(base, formato):
+    return f"{base}.{FORMATOS[formato][0]}"
+
+
+def boton_descarga(label, generar, base, formato="Excel", hoja="Hoja1", **kwargs):
+    """
+    Botón de descarga que no genera el archivo hasta que se pulsa:
+    `generar` es una función sin argumentos que devuelve el DataFrame (o el
+    diccionario de hojas, solo en Excel) a exportar. Así los reruns de la
+    página no vuelven a construir archivos que nadie descarga. `generar` se
+    ejecuta fuera del hilo de la página: no debe leer `st.session_state`.
+    """
+    import streamlit as st
+    return st.download_button(
+        label,
+        data=lambda: exportar(generar(), formato, hoja=hoja),
+        file_name=nombre_archivo(base, formato),
+        mime=FORMATOS[formato][1],
+        on_click="ignore",
+        **kwargs,
+    )
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from datetime import date, datetime
+
+# Una fecha `dd/mm/AAAA` o `AAAA-mm-dd` (esta última admite la hora que añade
+# Excel, '2025-04-14 00:00:00'); un token es una fecha o un rango FECHA-FECHA.
+_FECHA = r"\d{1,2}/\d{1,2}/\d{4}|\d{4}-\d{1,2}-\d{1,2}(?: \d{1,2}:\d{2}(?::\d{2})?)?"
+_TOKEN = rf"^\s*(?P<inicio>{_FECHA})\s*(?:-\s*(?P<fin>{_FECHA}))?\s*$"
+
+MAX_EJEMPLOS_AVISO = 5
+
+
+def _a_fecha(textos):
+    """Convierte textos `dd/mm/AAAA` o `AAAA-mm-dd[ hh:mm[:ss]]` a datetime64 (NaT si no son válidos)."""
+    textos = textos.str.replace(r"\s.*$", "", regex=True)
+    europea = pd.to_datetime(textos, format="%d/%m/%Y", errors="coerce")
+    iso = pd.to_datetime(textos, format="%Y-%m-%d", errors="coerce")
+    return europea.fillna(iso)
+
+
+def _normalizar_celda(cell):
+    """Texto de una celda; las fechas de Excel y las listas ya parseadas se pasan a texto ISO."""
+    if isinstance(cell, (list, tuple, set)):
+        return ", ".join(str(x) for x in cell)
+    if isinstance(cell, (datetime, date, np.datetime64)):
+        return pd.Timestamp(cell).strftime("%Y-%m-%d")
+    try:
+        if pd.isna(cell):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    return str(cell).strip()
+
+
+def _aviso(mensaje, tokens, veces):
+    ejemplos = ", ".join(f"'{t}'" for t in tokens[:MAX_EJEMPLOS_AVISO])
+    resto = " …" if len(tokens) > MAX_EJEMPLOS_AVISO else ""
+    return f"{mensaje} en {int(veces)} entrada(s): {ejemplos}{resto}"
+
+
+def parse_dates_columna(serie):
+    """
+    Parsea de una vez toda la columna `Fechas_No_Disponibilidad`: fechas
+    individuales y rangos `dd/mm/AAAA-dd/mm/AAAA` (también `AAAA-mm-dd`)
+    separados por comas. Las celdas idénticas (p. ej. cierres de equipo) se
+    procesan una sola vez, las fechas se parsean vectorizadas y los rangos se
+    expanden con aritmética de arrays.
+
+    Devuelve (fechas, avisos): una Serie alineada con `serie` con la lista
+    ordenada de 'YYYY-MM-DD' de cada fila, y una lista de avisos agregados
+    (un mensaje por tipo de problema, con el número de entradas afectadas y
+    algunos ejemplos) en lugar de un aviso por token.
+    """
+    textos = serie.map(_normalizar_celda)
+    codigos, celdas = pd.factorize(textos, sort=False)
+    celdas = pd.Series(celdas, dtype="string")
+    usos = np.bincount(codigos, minlength=len(celdas)) if len(codigos) else np.zeros(0, dtype=np.int64)
+
+    # Tokenización: una fila por token con el número de celda única de origen
+    tokens = celdas.str.split(",").explode().astype("string").str.strip()
+    tokens = tokens[tokens.notna() & (tokens != "")]
+    celda_token = tokens.index.to_numpy()
+    tokens = tokens.reset_index(drop=True)
+
+    partes = tokens.str.extract(_TOKEN)
+    inicio = _a_fecha(partes["inicio"].fillna(""))
+    es_rango = partes["fin"].notna()
+    fin = _a_fecha(partes["fin"].fillna("")).where(es_rango, inicio)
+
+    sin_formato = partes["inicio"].isna()
+    no_valida = ~sin_formato & (inicio.isna() | fin.isna())
+    invertido = ~sin_formato & ~no_valida & (fin < inicio)
+    validos = ~(sin_formato | no_valida | invertido)
+
+    avisos = []
+    for mascara, mensaje in ((sin_formato, "Formato de fecha no reconocido"),
+                             (no_valida, "Fecha inexistente"),
+                             (invertido, "Rango inválido (inicio posterior al fin)")):
+        if mascara.any():
+            veces = usos[celda_token[mascara.to_numpy()]].sum()
+            avisos.append(_aviso(mensaje, tokens[mascara].drop_duplicates().tolist(), veces))
+
+    # Expansión de rangos: cada token aporta (fin - inicio + 1) días
+    dia_inicio = inicio[validos].to_numpy().astype("datetime64[D]").astype(np.int64)
+    dia_fin = fin[validos].to_numpy().astype("datetime64[D]").astype(np.int64)
+    longitudes = dia_fin - dia_inicio + 1
+    celda_dia = np.repeat(celda_token[validos.to_numpy()], longitudes)
+    desplazamiento = np.arange(longitudes.sum()) - np.repeat(np.cumsum(longitudes) - longitudes, longitudes)
+    dias = np.repeat(dia_inicio, longitudes) + desplazamiento
+
+    # Listas ordenadas y sin duplicados por celda única: una sola clave entera
+    # (celda, día) permite ordenar y deduplicar con np.unique
+    base = dias.min() if len(dias) else 0
+    ancho = int(dias.max() - base + 1) if len(dias) else 1
+    claves = np.sort(celda_dia * ancho + (dias - base))
+    claves = claves[np.r_[True, claves[1:] != claves[:-1]]] if len(claves) else claves
+    celda_dia, dias = np.divmod(claves, ancho)
+    texto_dias = (dias + base).astype("datetime64[D]").astype(str)
+    cortes = np.searchsorted(celda_dia, np.arange(len(celdas) + 1))
+    listas = [texto_dias[a:b].tolist() for a, b in zip(cortes[:-1], cortes[1:])]
+
+    return pd.Series([list(listas[c]) for c in codigos], index=serie.index, dtype=object), avisos
@@ -0,0 +1,62 @@
+import io
+
+# matplotlib se importa al dibujar: la página del Informe no lo paga si no hay datos
+
+def _png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def _figura(ancho, alto):
+    # API orientada a objetos, sin pyplot: no hay estado global entre hilos de Streamlit
+    from matplotlib.figure import Figure
+    return Figure(figsize=(ancho, alto))
+
+
+def grafico_horas_unidad_mes(df):
+    """PNG con las horas asignadas por mes de cada unidad (`df` de `consultar_unidad_mes`)."""
+    fig = _figura(10, 4)
+    ax = fig.add_subplot()
+    if df.empty:
+        ax.text(0.5, 0.5, "Sin datos para los filtros", ha="center", va="center")
+        ax.set_axis_off()
+        return _png(fig)
+    tabla = (df.assign(Periodo=df["Año"].astype(str) + "-" + df["Mes"].astype(int).map("{:02d}".format))
+             .pivot_table(index="Periodo", columns="Unidad", values="Horas", aggfunc="sum", fill_value=0)
+             .sort_index())
+    for unidad in tabla.columns:
+        ax.plot(tabla.index, tabla[unidad], marker="o", label=str(unidad))
+    ax.set_xlabel("Mes")
+    ax.set_ylabel("Horas asignadas")
+    ax.grid(axis="y", alpha=0.3)
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.legend(title="Unidad", fontsize="small", loc="upper left", bbox_to_anchor=(1, 1))
+    return _png(fig)
+
+
+def grafico_horas_restantes(df):
+    """
+    PNG con las horas anuales de cada profesional frente a su tope (`df` de
+    `consultar_topes`, ya ordenado y limitado), la más cercana arriba.
+    """
+    fig = _figura(10, max(2.5, 0.35 * len(df) + 1))
+    ax = fig.add_subplot()
+    if df.empty:
+        ax.text(0.5, 0.5, "Sin datos para los filtros", ha="center", va="center")
+        ax.set_axis_off()
+        return _png(fig)
+    df = df.iloc[::-1]
+    etiquetas = df["ID"].astype(str)
+    if df["Año"].nunique() > 1:
+        etiquetas = etiquetas + " (" + df["Año"].astype(str) + ")"
+    ax.barh(etiquetas, df["Horas_Maximas"], color="lightgray", label="Tope anual")
+    ax.barh(etiquetas, df["Horas"], color="tab:blue", label="Horas asignadas")
+    # Horas restantes al final de cada barra de tope
+    for y, (tope, restantes) in enumerate(zip(df["Horas_Maximas"], df["Horas_Restantes"])):
+        ax.annotate(f"{restantes:.0f} h", (tope, y), xytext=(3, 0), textcoords="offset points", va="center",
+                    fontsize="small")
+    ax.set_xlim(0, df["Horas_Maximas"].max() * 1.12)
+    ax.set_xlabel("Horas")
+    ax.legend(fontsize="small", loc="upper left", bbox_to_anchor=(1, 1))
+    return _png(fig)
@@ -0,0 +1,69 @@
+import io
+from pathlib import Path
+
+import pandas as pd
+
+from motor_asignacion import calcular_limites
+from utils.fechas import parse_dates_columna
+
+COLUMNAS_PLANTILLA = ["ID", "Unidad_Asignada", "Jornada", "Turno_Contrato", "Fechas_No_Disponibilidad"]
+COLUMNAS_DEMANDA = ["Fecha", "Unidad", "Turno", "Personal_Requerido"]
+TURNOS_VALIDOS = ["Mañana", "Tarde", "Noche"]
+
+# Lectores por extensión de archivo
+_LECTORES = {".xlsx": pd.read_excel, ".xls": pd.read_excel, ".csv": pd.read_csv, ".parquet": pd.read_parquet}
+
+
+def leer_tabla(origen, extension=None):
+    """
+    Tabla de entrada (plantilla o demanda) desde una ruta o desde bytes, en
+    Excel, CSV o Parquet según la extensión (la de la ruta si no se indica).
+    Los nombres de columna se limpian de espacios.
+    """
+    if isinstance(origen, (bytes, bytearray)):
+        origen = io.BytesIO(origen)
+    else:
+        extension = extension or Path(origen).suffix
+    lector = _LECTORES.get((extension or ".xlsx").lower())
+    if lector is None:
+        raise ValueError(f"Formato de archivo no admitido: {extension} (usa .xlsx, .csv o .parquet)")
+    tabla = lector(origen)
+    tabla.columns = tabla.columns.astype(str).str.strip()
+    return tabla
+
+
+def preparar_plantilla(staff):
+    """
+    Valida y normaliza la plantilla de personal, parsea las fechas de no
+    disponibilidad y calcula sus límites de horas y jornadas.
+    Devuelve (staff, staff_max_hours, staff_max_jornadas, avisos_carga,
+    avisos_limites); staff es None si faltan columnas. Los avisos de carga
+    son pares (tipo, mensaje) con tipo "error" o "warning".
+    """
+    avisos = []
+
+    # Validar columnas requeridas
+    if not all(col in staff.columns for col in COLUMNAS_PLANTILLA):
+        missing = [col for col in COLUMNAS_PLANTILLA if col not in staff.columns]
+        avisos.append(("error", f"Faltan columnas requeridas: {', '.join(missing)}"))
+        return None, None, None, avisos, []
+
+    # Limpieza y validación de datos
+    staff = staff.dropna(subset=["ID", "Turno_Contrato"])  # Eliminar filas sin ID o Turno
+    #Normalización de valores
+    staff["Turno_Contrato"] = staff["Turno_Contrato"].astype(str).str.strip().str.capitalize()
+    staff["Jornada"] = staff["Jornada"].astype(str).str.strip().str.capitalize()
+
+    # Validar valores aceptados
+    invalid_turnos = staff[~staff["Turno_Contrato"].isin(TURNOS_VALIDOS)]
+
+    if not invalid_turnos.empty:
+        avisos.append(("warning", f"Se encontraron turnos no válidos: {invalid_turnos['Turno_Contrato'].unique()}"))
+        staff = staff[staff["Turno_Contrato"].isin(TURNOS_VALIDOS)]  # Filtrar solo turnos válidos
+
+    # Procesar fechas
+    staff["Fechas_No_Disponibilidad"], avisos_fechas = parse_dates_columna(staff["Fechas_No_Disponibilidad"])
+    avisos += [("warning", aviso) for aviso in avisos_fechas]
+
+    staff_max_hours, staff_max_jornadas, avisos_limites = calcular_limites(staff)
+    return staff, staff_max_hours, staff_max_jornadas, avisos, avisos_limites
@@ -0,0 +1,36 @@
+import threading
+
+
+class Tarea:
+    """
+    Ejecuta `funcion(*args, avance=avance, **kwargs)` en un hilo aparte para
+    que la página siga respondiendo. Se guarda en `st.session_state` (una
+    tarea por sesión) y la página consulta `en_curso`, `avance`, `resultado`
+    y `error` en cada rerun. La función no debe usar `st.*`: devuelve lo que
+    la página tiene que guardar. `cancelar` pide la cancelación a través de
+    `avance`; la función la atiende en su siguiente aviso de progreso.
+    """
+
+    def __init__(self, funcion, avance, *args, **kwargs):
+        self.avance = avance
+        self.resultado = None
+        self.error = None
+        self._hilo = threading.Thread(target=self._ejecutar, args=(funcion, args, kwargs), daemon=True)
+        self._hilo.start()
+
+    def _ejecutar(self, funcion, args, kwargs):
+        try:
+            self.resultado = funcion(*args, avance=self.avance, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    @property
+    def en_curso(self):
+        return self._hilo.is_alive()
+
+    @property
+    def cancelada(self):
+        return not self.en_curso and self.avance.cancelada and self.resultado is None
+
+    def cancelar(self):
+        self.avance.cancelar()